@@ -1,17 +1,18 @@
 #!/usr/bin/env python3
 import os
 import aws_cdk as cdk
-from yaml import load, CLoader as Loader
-from cdklab.cdklab_stack import LabDeployStack
+from cdklab.app_config import load_config
+from cdklab.app_stacks import build_stacks
 
 
 app = cdk.App()
-app_config = load(open("config/config.yaml", 'r'), Loader=Loader)
-LabDeployStack(
+# a sizing profile can also be picked per deployment with -c profile=staging
+app_config = load_config("config/config.yaml", profile=app.node.try_get_context("profile"))
+account = app_config.raw['account']
+build_stacks(
     app,
-    "LabStack",
-    app_config,    
-    env=cdk.Environment(account=f"{app_config['account']['id']}", region=f"{app_config['account']['region']}")
+    app_config,
+    env=cdk.Environment(account=f"{account['id']}", region=f"{account['region']}")
 )
 
 app.synth()
@@ -0,0 +1,342 @@
+import copy
+from dataclasses import dataclass, field
+
+from yaml import load
+
+try:
+    # libyaml parser, several times faster on large configs
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+from cdklab.celery_pools import celery_pool_configs
+
+# fargate memory (MiB) options per cpu unit value
+FARGATE_MEMORY = {
+    256: (512, 1024, 2048),
+    512: tuple(range(1024, 4096 + 1, 1024)),
+    1024: tuple(range(2048, 8192 + 1, 1024)),
+    2048: tuple(range(4096, 16384 + 1, 1024)),
+    4096: tuple(range(8192, 30720 + 1, 1024)),
+    8192: tuple(range(16384, 61440 + 1, 4096)),
+    16384: tuple(range(32768, 122880 + 1, 8192)),
+}
+
+# aurora serverless v2 capacity range, in 0.5 ACU steps
+AURORA_MIN_ACU = 0
+AURORA_MAX_ACU = 256
+
+# kinesis data stream and firehose service limits
+KINESIS_MAX_SHARDS = 500
+KINESIS_RETENTION_HOURS = (24, 8760)
+KINESIS_MAX_PARALLELIZATION = 10
+FIREHOSE_PARQUET_BUFFER_MB = (64, 128)
+FIREHOSE_BUFFER_INTERVAL_SECONDS = (0, 900)
+LAMBDA_MEMORY_MB = (128, 10240)
+
+# the one place the capacity defaults live, the constructs read the resolved values
+DEFAULTS = {
+    "cdklab": {
+        "redis_instance_type": "cache.t4g.micro",
+        "redis_replicas": 0,
+        "database": {"db_min_acu": 0.5, "db_max_acu": 16},
+        "fastapi": {"cpu_limit": 512, "memory_limit": 1024},
+        "celery": {"cpu_limit": 512, "memory_limit": 1024},
+        "flower": {"cpu_limit": 512, "memory_limit": 1024},
+    },
+    "analytics": {
+        "kinesis_shard_count": 4,
+        "kinesis_retention_hours": 24,
+        "firehose_buffer_size_mb": 64,
+        "firehose_buffer_interval_seconds": 300,
+        "ingest": {"memory_size": 256, "partition_key": {"spread": 1}},
+        "stream_processing": {"memory_size": 256, "parallelization_factor": 1},
+    },
+}
+# filled into a service's or celery pool's scaling section when it has one
+SCALING_DEFAULTS = {"min_capacity": 1, "max_capacity": 1}
+
+# capacity set together for a deployment size, the config can't also set these keys
+SIZING_PROFILES = {
+    "dev": {
+        "cdklab": {
+            "redis_instance_type": "cache.t4g.micro",
+            "redis_replicas": 0,
+            "database": {"db_min_acu": 0.5, "db_max_acu": 2},
+            "fastapi": {"cpu_limit": 256, "memory_limit": 512},
+            "celery": {"cpu_limit": 256, "memory_limit": 512},
+            "flower": {"cpu_limit": 256, "memory_limit": 512},
+        },
+        "analytics": {
+            "kinesis_shard_count": 1,
+            "firehose_buffer_size_mb": 64,
+            "firehose_buffer_interval_seconds": 300,
+            "ingest": {"memory_size": 256},
+            "stream_processing": {"memory_size": 256, "parallelization_factor": 1},
+        },
+    },
+    "staging": {
+        "cdklab": {
+            "redis_instance_type": "cache.t4g.small",
+            "redis_replicas": 0,
+            "database": {"db_min_acu": 0.5, "db_max_acu": 8},
+            "fastapi": {"cpu_limit": 512, "memory_limit": 1024},
+            "celery": {"cpu_limit": 512, "memory_limit": 1024},
+            "flower": {"cpu_limit": 256, "memory_limit": 512},
+        },
+        "analytics": {
+            "kinesis_shard_count": 2,
+            "firehose_buffer_size_mb": 64,
+            "firehose_buffer_interval_seconds": 120,
+            "ingest": {"memory_size": 512},
+            "stream_processing": {"memory_size": 512, "parallelization_factor": 2},
+        },
+    },
+    "prod-high-throughput": {
+        "cdklab": {
+            "redis_instance_type": "cache.r7g.large",
+            "redis_replicas": 1,
+            "database": {"db_min_acu": 2, "db_max_acu": 64},
+            "fastapi": {"cpu_limit": 1024, "memory_limit": 2048, "scaling": {"min_capacity": 2, "max_capacity": 10}},
+            "celery": {"cpu_limit": 2048, "memory_limit": 4096, "scaling": {"min_capacity": 2, "max_capacity": 20}},
+            "flower": {"cpu_limit": 256, "memory_limit": 512},
+        },
+        "analytics": {
+            "kinesis_shard_count": 16,
+            "firehose_buffer_size_mb": 128,
+            "firehose_buffer_interval_seconds": 60,
+            "ingest": {"memory_size": 1024},
+            "stream_processing": {"memory_size": 1024, "parallelization_factor": 4},
+        },
+    },
+}
+
+ECS_SERVICES = ("fastapi", "celery", "flower")
+
+
+@dataclass(frozen=True)
+class FargateSize:
+    cpu: int
+    memory: int
+
+    @classmethod
+    def from_config(cls, service: dict) -> "FargateSize":
+        return cls(service['cpu_limit'], service['memory_limit'])
+
+    def errors(self, name: str) -> list:
+        if self.cpu not in FARGATE_MEMORY:
+            return [f"{name}: unsupported fargate cpu_limit {self.cpu}, use one of {sorted(FARGATE_MEMORY)}"]
+        if self.memory not in FARGATE_MEMORY[self.cpu]:
+            options = FARGATE_MEMORY[self.cpu]
+            allowed = list(options) if len(options) <= 3 else f"{options[0]}-{options[-1]} in steps of {options[1] - options[0]}"
+            return [f"{name}: memory_limit {self.memory} is not valid with cpu_limit {self.cpu}, use {allowed}"]
+        return []
+
+
+@dataclass(frozen=True)
+class TaskScaling:
+    min_capacity: int
+    max_capacity: int
+
+    @classmethod
+    def from_config(cls, scaling: dict) -> "TaskScaling":
+        return cls(scaling['min_capacity'], scaling['max_capacity'])
+
+    def errors(self, name: str) -> list:
+        errors = []
+        # scaling tracks cpu, a service at 0 tasks reports none and never scales out
+        if self.min_capacity < 1:
+            errors.append(f"{name}: scaling min_capacity {self.min_capacity} must be at least 1 with cpu scaling")
+        if self.min_capacity > self.max_capacity:
+            errors.append(f"{name}: scaling min_capacity {self.min_capacity} is above max_capacity {self.max_capacity}")
+        return errors
+
+
+@dataclass(frozen=True)
+class AuroraCapacity:
+    min_acu: float
+    max_acu: float
+
+    @classmethod
+    def from_config(cls, database: dict) -> "AuroraCapacity":
+        return cls(database['db_min_acu'], database['db_max_acu'])
+
+    def errors(self) -> list:
+        errors = []
+        for name, value in (("db_min_acu", self.min_acu), ("db_max_acu", self.max_acu)):
+            if not AURORA_MIN_ACU <= value <= AURORA_MAX_ACU or (value * 2) % 1:
+                errors.append(f"database: {name} {value} must be between {AURORA_MIN_ACU} and {AURORA_MAX_ACU} in steps of 0.5")
+        if self.min_acu > self.max_acu:
+            errors.append(f"database: db_min_acu {self.min_acu} is above db_max_acu {self.max_acu}")
+        if self.max_acu < 1:
+            errors.append(f"database: db_max_acu {self.max_acu} must be at least 1")
+        return errors
+
+
+@dataclass(frozen=True)
+class StreamCapacity:
+    shard_count: int
+    retention_hours: int
+    firehose_buffer_mb: int
+    firehose_interval_seconds: int
+    parallelization_factor: int
+    partition_key_spread: int
+
+    @classmethod
+    def from_config(cls, analytics: dict) -> "StreamCapacity":
+        return cls(
+            shard_count=analytics['kinesis_shard_count'],
+            retention_hours=analytics['kinesis_retention_hours'],
+            firehose_buffer_mb=analytics['firehose_buffer_size_mb'],
+            firehose_interval_seconds=analytics['firehose_buffer_interval_seconds'],
+            parallelization_factor=analytics['stream_processing']['parallelization_factor'],
+            partition_key_spread=analytics['ingest']['partition_key']['spread'],
+        )
+
+    def errors(self) -> list:
+        errors = []
+        if not 1 <= self.shard_count <= KINESIS_MAX_SHARDS:
+            errors.append(f"analytics: kinesis_shard_count {self.shard_count} must be between 1 and {KINESIS_MAX_SHARDS}")
+        if not KINESIS_RETENTION_HOURS[0] <= self.retention_hours <= KINESIS_RETENTION_HOURS[1]:
+            errors.append(f"analytics: kinesis_retention_hours {self.retention_hours} must be between {KINESIS_RETENTION_HOURS[0]} and {KINESIS_RETENTION_HOURS[1]}")
+        if not FIREHOSE_PARQUET_BUFFER_MB[0] <= self.firehose_buffer_mb <= FIREHOSE_PARQUET_BUFFER_MB[1]:
+            errors.append(f"analytics: firehose_buffer_size_mb {self.firehose_buffer_mb} must be between {FIREHOSE_PARQUET_BUFFER_MB[0]} and {FIREHOSE_PARQUET_BUFFER_MB[1]} with parquet conversion")
+        if not FIREHOSE_BUFFER_INTERVAL_SECONDS[0] <= self.firehose_interval_seconds <= FIREHOSE_BUFFER_INTERVAL_SECONDS[1]:
+            errors.append(f"analytics: firehose_buffer_interval_seconds {self.firehose_interval_seconds} must be between {FIREHOSE_BUFFER_INTERVAL_SECONDS[0]} and {FIREHOSE_BUFFER_INTERVAL_SECONDS[1]}")
+        if not 1 <= self.parallelization_factor <= KINESIS_MAX_PARALLELIZATION:
+            errors.append(f"stream_processing: parallelization_factor {self.parallelization_factor} must be between 1 and {KINESIS_MAX_PARALLELIZATION}")
+        if not 1 <= self.partition_key_spread <= self.shard_count:
+            errors.append(f"ingest: partition_key spread {self.partition_key_spread} must be between 1 and the {self.shard_count} shards")
+        return errors
+
+
+@dataclass(frozen=True)
+class AppConfig:
+    """Typed view of the capacity settings, validated as a whole."""
+    profile: str
+    services: dict
+    scaling: dict
+    aurora: AuroraCapacity
+    stream: StreamCapacity
+    lambda_memory: dict
+    redis_node_type: str
+    redis_replicas: int
+    raw: dict = field(repr=False, compare=False)
+
+    @classmethod
+    def from_dict(cls, raw: dict) -> "AppConfig":
+        raw = with_defaults(raw)
+        cdklab = raw['cdklab']
+        analytics = raw['analytics']
+
+        # every celery pool is its own fargate service
+        services, scaling = {}, {}
+        for name in ECS_SERVICES:
+            configs = celery_pool_configs(cdklab[name]) if name == 'celery' else {name: cdklab[name]}
+            for service_id, service in configs.items():
+                services[service_id] = FargateSize.from_config(service)
+                if service.get('scaling'):
+                    scaling[service_id] = TaskScaling.from_config(service['scaling'])
+
+        return cls(
+            profile=raw.get('profile'),
+            services=services,
+            scaling=scaling,
+            aurora=AuroraCapacity.from_config(cdklab['database']),
+            stream=StreamCapacity.from_config(analytics),
+            lambda_memory={
+                "ingest": analytics['ingest']['memory_size'],
+                "stream_processing": analytics['stream_processing']['memory_size'],
+            },
+            redis_node_type=cdklab['redis_instance_type'],
+            redis_replicas=cdklab['redis_replicas'],
+            raw=raw,
+        )
+
+    def errors(self) -> list:
+        errors = []
+        for name, size in self.services.items():
+            errors += size.errors(name)
+        for name, bounds in self.scaling.items():
+            errors += bounds.errors(name)
+        errors += self.aurora.errors()
+        errors += self.stream.errors()
+        for name, memory in self.lambda_memory.items():
+            if not LAMBDA_MEMORY_MB[0] <= memory <= LAMBDA_MEMORY_MB[1]:
+                errors.append(f"{name}: memory_size {memory} must be between {LAMBDA_MEMORY_MB[0]} and {LAMBDA_MEMORY_MB[1]}")
+        if not self.redis_node_type.startswith("cache."):
+            errors.append(f"cdklab: redis_instance_type '{self.redis_node_type}' is not a cache node type")
+        if not 0 <= self.redis_replicas <= 5:
+            errors.append(f"cdklab: redis_replicas {self.redis_replicas} must be between 0 and 5")
+        return errors
+
+    def validate(self) -> "AppConfig":
+        # report every problem at once rather than one per synth
+        errors = self.errors()
+        if errors:
+            raise ValueError("invalid config:\n  " + "\n  ".join(errors))
+        return self
+
+
+def merge_defaults(defaults: dict, config: dict) -> dict:
+    """Deep merge where the values in config win."""
+    merged = copy.deepcopy(defaults)
+    for key, value in config.items():
+        # an empty yaml section keeps its defaults
+        if value is None and isinstance(merged.get(key), dict):
+            continue
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_defaults(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def with_defaults(raw: dict) -> dict:
+    """The config with every default filled in, what the constructs are built from."""
+    resolved = merge_defaults(DEFAULTS, raw)
+    cdklab = resolved['cdklab']
+    for service in [cdklab[name] for name in ECS_SERVICES] + list(cdklab['celery'].get('pools') or []):
+        if service.get('scaling'):
+            service['scaling'] = merge_defaults(SCALING_DEFAULTS, service['scaling'])
+    return resolved
+
+
+def overlapping_keys(profile: dict, config: dict, path: str = "") -> list:
+    """Dotted paths of the settings both the profile and the config set."""
+    overlap = []
+    for key, value in profile.items():
+        if config.get(key) is None:
+            continue
+        if isinstance(value, dict) and isinstance(config[key], dict):
+            overlap += overlapping_keys(value, config[key], f"{path}{key}.")
+        else:
+            overlap.append(f"{path}{key}")
+    return overlap
+
+
+def apply_profile(raw: dict, profile: str = None) -> dict:
+    """Fill in the capacity of a sizing profile, given explicitly or as `profile` in the config.
+
+    A profile owns its capacity settings, the config setting any of them as well is an
+    error rather than one of them being silently ignored.
+    """
+    profile = profile or raw.get('profile')
+    if not profile:
+        return raw
+    if profile not in SIZING_PROFILES:
+        raise ValueError(f"unsupported sizing profile '{profile}', use one of {sorted(SIZING_PROFILES)}")
+    overlap = overlapping_keys(SIZING_PROFILES[profile], raw)
+    if overlap:
+        raise ValueError(f"sizing profile '{profile}' sets {', '.join(overlap)}, remove them from the config or drop the profile")
+    return merge_defaults(SIZING_PROFILES[profile], raw) | {'profile': profile}
+
+
+def load_config(path: str, profile: str = None) -> AppConfig:
+    """Read, size and validate the app config, without any AWS calls.
+
+    `raw` of the result has the defaults filled in, so it is exactly what was validated.
+    """
+    with open(path, 'r') as config_file:
+        raw = load(config_file, Loader=SafeLoader)
+    return AppConfig.from_dict(apply_profile(raw, profile)).validate()
@@ -0,0 +1,86 @@
+import aws_cdk as cdk
+from constructs import Construct
+from cdklab.app_config import AppConfig
+from cdklab.cdklab_stack import LabDeployStack
+from cdklab.event_stack import AnalyticsDeployStack
+from cdklab.monitoring_stack import MonitoringStack
+from cdklab.network_stack import NetworkStack
+from cdklab.stream_processing_stack import StreamProcessingStack
+
+
+def build_stacks(scope: Construct, app_config, env: cdk.Environment = None) -> dict:
+    """Create the network, lab and analytics stacks.
+
+    The lab and analytics stacks only depend on the network stack, so
+    `cdk deploy --all --concurrency N` can roll them out in parallel. The
+    monitoring stack is added when the config has a `monitoring` section and
+    the stream processing stack when `analytics.stream_processing` is enabled.
+    `app_config` is a raw config dict or a loaded `AppConfig`. It is validated
+    here, the stacks get the typed capacity and the config with its defaults
+    filled in.
+    """
+    capacity = app_config if isinstance(app_config, AppConfig) else AppConfig.from_dict(app_config)
+    capacity.validate()
+    app_config = capacity.raw
+    network = NetworkStack(
+        scope,
+        "NetworkStack",
+        app_config,
+        env=env
+    )
+
+    lab = LabDeployStack(
+        scope,
+        "LabStack",
+        app_config,
+        network.vpc,
+        capacity=capacity,
+        env=env
+    )
+    lab.add_stack_dependency(network)
+
+    analytics = AnalyticsDeployStack(
+        scope,
+        "AnalyticsStack",
+        network.vpc,
+        app_config,
+        capacity=capacity,
+        env=env
+    )
+    analytics.add_stack_dependency(network)
+
+    stacks = {
+        "network": network,
+        "lab": lab,
+        "analytics": analytics,
+    }
+
+    if app_config.get('monitoring'):
+        monitoring = MonitoringStack(
+            scope,
+            "MonitoringStack",
+            app_config,
+            lab,
+            analytics,
+            env=env
+        )
+        monitoring.add_stack_dependency(lab)
+        monitoring.add_stack_dependency(analytics)
+        stacks["monitoring"] = monitoring
+
+    if (app_config['analytics'].get('stream_processing') or {}).get('enabled'):
+        stream_processing = StreamProcessingStack(
+            scope,
+            "StreamProcessingStack",
+            app_config,
+            network.vpc,
+            lab,
+            analytics,
+            capacity=capacity,
+            env=env
+        )
+        stream_processing.add_stack_dependency(lab)
+        stream_processing.add_stack_dependency(analytics)
+        stacks["stream_processing"] = stream_processing
+
+    return stacks
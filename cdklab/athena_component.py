@@ -0,0 +1,190 @@
+import json
+
+import aws_cdk as cdk
+import aws_cdk.aws_athena as athena
+import aws_cdk.aws_events as events
+import aws_cdk.aws_events_targets as targets
+import aws_cdk.aws_glue as glue
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_lambda as lmb
+import aws_cdk.aws_logs as logs
+import aws_cdk.aws_s3 as s3
+import constructs
+
+from cdklab.rollup_sql import rollup_columns, rollup_insert_sql
+
+DEFAULT_ROLLUPS = [
+    {"name": "app_events_hourly", "dimensions": ["app_id", "event_type", "device.os"]},
+]
+
+
+class AthenaComponent(constructs.Construct):
+    """Athena workgroup for the event lake and the hourly rollup tables dashboards read."""
+
+    def __init__(
+            self,
+            scope: constructs.Construct,
+            construct_id: str,
+            *,
+            config: dict,
+            bucket: s3.IBucket,
+            database: glue.CfnDatabase,
+            table_name: str,
+            columns: list,
+            **kwargs
+    ):
+        super().__init__(scope, construct_id)
+
+        stack = cdk.Stack.of(self)
+        database_name = database.database_input.name
+
+        # athena reuses a result for at most a week, 0 runs every dashboard query
+        result_reuse_max_age = config.get('result_reuse_max_age_minutes', 60)
+        if not 0 <= result_reuse_max_age <= 10080:
+            raise ValueError(f"athena result_reuse_max_age_minutes {result_reuse_max_age} must be between 0 and 10080")
+
+        results_prefix = config.get('results_prefix', 'athena-results')
+        bucket.add_lifecycle_rule(
+            id='athena-results',
+            prefix=f"{results_prefix}/",
+            expiration=cdk.Duration.days(config.get('results_retention_days', 7)),
+        )
+
+        # the workgroup settings override the client's, queries can't skip the scan limit or encryption
+        self.workgroup = athena.CfnWorkGroup(
+            self,
+            'workgroup',
+            name=f"{stack.stack_name}-analytics",
+            recursive_delete_option=True,
+            work_group_configuration=athena.CfnWorkGroup.WorkGroupConfigurationProperty(
+                bytes_scanned_cutoff_per_query=config.get('bytes_scanned_cutoff_mb', 10240) * 1024 * 1024,
+                enforce_work_group_configuration=True,
+                publish_cloud_watch_metrics_enabled=True,
+                # result reuse is requested per query and needs engine v3
+                engine_version=athena.CfnWorkGroup.EngineVersionProperty(
+                    selected_engine_version="Athena engine version 3",
+                ),
+                result_configuration=athena.CfnWorkGroup.ResultConfigurationProperty(
+                    output_location=f"s3://{bucket.bucket_name}/{results_prefix}/",
+                    encryption_configuration=athena.CfnWorkGroup.EncryptionConfigurationProperty(
+                        encryption_option="SSE_S3",
+                    ),
+                ),
+            ),
+        )
+
+        # one partitioned parquet table per rollup, filled an hour at a time
+        rollups_prefix = config.get('rollups_prefix', 'rollups')
+        source_columns = dict(columns)
+        self.rollup_tables = {}
+        queries = {}
+        for rollup in config.get('rollups') or DEFAULT_ROLLUPS:
+            name = rollup['name']
+            table = glue.CfnTable(
+                self,
+                f'{name}-table',
+                catalog_id=stack.account,
+                database_name=database_name,
+                table_input=glue.CfnTable.TableInputProperty(
+                    name=name,
+                    table_type="EXTERNAL_TABLE",
+                    parameters={"classification": "parquet", "parquet.compression": "SNAPPY"},
+                    partition_keys=[glue.CfnTable.ColumnProperty(name="dt", type="string")],
+                    storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
+                        columns=[
+                            glue.CfnTable.ColumnProperty(name=column_name, type=column_type)
+                            for column_name, column_type in rollup_columns(source_columns, rollup['dimensions'])
+                        ],
+                        location=f"s3://{bucket.bucket_name}/{rollups_prefix}/{name}/",
+                        input_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
+                        output_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
+                        serde_info=glue.CfnTable.SerdeInfoProperty(
+                            serialization_library="org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe",
+                        ),
+                    ),
+                ),
+            )
+            table.add_resource_dependency(database)
+            self.rollup_tables[name] = table
+
+            queries[name] = rollup_insert_sql(database_name, table_name, name, source_columns, rollup['dimensions'])
+            athena.CfnNamedQuery(
+                self,
+                f'{name}-query',
+                name=f"{name} rollup",
+                description=f"hourly rollup of {table_name} into {name}, fill in dt",
+                database=database_name,
+                query_string=queries[name],
+                work_group=self.workgroup.ref,
+            )
+
+        self.role = iam.Role(
+            self,
+            'role',
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole"),
+            ],
+            inline_policies={
+                "athena": iam.PolicyDocument(
+                    statements=[
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=["athena:StartQueryExecution", "athena:GetQueryExecution"],
+                            resources=[f"arn:aws:athena:{stack.region}:{stack.account}:workgroup/{self.workgroup.ref}"],
+                        ),
+                        # athena runs the insert with the caller's catalog permissions
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            actions=[
+                                "glue:GetDatabase",
+                                "glue:GetTable",
+                                "glue:GetPartition",
+                                "glue:GetPartitions",
+                                "glue:BatchCreatePartition",
+                                "glue:CreatePartition",
+                            ],
+                            resources=[
+                                f"arn:aws:glue:{stack.region}:{stack.account}:catalog",
+                                f"arn:aws:glue:{stack.region}:{stack.account}:database/{database_name}",
+                                f"arn:aws:glue:{stack.region}:{stack.account}:table/{database_name}/*",
+                            ],
+                        ),
+                    ]
+                ),
+            },
+        )
+        bucket.grant_read_write(self.role)
+
+        self.function = lmb.Function(
+            self,
+            'fn',
+            function_name=f"{stack.stack_name}-rollup",
+            code=lmb.Code.from_asset(path='./lambda', exclude=["__pycache__"]),
+            runtime=lmb.Runtime('python3.11'),
+            handler="athena_rollup.handler",
+            role=self.role,
+            timeout=cdk.Duration.seconds(60),
+            log_group=logs.LogGroup(
+                self,
+                "log_group",
+                log_group_name=f"{stack.stack_name}-rollup",
+                retention=logs.RetentionDays.ONE_MONTH,
+                removal_policy=cdk.RemovalPolicy.DESTROY,
+            ),
+            environment={
+                "ROLLUP_QUERIES": json.dumps(queries),
+                "DATABASE": database_name,
+                "WORKGROUP": self.workgroup.ref,
+                "LOOKBACK_HOURS": str(config.get('lookback_hours', 3)),
+                "MIN_AGE_HOURS": str(config.get('min_age_hours', 1)),
+                "RESULT_REUSE_MAX_AGE_MINUTES": str(result_reuse_max_age),
+            },
+        )
+
+        self.schedule = events.Rule(
+            self,
+            'schedule',
+            schedule=events.Schedule.expression(config.get('rollup_schedule', 'cron(30 * * * ? *)')),
+            targets=[targets.LambdaFunction(self.function)],
+        )
@@ -13,39 +13,20 @@ from aws_cdk import (
 )
 import aws_cdk
 from constructs import Construct
+from cdklab.app_config import AppConfig
+from cdklab.cdn_component import CdnComponent
+from cdklab.celery_pools import celery_pool_configs
 from cdklab.ecs_component import EcsComponents
 from cdklab.rds_component import RDSComponent
 
 class LabDeployStack(Stack):
 
-    def __init__(self, scope: Construct, construct_id: str, app_config: dict, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, app_config: dict, vpc: ec2.IVpc, *, capacity: AppConfig, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
         
         # stack
         stack = aws_cdk.Stack.of(self)
         
-        # vpc = ec2.Vpc(self, "labvpc", max_azs=3)     # default is all AZs in region
-        vpc = ec2.Vpc(self, "labvpc",
-            max_azs=2,  # Multi-AZ for high availability
-            subnet_configuration=[
-                ec2.SubnetConfiguration(
-                    name="Public",
-                    subnet_type=ec2.SubnetType.PUBLIC,
-                    cidr_mask=24
-                ),
-                ec2.SubnetConfiguration(
-                    name="Private",
-                    subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS, # Private subnets with NAT for outbound internet
-                    cidr_mask=24
-                ),
-                ec2.SubnetConfiguration(
-                    name="Isolated",
-                    subnet_type=ec2.SubnetType.PRIVATE_ISOLATED, # Isolated subnets for RDS (no internet access)
-                    cidr_mask=24
-                )
-            ]
-        )
-
         # # domain name
         # domain_name = f'{config.get("cdklab").get("hostname")}.{config.get("dns").get("hostname_suffix", "")}.{hosted_zone.zone_name}'
 
@@ -66,12 +47,14 @@ class LabDeployStack(Stack):
             description="cdklab message queue"
         )
 
+        # read replicas in other AZs, the primary fails over to one of them
+        redis_replicas = capacity.redis_replicas
         self.redis = el.CfnReplicationGroup(
             self,
             'cdklab-redis',
             replication_group_id=f"{stack.stack_name}-redis",
             replication_group_description="cdklab redis",
-            cache_node_type=app_config['cdklab'].get('redis_instance_type', 'cache.t4g.micro'),
+            cache_node_type=capacity.redis_node_type,
             cache_parameter_group_name="default.redis7",
             engine="redis",
             engine_version="7.0",
@@ -80,8 +63,9 @@ class LabDeployStack(Stack):
             transit_encryption_enabled=True,
             transit_encryption_mode="required",
             cluster_mode="disabled",
-            num_cache_clusters=1,
-            automatic_failover_enabled=False,
+            num_cache_clusters=1 + redis_replicas,
+            automatic_failover_enabled=redis_replicas > 0,
+            multi_az_enabled=True if redis_replicas > 0 else None,
             auto_minor_version_upgrade=False,
         )
 
@@ -120,6 +104,7 @@ class LabDeployStack(Stack):
             self,
             "database",
             config=app_config["cdklab"]["database"],
+            capacity=capacity.aurora,
             vpc=vpc,
             ecs_task_role=self.ecs_task_role
         )
@@ -140,6 +125,10 @@ class LabDeployStack(Stack):
         common_env_map["CELERY_BROKER_URL"] = f"rediss://{self.redis.attr_primary_end_point_address}:{self.redis.attr_primary_end_point_port}/0?ssl_cert_reqs=required"
         common_env_map["CELERY_RESULT_BACKEND"] = common_env_map["CELERY_BROKER_URL"]
 
+        # opt-in distributed tracing for the api and workers
+        tracing = app_config.get('tracing') or {}
+        tracing = tracing if tracing.get('enabled') else None
+
         # lab repos
         image_repo = ecr.Repository.from_repository_arn(self, 'ecr', app_config['cdklab']['ecr'])
 
@@ -157,6 +146,8 @@ class LabDeployStack(Stack):
         self.fastapi = EcsComponents(self,
             "fastapi",
             config=app_config["cdklab"]["fastapi"],
+            size=capacity.services["fastapi"],
+            scaling=capacity.scaling.get("fastapi"),
             image_repo=image_repo,
             vpc=vpc,
             ecs_task_role=self.ecs_task_role,
@@ -168,27 +159,36 @@ class LabDeployStack(Stack):
             secrets_map=common_secret_map | self.postgres.secret_map,
             env_map=common_env_map | self.postgres.plaintext_env_map,
             redis_security_group=self.redis_security_group,
+            tracing=tracing,
         )
 
-        # celery worker
-        self.celery_task = EcsComponents(self,
-            "celery",
-            config=app_config["cdklab"]["celery"],
-            image_repo=image_repo,
-            vpc=vpc,
-            ecs_task_role=self.ecs_task_role,
-            database=self.postgres.database,
-            cluster=self.cluster,
-            alb=False,
-            secrets_map=common_secret_map | self.postgres.secret_map,
-            env_map=common_env_map | self.postgres.plaintext_env_map,
-            redis_security_group=self.redis_security_group,
-        )
+        # celery workers, one service per pool so queues can be sized apart
+        self.celery_pools = {}
+        for pool_id, pool_config in celery_pool_configs(app_config["cdklab"]["celery"]).items():
+            self.celery_pools[pool_id] = EcsComponents(self,
+                pool_id,
+                config=pool_config,
+                size=capacity.services[pool_id],
+                scaling=capacity.scaling.get(pool_id),
+                image_repo=image_repo,
+                vpc=vpc,
+                ecs_task_role=self.ecs_task_role,
+                database=self.postgres.database,
+                cluster=self.cluster,
+                alb=False,
+                secrets_map=common_secret_map | self.postgres.secret_map,
+                env_map=common_env_map | self.postgres.plaintext_env_map,
+                redis_security_group=self.redis_security_group,
+                tracing=tracing,
+            )
+        self.celery_task = next(iter(self.celery_pools.values()))
 
         # flower
         self.flower = EcsComponents(self,
             "flower",
             config=app_config["cdklab"]["flower"],
+            size=capacity.services["flower"],
+            scaling=capacity.scaling.get("flower"),
             image_repo=image_repo,
             vpc=vpc,
             ecs_task_role=self.ecs_task_role,
@@ -225,12 +225,57 @@ class LabDeployStack(Stack):
         #     certificates=[self.cert],
         #     default_target_groups=[self.flower.target_group]
         # )
-        self.lb_listner = self.lb.add_listener(
-            "listner",
-            protocol=elb.ApplicationProtocol.HTTP,
-            open=True,
-            default_target_groups=[self.flower.target_group]
+        # optional CloudFront edge caching, the ALB then only accepts CloudFront's origin facing addresses
+        cloudfront_config = app_config['cdklab'].get('cloudfront') or {}
+        cloudfront_enabled = cloudfront_config.get('enabled', False)
+        # https to the origin needs a certificate for a domain name resolving to the ALB
+        origin_certificate_arn = cloudfront_config.get('origin_certificate_arn') if cloudfront_enabled else None
+        origin_domain_name = cloudfront_config.get('origin_domain_name')
+        if origin_certificate_arn and not origin_domain_name:
+            raise ValueError("cloudfront origin_certificate_arn needs the origin_domain_name it covers")
+
+        # the origin verify header tells our distribution apart from other CloudFront traffic,
+        # it is only sent over https. the template holds a dynamic reference, not the secret.
+        origin_verify_header = origin_verify_value = None
+        origin_verify_conditions = []
+        if origin_certificate_arn:
+            self.origin_verify_secret = asm.Secret(
+                self,
+                'origin-verify',
+                generate_secret_string=asm.SecretStringGenerator(exclude_punctuation=True, password_length=32)
+            )
+            origin_verify_header = cloudfront_config.get('origin_verify_header', 'X-Origin-Verify')
+            origin_verify_value = self.origin_verify_secret.secret_value.unsafe_unwrap()
+            origin_verify_conditions = [elb.ListenerCondition.http_header(origin_verify_header, [origin_verify_value])]
+
+        listener_settings = dict(
+            protocol=elb.ApplicationProtocol.HTTPS if origin_certificate_arn else elb.ApplicationProtocol.HTTP,
+            certificates=[elb.ListenerCertificate.from_arn(origin_certificate_arn)] if origin_certificate_arn else None,
+            # behind CloudFront the CdnComponent opens the listener to its origin facing prefix list only
+            open=not cloudfront_enabled,
         )
+        if origin_verify_conditions:
+            self.lb_listner = self.lb.add_listener(
+                "listner",
+                default_action=elb.ListenerAction.fixed_response(403, content_type="text/plain", message_body="Forbidden"),
+                **listener_settings
+            )
+
+            # flower behind the origin verify header
+            self.lb_listner.add_action(
+                "flower_action",
+                priority=20,
+                conditions=origin_verify_conditions,
+                action=elb.ListenerAction.forward(
+                    target_groups=[self.flower.target_group]
+                )
+            )
+        else:
+            self.lb_listner = self.lb.add_listener(
+                "listner",
+                default_target_groups=[self.flower.target_group],
+                **listener_settings
+            )
 
         # add service path pattern action rule
         self.lb_listner.add_action(
@@ -238,12 +283,31 @@ class LabDeployStack(Stack):
             priority=10,
             conditions=[
                 elb.ListenerCondition.path_patterns(app_config["cdklab"]["fastapi"]["path_patterns"])
-            ],
+            ] + origin_verify_conditions,
             action=elb.ListenerAction.forward(
                 target_groups=[self.fastapi.target_group]
             )
         )
 
+        if cloudfront_enabled:
+            self.cdn = CdnComponent(
+                self,
+                "cdn",
+                config=cloudfront_config,
+                load_balancer=self.lb,
+                listener=self.lb_listner,
+                path_patterns=app_config["cdklab"]["fastapi"]["path_patterns"],
+                origin_domain_name=origin_domain_name if origin_certificate_arn else None,
+                origin_verify_header=origin_verify_header,
+                origin_verify_value=origin_verify_value,
+            )
+
+            CfnOutput(
+                self, "DistributionDomain",
+                value=self.cdn.distribution.distribution_domain_name,
+                description="The CloudFront domain in front of the load balancer"
+            )
+
         # # add CNAME entry to route53
         # self.dns_entry = route53.ARecord(
         #     self,
@@ -255,7 +319,7 @@ class LabDeployStack(Stack):
 
         CfnOutput(
             self, "LoadBalancerDNS",
-            value=self.lb.load_balancer.load_balancer_dns_name,
+            value=self.lb.load_balancer_dns_name,
             description="The DNS name of the load balancer"
         )
 
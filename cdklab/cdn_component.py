@@ -0,0 +1,143 @@
+import aws_cdk as cdk
+import aws_cdk.aws_cloudfront as cloudfront
+import aws_cdk.aws_cloudfront_origins as origins
+import aws_cdk.aws_ec2 as ec2
+import aws_cdk.aws_elasticloadbalancingv2 as elb
+import aws_cdk.custom_resources as cr
+import constructs
+
+# aws managed prefix list of the addresses CloudFront connects to origins from
+ORIGIN_FACING_PREFIX_LIST = "com.amazonaws.global.cloudfront.origin-facing"
+
+
+class CdnComponent(constructs.Construct):
+    """CloudFront distribution with the application load balancer as origin.
+
+    Each FastAPI path pattern gets its own cache behavior so idempotent GETs
+    are served from the edge, everything else falls through to the ALB
+    uncached. The ALB listener only accepts CloudFront's origin facing
+    addresses. With an origin domain name the origin is reached over https and
+    the origin verify header lets the ALB reject other distributions.
+    """
+
+    def __init__(
+            self,
+            scope: constructs.Construct,
+            construct_id: str,
+            *,
+            config: dict,
+            load_balancer: elb.ApplicationLoadBalancer,
+            listener: elb.ApplicationListener,
+            path_patterns: list,
+            origin_domain_name: str = None,
+            origin_verify_header: str = None,
+            origin_verify_value: str = None,
+            **kwargs
+    ):
+        super().__init__(scope, construct_id)
+
+        stack = cdk.Stack.of(self)
+
+        # the listener is not open to the internet, only CloudFront reaches it
+        prefix_list_id = config.get('origin_prefix_list_id') or self.origin_facing_prefix_list()
+        listener.connections.allow_default_port_from(
+            ec2.Peer.prefix_list(prefix_list_id),
+            "CloudFront origin facing addresses",
+        )
+
+        origin_settings = dict(
+            keepalive_timeout=cdk.Duration.seconds(config.get('keepalive_seconds', 60)),
+            read_timeout=cdk.Duration.seconds(config.get('read_timeout_seconds', 30)),
+            origin_shield_enabled=bool(config.get('origin_shield_region')),
+            origin_shield_region=config.get('origin_shield_region'),
+            custom_headers={origin_verify_header: origin_verify_value} if origin_verify_header else None,
+        )
+        if origin_domain_name:
+            # CloudFront checks the ALB certificate against the origin domain name
+            self.origin = origins.HttpOrigin(
+                origin_domain_name,
+                protocol_policy=cloudfront.OriginProtocolPolicy.HTTPS_ONLY,
+                origin_ssl_protocols=[cloudfront.OriginSslPolicy.TLS_V1_2],
+                **origin_settings
+            )
+        else:
+            self.origin = origins.LoadBalancerV2Origin(
+                load_balancer,
+                protocol_policy=cloudfront.OriginProtocolPolicy.HTTP_ONLY,
+                **origin_settings
+            )
+
+        # cache per api path, ttls can be overridden per pattern. Authorization is part of
+        # the key so one user's response isn't served to another, unless the pattern is public
+        path_ttls = config.get('path_ttls') or {}
+        additional_behaviors = {}
+        for index, path_pattern in enumerate(path_patterns):
+            ttl = (config.get('cache') or {}) | (path_ttls.get(path_pattern) or {})
+            cache_headers = list(ttl.get('cache_headers') or [])
+            if not ttl.get('public') and 'Authorization' not in cache_headers:
+                cache_headers.insert(0, 'Authorization')
+            cache_policy = cloudfront.CachePolicy(
+                self,
+                f'api-cache-{index}',
+                comment=f"{stack.stack_name} {path_pattern}",
+                default_ttl=cdk.Duration.seconds(ttl.get('default_ttl_seconds', 0)),
+                min_ttl=cdk.Duration.seconds(ttl.get('min_ttl_seconds', 0)),
+                max_ttl=cdk.Duration.seconds(ttl.get('max_ttl_seconds', 300)),
+                query_string_behavior=cloudfront.CacheQueryStringBehavior.all(),
+                header_behavior=cloudfront.CacheHeaderBehavior.allow_list(*cache_headers) if cache_headers else cloudfront.CacheHeaderBehavior.none(),
+                cookie_behavior=cloudfront.CacheCookieBehavior.none(),
+                enable_accept_encoding_brotli=True,
+                enable_accept_encoding_gzip=True,
+            )
+            additional_behaviors[path_pattern] = cloudfront.BehaviorOptions(
+                origin=self.origin,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_ALL,
+                cached_methods=cloudfront.CachedMethods.CACHE_GET_HEAD_OPTIONS,
+                cache_policy=cache_policy,
+                origin_request_policy=cloudfront.OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER,
+                compress=True,
+            )
+
+        # static assets, e.g. flower's, are immutable between deployments
+        for path_pattern in config.get('static_path_patterns', ['/static/*']):
+            additional_behaviors[path_pattern] = cloudfront.BehaviorOptions(
+                origin=self.origin,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                cache_policy=cloudfront.CachePolicy.CACHING_OPTIMIZED,
+                compress=True,
+            )
+
+        self.distribution = cloudfront.Distribution(
+            self,
+            'distribution',
+            comment=f"{stack.stack_name} load balancer",
+            price_class=cloudfront.PriceClass[config.get('price_class', 'PRICE_CLASS_100')],
+            http_version=cloudfront.HttpVersion.HTTP2_AND_3,
+            default_behavior=cloudfront.BehaviorOptions(
+                origin=self.origin,
+                viewer_protocol_policy=cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+                allowed_methods=cloudfront.AllowedMethods.ALLOW_ALL,
+                cache_policy=cloudfront.CachePolicy.CACHING_DISABLED,
+                origin_request_policy=cloudfront.OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER,
+                compress=True,
+            ),
+            additional_behaviors=additional_behaviors,
+        )
+
+    def origin_facing_prefix_list(self) -> str:
+        """Id of the CloudFront origin facing prefix list, which differs per region."""
+        lookup = cr.AwsCustomResource(
+            self,
+            'origin-prefix-list',
+            on_update=cr.AwsSdkCall(
+                service="EC2",
+                action="describeManagedPrefixLists",
+                parameters={"Filters": [{"Name": "prefix-list-name", "Values": [ORIGIN_FACING_PREFIX_LIST]}]},
+                physical_resource_id=cr.PhysicalResourceId.of(ORIGIN_FACING_PREFIX_LIST),
+                output_paths=["PrefixLists.0.PrefixListId"],
+            ),
+            policy=cr.AwsCustomResourcePolicy.from_sdk_calls(resources=cr.AwsCustomResourcePolicy.ANY_RESOURCE),
+            install_latest_aws_sdk=False,
+        )
+        return lookup.get_response_field("PrefixLists.0.PrefixListId")
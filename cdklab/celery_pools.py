@@ -0,0 +1,58 @@
+import copy
+
+# worker pool implementations a celery worker can be started with
+CELERY_POOL_TYPES = ('prefork', 'threads', 'gevent')
+
+DEFAULT_WORKER_COMMAND = ['celery', '-A', 'app.worker', 'worker']
+
+# settings a pool may override on top of the shared celery config
+POOL_SERVICE_KEYS = ('image', 'cpu_limit', 'memory_limit', 'scaling', 'logging', 'platform_version', 'min_healthy_percent', 'max_healthy_percent')
+
+
+def celery_start_command(base_command: list, pool: dict, cpu_limit: int) -> list:
+    """Worker command consuming the pool's queues with its concurrency settings."""
+    name = pool['name']
+    queues = pool.get('queues')
+    if not queues:
+        raise ValueError(f"celery pool '{name}' needs a list of queues")
+    pool_type = pool.get('pool', 'prefork')
+    if pool_type not in CELERY_POOL_TYPES:
+        raise ValueError(f"unsupported celery pool '{pool_type}' for '{name}', use one of {list(CELERY_POOL_TYPES)}")
+
+    command = list(base_command or DEFAULT_WORKER_COMMAND) + [
+        '--queues', ','.join(queues),
+        '--pool', pool_type,
+        '--hostname', f'{name}@%h',
+    ]
+    # prefork sizes itself from the host's cpus, not the task's, unless told otherwise
+    concurrency = pool.get('concurrency') or (max(1, cpu_limit // 1024) if pool_type == 'prefork' else None)
+    if concurrency:
+        command += ['--concurrency', str(concurrency)]
+    if pool.get('prefetch_multiplier') is not None:
+        command += ['--prefetch-multiplier', str(pool['prefetch_multiplier'])]
+    return command
+
+
+def celery_pool_configs(celery_config: dict) -> dict:
+    """Service config per worker pool, the celery config itself when no pools are listed."""
+    pools = celery_config.get('pools')
+    if not pools:
+        return {'celery': celery_config}
+
+    base = {key: value for key, value in celery_config.items() if key != 'pools'}
+    configs = {}
+    for pool in pools:
+        name = pool['name']
+        if f'celery-{name}' in configs:
+            raise ValueError(f"duplicate celery pool '{name}'")
+        # each service adds to its environment maps, keep them apart
+        config = copy.deepcopy(base)
+        config.update({key: copy.deepcopy(pool[key]) for key in POOL_SERVICE_KEYS if key in pool})
+        plaintext = (pool.get('environment') or {}).get('plaintext')
+        if plaintext:
+            config['environment']['plaintext'] = (config['environment'].get('plaintext') or {}) | plaintext
+        config['start_command'] = pool.get('start_command') or celery_start_command(
+            base.get('start_command'), pool, config['cpu_limit']
+        )
+        configs[f'celery-{name}'] = config
+    return configs
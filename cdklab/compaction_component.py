@@ -0,0 +1,88 @@
+import aws_cdk as cdk
+import aws_cdk.aws_glue as glue
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_s3 as s3
+import aws_cdk.aws_s3_assets as s3_assets
+import constructs
+
+
+class CompactionComponent(constructs.Construct):
+    """Scheduled Glue job merging the small Firehose files of each hourly partition.
+
+    Compacted files are written to a new prefix and the catalog partition is
+    pointed at it in one update, so Athena never reads a half written hour.
+    """
+
+    def __init__(
+            self,
+            scope: constructs.Construct,
+            construct_id: str,
+            *,
+            config: dict,
+            bucket: s3.IBucket,
+            database_name: str,
+            table_name: str,
+            raw_prefix: str,
+            **kwargs
+    ):
+        super().__init__(scope, construct_id)
+
+        stack = cdk.Stack.of(self)
+
+        self.script = s3_assets.Asset(self, 'script', path='./glue/compact_events.py')
+
+        self.role = iam.Role(
+            self,
+            'role',
+            assumed_by=iam.ServicePrincipal("glue.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSGlueServiceRole"),
+            ],
+        )
+        self.script.grant_read(self.role)
+        bucket.grant_read_write(self.role)
+        bucket.grant_delete(self.role)
+
+        # python shell is enough for an hour of events and bills a fraction of a spark job
+        self.job = glue.CfnJob(
+            self,
+            'job',
+            name=f"{stack.stack_name}-compaction",
+            role=self.role.role_arn,
+            command=glue.CfnJob.JobCommandProperty(
+                name="pythonshell",
+                python_version="3.9",
+                script_location=self.script.s3_object_url,
+            ),
+            default_arguments={
+                # bundles pyarrow
+                "--library-set": "analytics",
+                "--bucket": bucket.bucket_name,
+                "--raw_prefix": raw_prefix,
+                "--compacted_prefix": config.get('compacted_prefix', f"{raw_prefix}-compacted"),
+                "--database": database_name,
+                "--table": table_name,
+                "--target_file_size_mb": str(config.get('target_file_size_mb', 128)),
+                "--min_files": str(config.get('min_files', 2)),
+                "--min_age_hours": str(config.get('min_age_hours', 1)),
+                "--lookback_hours": str(config.get('lookback_hours', 24)),
+                "--compression": config.get('compression', 'snappy'),
+                # athena's default query timeout, queries still reading a replaced location finish first
+                "--delete_grace_minutes": str(config.get('delete_grace_minutes', 30)),
+            },
+            max_capacity=config.get('max_capacity', 1.0),
+            max_retries=0,
+            timeout=config.get('timeout_minutes', 60),
+            # two runs would compact the same partitions
+            execution_property=glue.CfnJob.ExecutionPropertyProperty(max_concurrent_runs=1),
+        )
+
+        self.trigger = glue.CfnTrigger(
+            self,
+            'schedule',
+            name=f"{stack.stack_name}-compaction",
+            type="SCHEDULED",
+            schedule=config.get('schedule', 'cron(15 * * * ? *)'),
+            start_on_creation=True,
+            actions=[glue.CfnTrigger.ActionProperty(job_name=self.job.ref)],
+        )
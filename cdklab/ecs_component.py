@@ -14,12 +14,99 @@ from aws_cdk import (
     aws_lambda as lambda_,
     custom_resources as custom,
     aws_rds as rds,
+    aws_s3 as s3,
+    aws_s3_assets as s3_assets,
     CfnOutput,
     Stack,
     Duration
 )
 import aws_cdk as cdk
 import constructs
+import json
+from cdklab.app_config import FargateSize, TaskScaling
+from cdklab.log_retention import retention_days
+
+# OTLP receivers on the task's loopback interface, shared by all containers in the task
+OTEL_GRPC_ENDPOINT = "http://localhost:4317"
+# pinned so a deploy doesn't pick up a new collector, bump it or set tracing.collector_image
+DEFAULT_COLLECTOR_IMAGE = "public.ecr.aws/aws-observability/aws-otel-collector:v0.40.0"
+
+# the init variant of aws-for-fluent-bit can load extra config files from S3 at start up,
+# both pinned like the collector, bump them together or set logging.firelens.image
+DEFAULT_FLUENT_BIT_IMAGE = "public.ecr.aws/aws-observability/aws-for-fluent-bit:2.32.4"
+DEFAULT_FLUENT_BIT_INIT_IMAGE = "public.ecr.aws/aws-observability/aws-for-fluent-bit:init-2.32.4"
+FIRELENS_DEBUG_FILTER = "./firelens/filter-debug.conf"
+
+# SOCI lazy loading needs Fargate platform 1.4.0 or later
+PLATFORM_VERSIONS = {
+    "1.3.0": ecs.FargatePlatformVersion.VERSION1_3,
+    "1.4.0": ecs.FargatePlatformVersion.VERSION1_4,
+    "LATEST": ecs.FargatePlatformVersion.LATEST,
+}
+
+# ALB health check profiles, "fast" shortens time to serve traffic during deployments
+ALB_HEALTH_CHECK_PROFILES = {
+    "default": {"interval_seconds": 60, "timeout_seconds": 5, "healthy_threshold": 3, "unhealthy_threshold": 2},
+    "fast": {"interval_seconds": 10, "timeout_seconds": 5, "healthy_threshold": 2, "unhealthy_threshold": 2},
+}
+
+
+def otel_collector_config() -> str:
+    """ADOT collector config receiving OTLP and X-Ray segments and exporting to X-Ray."""
+    return json.dumps({
+        "extensions": {
+            "health_check": {},
+        },
+        "receivers": {
+            "otlp": {
+                "protocols": {
+                    "grpc": {"endpoint": "0.0.0.0:4317"},
+                    "http": {"endpoint": "0.0.0.0:4318"},
+                }
+            },
+            "awsxray": {
+                "endpoint": "0.0.0.0:2000",
+                "transport": "udp",
+            },
+        },
+        "processors": {
+            "memory_limiter": {"check_interval": "1s", "limit_percentage": 80, "spike_limit_percentage": 25},
+            "resourcedetection": {"detectors": ["env", "ecs"], "timeout": "2s"},
+            "batch/traces": {"timeout": "1s", "send_batch_size": 50},
+        },
+        "exporters": {
+            "awsxray": {"index_all_attributes": True},
+        },
+        "service": {
+            "extensions": ["health_check"],
+            "pipelines": {
+                "traces": {
+                    "receivers": ["otlp", "awsxray"],
+                    "processors": ["memory_limiter", "resourcedetection", "batch/traces"],
+                    "exporters": ["awsxray"],
+                }
+            },
+        },
+    })
+
+
+def otel_environment(service_name: str, namespace: str, sampling_rate: float) -> dict:
+    """OpenTelemetry SDK settings pointing the application at the collector sidecar."""
+    return {
+        "OTEL_SERVICE_NAME": service_name,
+        "OTEL_RESOURCE_ATTRIBUTES": f"service.namespace={namespace}",
+        "OTEL_EXPORTER_OTLP_ENDPOINT": OTEL_GRPC_ENDPOINT,
+        "OTEL_EXPORTER_OTLP_PROTOCOL": "grpc",
+        "OTEL_TRACES_EXPORTER": "otlp",
+        "OTEL_METRICS_EXPORTER": "none",
+        "OTEL_LOGS_EXPORTER": "none",
+        # head sampling, child spans follow the caller's decision so traces stay whole across services
+        "OTEL_TRACES_SAMPLER": "parentbased_traceidratio",
+        "OTEL_TRACES_SAMPLER_ARG": str(sampling_rate),
+        "OTEL_PROPAGATORS": "xray,tracecontext,baggage",
+        "OTEL_PYTHON_ID_GENERATOR": "xray",
+    }
+
 
 class EcsComponents(constructs.Construct):
     def __init__(
@@ -28,6 +115,8 @@ class EcsComponents(constructs.Construct):
             construct_id: str,
             *,
             config: dict,
+            size: FargateSize,
+            scaling: TaskScaling = None,
             image_repo,
             alb: bool,
             vpc: ec2.Vpc,
@@ -39,6 +128,7 @@ class EcsComponents(constructs.Construct):
             ecs_task_role: iam.Role,
             database: rds.DatabaseCluster = None,
             redis_security_group: ec2.SecurityGroup = None,
+            tracing: dict = None,
             **kwargs
     ):
         super().__init__(scope, construct_id)
@@ -61,14 +151,18 @@ class EcsComponents(constructs.Construct):
         if env_map:
             comp_env_map.update(env_map)
 
+        # point the OpenTelemetry SDK at the collector sidecar
+        if tracing:
+            comp_env_map.update(otel_environment(construct_id, stack.stack_name, tracing.get('sampling_rate', 0.05)))
+
         # fargate task config
         self.task = ecs.FargateTaskDefinition(
             self,
             f'{construct_id}-task',
             family=f'{construct_id}',
             execution_role=ecs_task_role,
-            memory_limit_mib=config.get('memory_limit', 1024),
-            cpu=config.get('cpu_limit', 512),
+            memory_limit_mib=size.memory,
+            cpu=size.cpu,
         )
 
         # check if container has a start command to pass as an argument
@@ -76,44 +170,192 @@ class EcsComponents(constructs.Construct):
         if config.get("start_command"):
             command = config.get("start_command")
 
+        # container logging, awslogs blocks stdout writes while CloudWatch is slow unless non-blocking
+        log_config = config.get('logging') or {}
+        non_blocking = log_config.get('mode') == 'non-blocking'
+        max_buffer_size = log_config.get('max_buffer_size_mib', 25)
+
+        self.log_group = logs.LogGroup(
+            self,
+            f'{construct_id}-log-group',
+            log_group_name=f"/{stack.stack_name}/ecs/jobscheduler/{construct_id}",
+            retention=retention_days(log_config.get('retention_days', 7)),
+            removal_policy=cdk.RemovalPolicy.DESTROY
+        )
+
+        def aws_log_driver(stream_prefix: str) -> ecs.LogDriver:
+            if non_blocking:
+                return ecs.LogDriver.aws_logs(
+                    log_group=self.log_group,
+                    stream_prefix=stream_prefix,
+                    mode=ecs.AwsLogDriverMode.NON_BLOCKING,
+                    max_buffer_size=cdk.Size.mebibytes(max_buffer_size),
+                )
+            return ecs.LogDriver.aws_logs(
+                log_group=self.log_group,
+                stream_prefix=stream_prefix
+            )
+
+        container_logging = aws_log_driver('container')
+
+        # optional FireLens router batching, filtering and routing the application logs
+        firelens = log_config.get('firelens') or {}
+        if firelens.get('enabled'):
+            destination = firelens.get('destination', 'cloudwatch')
+            if destination == 's3':
+                bucket = s3.Bucket.from_bucket_name(self, f'{construct_id}-log-bucket', firelens['bucket'])
+                bucket.grant_put(self.task.task_role)
+                output_options = {
+                    "Name": "s3",
+                    "region": stack.region,
+                    "bucket": bucket.bucket_name,
+                    "total_file_size": f"{firelens.get('total_file_size_mib', 50)}M",
+                    "upload_timeout": f"{firelens.get('upload_timeout_seconds', 60)}s",
+                    "compression": "gzip",
+                    "use_put_object": "On",
+                    "s3_key_format": f"/{firelens.get('prefix', 'logs')}/{construct_id}/%Y/%m/%d/%H/$UUID.gz",
+                }
+            elif destination == 'cloudwatch':
+                self.log_group.grant_write(self.task.task_role)
+                output_options = {
+                    "Name": "cloudwatch_logs",
+                    "region": stack.region,
+                    "log_group_name": self.log_group.log_group_name,
+                    "log_stream_prefix": "firelens/",
+                    "auto_create_group": "false",
+                }
+            else:
+                raise ValueError(f"unsupported firelens destination '{destination}' for {construct_id}, use 's3' or 'cloudwatch'")
+
+            if non_blocking:
+                output_options["mode"] = "non-blocking"
+                output_options["max-buffer-size"] = f"{max_buffer_size}m"
+
+            router_environment = {}
+            router_image = firelens.get('image', DEFAULT_FLUENT_BIT_IMAGE)
+            if firelens.get('exclude_debug', True):
+                debug_filter = s3_assets.Asset(self, f'{construct_id}-firelens-filter', path=FIRELENS_DEBUG_FILTER)
+                debug_filter.grant_read(self.task.task_role)
+                router_environment["aws_fluent_bit_init_s3_1"] = f"arn:aws:s3:::{debug_filter.s3_bucket_name}/{debug_filter.s3_object_key}"
+                router_image = firelens.get('image', DEFAULT_FLUENT_BIT_INIT_IMAGE)
+                if not router_image.rsplit(':', 1)[-1].startswith('init'):
+                    raise ValueError(f"firelens exclude_debug for {construct_id} needs an init-* fluent bit image, got '{router_image}'")
+
+            self.log_router = self.task.add_firelens_log_router(
+                f'{construct_id}-log-router',
+                image=ecs.ContainerImage.from_registry(router_image),
+                firelens_config=ecs.FirelensConfig(
+                    type=ecs.FirelensLogRouterType.FLUENTBIT,
+                    options=ecs.FirelensOptions(enable_ecs_log_metadata=True),
+                ),
+                memory_reservation_mib=firelens.get('memory', 64),
+                environment=router_environment,
+                logging=aws_log_driver('firelens'),
+            )
+            container_logging = ecs.LogDrivers.firelens(options=output_options)
+
+        # container health check, defaults to polling the health check path with the image's python
+        container_health_check = None
+        health_check_config = config.get('container_health_check')
+        if health_check_config:
+            health_command = health_check_config.get('command')
+            if not health_command:
+                if not (container_port and health_check_path):
+                    raise ValueError(f"container_health_check for {construct_id} needs a command when there is no health check path")
+                health_command = [
+                    "CMD-SHELL",
+                    f"python -c \"import urllib.request; urllib.request.urlopen('http://localhost:{container_port}{health_check_path}', timeout=2)\" || exit 1"
+                ]
+            container_health_check = ecs.HealthCheck(
+                command=health_command,
+                interval=Duration.seconds(health_check_config.get('interval_seconds', 10)),
+                timeout=Duration.seconds(health_check_config.get('timeout_seconds', 5)),
+                retries=health_check_config.get('retries', 3),
+                start_period=Duration.seconds(health_check_config.get('start_period_seconds', 10)),
+            )
+
         # define container
         self.container = self.task.add_container(
             f'{construct_id}-container',
             image=ecs.ContainerImage.from_ecr_repository(image_repo, config.get("image")),
-            logging=ecs.LogDriver.aws_logs(
-                log_group=logs.LogGroup(
-                    self,
-                    f'{construct_id}-log-group',
-                    log_group_name=f"/{stack.stack_name}/ecs/jobscheduler/{construct_id}",
-                    retention=logs.RetentionDays.ONE_WEEK,
-                    removal_policy=cdk.RemovalPolicy.DESTROY
-                ),
-                stream_prefix='container'
-            ),
+            logging=container_logging,
             environment=comp_env_map,
             command=command,
-            secrets=comp_secret_map
+            secrets=comp_secret_map,
+            health_check=container_health_check,
         )
 
+        # ADOT collector sidecar forwarding traces to X-Ray
+        if tracing:
+            self.collector = self.task.add_container(
+                f'{construct_id}-otel-collector',
+                image=ecs.ContainerImage.from_registry(tracing.get('collector_image', DEFAULT_COLLECTOR_IMAGE)),
+                essential=False,
+                cpu=tracing.get('collector_cpu', 64),
+                memory_reservation_mib=tracing.get('collector_memory', 128),
+                environment={
+                    "AOT_CONFIG_CONTENT": otel_collector_config(),
+                },
+                logging=aws_log_driver('otel'),
+            )
+            self.container.add_container_dependencies(ecs.ContainerDependency(
+                container=self.collector,
+                condition=ecs.ContainerDependencyCondition.START,
+            ))
+            self.task.task_role.add_managed_policy(
+                iam.ManagedPolicy.from_aws_managed_policy_name('AWSXRayDaemonWriteAccess')
+            )
+
         # assign port for inbound access
         if container_port:
             self.container.add_port_mappings(ecs.PortMapping(container_port=container_port))
 
+        # lazy loading of SOCI indexed images from ECR needs platform 1.4.0, the index is pushed with the image
+        platform_version = str(config.get('platform_version', '1.4.0'))
+        if platform_version not in PLATFORM_VERSIONS:
+            raise ValueError(f"unsupported platform_version '{platform_version}' for {construct_id}, use one of {sorted(PLATFORM_VERSIONS)}")
+        if config.get('soci') and platform_version == '1.3.0':
+            raise ValueError(f"soci for {construct_id} needs platform_version 1.4.0 or LATEST")
+
+        # build_stacks validates the whole config, this covers a component built on its own
+        errors = size.errors(construct_id) + (scaling.errors(construct_id) if scaling else [])
+        if errors:
+            raise ValueError("; ".join(errors))
+
         # define service
         self.service = ecs.FargateService(
             self,
             f'{construct_id}-service',
             cluster=cluster,
             task_definition=self.task ,
-            platform_version=ecs.FargatePlatformVersion.VERSION1_4,
+            platform_version=PLATFORM_VERSIONS[platform_version],
             assign_public_ip=False,
             circuit_breaker=ecs.DeploymentCircuitBreaker(
                 enable=True,
                 rollback=True,
             ),
+            # grace period only applies to services behind the load balancer
+            health_check_grace_period=Duration.seconds(config['health_check_grace_seconds']) if alb and config.get('health_check_grace_seconds') is not None else None,
+            min_healthy_percent=config.get('min_healthy_percent'),
+            max_healthy_percent=config.get('max_healthy_percent'),
+            # no desired count, a deploy would reset a scaled out service to it
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS)
         )
 
+        # application auto scaling owns the task count, the config keeps the tracking settings
+        if scaling:
+            tracking = config.get('scaling') or {}
+            self.scaling = self.service.auto_scale_task_count(
+                min_capacity=scaling.min_capacity,
+                max_capacity=scaling.max_capacity,
+            )
+            self.scaling.scale_on_cpu_utilization(
+                f'{construct_id}-cpu-scaling',
+                target_utilization_percent=tracking.get('cpu_target_percent', 70),
+                scale_in_cooldown=Duration.seconds(tracking.get('scale_in_cooldown_seconds', 300)),
+                scale_out_cooldown=Duration.seconds(tracking.get('scale_out_cooldown_seconds', 60)),
+            )
+
         # allow access to redis
         if redis_security_group:
             for security_group in self.service.connections.security_groups:
@@ -136,14 +378,20 @@ class EcsComponents(constructs.Construct):
 
         # if container requires application load balancer setup health check and target group
         if alb:
-             # create ALB health checks
+            # create ALB health checks from a profile with optional overrides
+            alb_health_check = dict(config.get('alb_health_check') or {})
+            profile = alb_health_check.pop('profile', 'default')
+            if profile not in ALB_HEALTH_CHECK_PROFILES:
+                raise ValueError(f"unsupported alb_health_check profile '{profile}' for {construct_id}, use one of {sorted(ALB_HEALTH_CHECK_PROFILES)}")
+            alb_health_check = ALB_HEALTH_CHECK_PROFILES[profile] | alb_health_check
+
             self.health_check = elb.HealthCheck(
-                interval=Duration.seconds(60),
+                interval=Duration.seconds(alb_health_check['interval_seconds']),
                 path=health_check_path,
-                timeout=Duration.seconds(5),
+                timeout=Duration.seconds(alb_health_check['timeout_seconds']),
                 healthy_http_codes='200',
-                healthy_threshold_count=3,
-                unhealthy_threshold_count=2
+                healthy_threshold_count=alb_health_check['healthy_threshold'],
+                unhealthy_threshold_count=alb_health_check['unhealthy_threshold']
             )
 
             # create ALB target groups
@@ -156,4 +404,5 @@ class EcsComponents(constructs.Construct):
                 target_type=elb.TargetType.IP,
                 vpc=vpc,
                 targets=[self.service],
+                deregistration_delay=Duration.seconds(config['deregistration_delay_seconds']) if config.get('deregistration_delay_seconds') is not None else None,
             )
@@ -12,14 +12,48 @@ from aws_cdk import (
     aws_logs as logs,
 )
 from constructs import Construct
+from cdklab.app_config import AppConfig
+from cdklab.athena_component import AthenaComponent
+from cdklab.compaction_component import CompactionComponent
 from cdklab.lambda_deploy import LambdaDeploy
+from cdklab.log_retention import retention_days
+
+# app_events schema, the rollup sql is generated from it
+EVENT_COLUMNS = [
+    ("app_id", "string"),
+    ("event_id", "string"),
+    ("event_type", "string"),
+    ("event_uri", "string"),
+    ("user_id", "string"),
+    ("session_id", "string"),
+    ("attributes", "struct<action:string,duration:int,status:string>"),
+    ("device", "struct<hostname:string,os:string,client_ip:string>"),
+    ("createts", "timestamp"),
+]
+
+# event time column, compaction sorts on it
+EVENT_TIME_COLUMN = "createts"
+
+# json keys the producers write where they differ from the column name, the serde leaves unmapped columns null
+EVENT_JSON_KEYS = {
+    EVENT_TIME_COLUMN: "create_ts",
+}
 
 
 class AnalyticsDeployStack(Stack):
     
-    def __init__(self, scope: Construct, construct_id: str, vpc, config: dict, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, vpc, config: dict, *, capacity: AppConfig, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        raw_prefix = config['analytics']['firehose_stream_prefix']
+
+        # compaction swaps whole hours in the catalog, so firehose writes hourly partitions
+        compaction = config['analytics'].get('compaction') or {}
+        partitioned = compaction.get('enabled', False)
+        athena_config = config['analytics'].get('athena') or {}
+        # the rollups prune to one dt partition, unpartitioned they'd scan every event each hour
+        if athena_config.get('enabled', False) and not partitioned:
+            raise ValueError("analytics.athena needs analytics.compaction.enabled for the hourly dt partitions")
 
         # Bucket for config and storing code archives
         self.bucket = s3.Bucket(
@@ -52,15 +86,8 @@ class AnalyticsDeployStack(Stack):
                 name="app_events",
                 storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
                     columns=[
-                        glue.CfnTable.ColumnProperty(name="app_id", type="string"),
-                        glue.CfnTable.ColumnProperty(name="event_id", type="string"),
-                        glue.CfnTable.ColumnProperty(name="event_type", type="string"),
-                        glue.CfnTable.ColumnProperty(name="event_uri", type="string"),
-                        glue.CfnTable.ColumnProperty(name="user_id", type="string"),
-                        glue.CfnTable.ColumnProperty(name="session_id", type="string"),
-                        glue.CfnTable.ColumnProperty(name="attributes", type="struct<action:string,duration:int,status:string>"),
-                        glue.CfnTable.ColumnProperty(name="device", type="struct<hostname:string,os:string,client_ip:string>"),
-                        glue.CfnTable.ColumnProperty(name="createts", type="timestamp"),
+                        glue.CfnTable.ColumnProperty(name=column_name, type=column_type)
+                        for column_name, column_type in EVENT_COLUMNS
                     ],
                     input_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat",
                     output_format="org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat",
@@ -70,8 +97,9 @@ class AnalyticsDeployStack(Stack):
                             "serialization.format": "1"
                         }
                     ),
-                    location=f"s3://{self.bucket.bucket_name}/{config['analytics']['firehose_stream_prefix']}", # This is a placeholder, Firehose will write here
+                    location=f"s3://{self.bucket.bucket_name}/{raw_prefix}", # This is a placeholder, Firehose will write here
                 ),
+                partition_keys=[glue.CfnTable.ColumnProperty(name="dt", type="string")] if partitioned else None,
                 table_type="EXTERNAL_TABLE",
             ),
         )
@@ -113,9 +141,9 @@ class AnalyticsDeployStack(Stack):
         self.stream = kinesis.CfnStream(
             self,
             "stream",
-            retention_period_hours=24,
+            retention_period_hours=capacity.stream.retention_hours,
             name=config["cdklab"]["kinesis_stream"],
-            shard_count=4,
+            shard_count=capacity.stream.shard_count,
             stream_encryption=kinesis.CfnStream.StreamEncryptionProperty(
                 encryption_type="KMS", key_id="alias/aws/kinesis"
             ),
@@ -127,13 +155,17 @@ class AnalyticsDeployStack(Stack):
             "events",
             vpc=vpc,
             stream=self.stream,
+            tracing=(config.get('tracing') or {}).get('enabled', False),
+            ingest=config['analytics']['ingest'],
+            memory_size=capacity.lambda_memory['ingest'],
+            capacity=capacity.stream,
         )
 
         # firehose role
         self.firehose_log_group = logs.LogGroup(
             self, "FirehoseLogGroup",
             log_group_name=f'/aws/kinesisfirehose/{config["cdklab"]["firehose_stream_name"]}',
-            retention=logs.RetentionDays.ONE_WEEK  # Adjust retention as needed
+            retention=retention_days(config['analytics'].get('log_retention_days', 7))
         )
 
         self.fh_role = iam.Role(
@@ -233,10 +265,11 @@ class AnalyticsDeployStack(Stack):
                 bucket_arn=self.bucket.bucket_arn,
                 role_arn=self.fh_role.role_arn,
                 buffering_hints=firehose.CfnDeliveryStream.BufferingHintsProperty(
-                    size_in_m_bs=64, # Minimum 64 MB when format conversion is enabled
-                    interval_in_seconds=300
+                    size_in_m_bs=capacity.stream.firehose_buffer_mb, # Minimum 64 MB when format conversion is enabled
+                    interval_in_seconds=capacity.stream.firehose_interval_seconds
                 ),
-                prefix=f"{config['analytics']['firehose_stream_prefix']}/",
+                prefix=f"{raw_prefix}/dt=!{{timestamp:yyyy-MM-dd-HH}}/" if partitioned else f"{raw_prefix}/",
+                error_output_prefix=f"{raw_prefix}-errors/!{{firehose:error-output-type}}/dt=!{{timestamp:yyyy-MM-dd-HH}}/" if partitioned else None,
                 # Compression is handled by ParquetSerDe, so set to UNCOMPRESSED
                 compression_format="UNCOMPRESSED",
                 data_format_conversion_configuration=firehose.CfnDeliveryStream.DataFormatConversionConfigurationProperty(
@@ -245,6 +278,7 @@ class AnalyticsDeployStack(Stack):
                             deserializer=firehose.CfnDeliveryStream.DeserializerProperty(
                                 open_x_json_ser_de=firehose.CfnDeliveryStream.OpenXJsonSerDeProperty(
                                     case_insensitive=False,
+                                    column_to_json_key_mappings=EVENT_JSON_KEYS,
                                     convert_dots_in_json_keys_to_underscores=False
                                 )
                         )
@@ -295,3 +329,24 @@ class AnalyticsDeployStack(Stack):
             configuration='{"Version":1.0,"Grouping":{"TableGroupingPolicy":"CombineCompatibleSchemas"}}',
         )
 
+        if partitioned:
+            self.compaction = CompactionComponent(
+                self,
+                "compaction",
+                config=compaction,
+                bucket=self.bucket,
+                database_name=self.glue_db.database_input.name,
+                table_name=self.glue_table.table_input.name,
+                raw_prefix=raw_prefix,
+            )
+
+        if athena_config.get('enabled', False):
+            self.athena = AthenaComponent(
+                self,
+                "athena",
+                config=athena_config,
+                bucket=self.bucket,
+                database=self.glue_db,
+                table_name=self.glue_table.table_input.name,
+                columns=EVENT_COLUMNS,
+            )
@@ -5,8 +5,15 @@ import aws_cdk.aws_iam as iam
 import aws_cdk.aws_lambda as lmb
 import aws_cdk.aws_logs as logs
 import aws_cdk.aws_kinesis as kinesis
+import aws_cdk.aws_lambda_event_sources as event_sources
+import aws_cdk.aws_sqs as sqs
 import constructs
 
+from cdklab.app_config import StreamCapacity
+
+# mirrors lambda/partition_keys.STRATEGIES, the lambda asset isn't importable here so a test keeps them equal
+PARTITION_KEY_STRATEGIES = ('app', 'balanced', 'composite', 'session', 'user')
+
 
 class LambdaDeploy(constructs.Construct):
     def __init__(
@@ -14,17 +21,37 @@ class LambdaDeploy(constructs.Construct):
             scope: constructs.Construct,
             construct_id: str,
             *,
-            vpc: ec2.Vpc,
+            vpc: ec2.IVpc,
             stream: kinesis.CfnStream,
+            tracing: bool = False,
+            ingest: dict,
+            memory_size: int,
+            capacity: StreamCapacity,
             **kwargs
     ):
         super().__init__(scope, construct_id)
 
         stack = cdk.Stack.of(self)
 
-        # gateway
-        self.apigw_endpoint = vpc.add_interface_endpoint(
+        # direct: the api calls the ingest lambda which writes to kinesis in the request
+        # queue: the api enqueues to sqs and returns 202, a consumer drains to kinesis in batches
+        ingest_mode = ingest.get('mode', 'direct')
+        if ingest_mode not in ('direct', 'queue'):
+            raise ValueError(f"unsupported ingest mode '{ingest_mode}', use 'direct' or 'queue'")
+
+        # session keeps per session ordering, composite/balanced hash the listed fields
+        partition_key = ingest.get('partition_key') or {}
+        partition_key_strategy = partition_key.get('strategy', 'session')
+        if partition_key_strategy not in PARTITION_KEY_STRATEGIES:
+            raise ValueError(f"unsupported partition key strategy '{partition_key_strategy}', use one of {list(PARTITION_KEY_STRATEGIES)}")
+        if partition_key_strategy == 'composite' and not partition_key.get('fields'):
+            raise ValueError("partition key strategy 'composite' needs a list of fields")
+
+        # gateway, scoped to this construct so the shared vpc stack is not modified
+        self.apigw_endpoint = ec2.InterfaceVpcEndpoint(
+            self,
             'apigw',
+            vpc=vpc,
             service=ec2.InterfaceVpcEndpointAwsService.APIGATEWAY,
             subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC),
             private_dns_enabled=False,
@@ -35,9 +62,10 @@ class LambdaDeploy(constructs.Construct):
             self,
             "restapi",
             rest_api_name="events",
+            deploy_options=apigateway.StageOptions(tracing_enabled=True) if tracing else None,
             default_method_options=apigateway.MethodOptions(api_key_required=False),
             endpoint_configuration=apigateway.EndpointConfiguration(
-                types=[apigateway.EndpointType.PUBLIC],
+                types=[apigateway.EndpointType.PRIVATE],
                 vpc_endpoints=[self.apigw_endpoint]
             ),
             policy=iam.PolicyDocument(
@@ -115,16 +143,18 @@ class LambdaDeploy(constructs.Construct):
 
         self.v1_path = self.api.root.add_resource("v1",  default_method_options=apigateway.MethodOptions(api_key_required=False))
 
+        # the function writing to kinesis, the consumer in queue mode
         self.func_events = lmb.Function(
             self,
             'fn',
             function_name=f"{stack.stack_name}-ingest",
-            code=lmb.Code.from_asset(path=f'./lambda/ingest'),
+            code=lmb.Code.from_asset(path='./lambda', exclude=["__pycache__"]),
             runtime=lmb.Runtime('python3.11'),
-            handler="function.handler",
+            handler="ingest_consumer.handler" if ingest_mode == 'queue' else "ingest.handler",
             role=self.role,
-            memory_size=256,
-            timeout=cdk.Duration.seconds(15),
+            memory_size=memory_size,
+            timeout=cdk.Duration.seconds(ingest.get('consumer_timeout_seconds', 30) if ingest_mode == 'queue' else 15),
+            tracing=lmb.Tracing.ACTIVE if tracing else None,
             # vpc=vpc,
             # vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_ISOLATED),
             # security_groups=[self.lambda_security_group],
@@ -136,18 +166,27 @@ class LambdaDeploy(constructs.Construct):
                 removal_policy=cdk.RemovalPolicy.DESTROY,
             ),
             environment={
-                "KDS_NAME": stream.name
+                "KDS_NAME": stream.name,
+                "PARTITION_KEY_STRATEGY": partition_key_strategy,
+                "PARTITION_KEY_FIELDS": ",".join(partition_key.get('fields') or []),
+                "PARTITION_KEY_SPREAD": str(capacity.partition_key_spread),
+                # explicit hash keys assume the shards split the key space evenly
+                "SHARD_COUNT": str(stream.shard_count or 1),
             },
             layers=[]
         )
         
             
         self.ingest_path = self.v1_path.add_resource("events")
-        self.ingest_path.add_method(
-            "POST",
-            apigateway.LambdaIntegration(self.func_events),
-            api_key_required=False
-        )
+
+        if ingest_mode == 'queue':
+            self._add_queue_ingest(construct_id, ingest)
+        else:
+            self.ingest_path.add_method(
+                "POST",
+                apigateway.LambdaIntegration(self.func_events),
+                api_key_required=False
+            )
 
         cdk.CfnOutput(
             self, "rest_path",
@@ -160,3 +199,91 @@ class LambdaDeploy(constructs.Construct):
             'GW URL',
             value=f"https://{self.api.rest_api_id}-{self.apigw_endpoint.vpc_endpoint_id}.execute-api.{stack.region}.amazonaws.com/prod"
         )
+
+    def _add_queue_ingest(self, construct_id: str, ingest: dict):
+        """Enqueue events from API Gateway and drain them to Kinesis with a batching consumer."""
+        stack = cdk.Stack.of(self)
+
+        self.dead_letter_queue = sqs.Queue(
+            self,
+            'dlq',
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            retention_period=cdk.Duration.days(14),
+        )
+
+        # visibility timeout must cover the batching window plus the consumer timeout
+        self.queue = sqs.Queue(
+            self,
+            'queue',
+            encryption=sqs.QueueEncryption.SQS_MANAGED,
+            visibility_timeout=cdk.Duration.seconds(
+                6 * ingest.get('consumer_timeout_seconds', 30) + ingest.get('max_batching_window_seconds', 5)
+            ),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=ingest.get('max_receive_count', 5),
+                queue=self.dead_letter_queue,
+            ),
+        )
+
+        self.api_role = iam.Role(
+            self,
+            'api-role',
+            assumed_by=iam.ServicePrincipal("apigateway.amazonaws.com"),
+        )
+        self.queue.grant_send_messages(self.api_role)
+
+        event_model = self.api.add_model(
+            'event-model',
+            content_type="application/json",
+            schema=apigateway.JsonSchema(
+                schema=apigateway.JsonSchemaVersion.DRAFT4,
+                type=apigateway.JsonSchemaType.OBJECT,
+                min_properties=1,
+            )
+        )
+
+        self.ingest_path.add_method(
+            "POST",
+            apigateway.AwsIntegration(
+                service="sqs",
+                path=f"{stack.account}/{self.queue.queue_name}",
+                integration_http_method="POST",
+                options=apigateway.IntegrationOptions(
+                    credentials_role=self.api_role,
+                    passthrough_behavior=apigateway.PassthroughBehavior.NEVER,
+                    request_parameters={
+                        "integration.request.header.Content-Type": "'application/x-www-form-urlencoded'"
+                    },
+                    request_templates={
+                        "application/json": "Action=SendMessage&MessageBody=$util.urlEncode($input.body)"
+                    },
+                    integration_responses=[
+                        apigateway.IntegrationResponse(
+                            status_code="202",
+                            response_templates={"application/json": '"event data accepted"'},
+                        ),
+                        apigateway.IntegrationResponse(
+                            status_code="500",
+                            selection_pattern=r"5\d{2}|4\d{2}",
+                            response_templates={"application/json": '"ingest queue unavailable"'},
+                        ),
+                    ],
+                ),
+            ),
+            api_key_required=False,
+            request_validator_options=apigateway.RequestValidatorOptions(validate_request_body=True),
+            request_models={"application/json": event_model},
+            method_responses=[
+                apigateway.MethodResponse(status_code="202"),
+                apigateway.MethodResponse(status_code="500"),
+            ],
+        )
+
+        # drain in batches, failed entries are reported per message and retried alone
+        self.func_events.add_event_source(event_sources.SqsEventSource(
+            self.queue,
+            batch_size=ingest.get('batch_size', 100),
+            max_batching_window=cdk.Duration.seconds(ingest.get('max_batching_window_seconds', 5)),
+            max_concurrency=ingest.get('max_concurrency'),
+            report_batch_item_failures=True,
+        ))
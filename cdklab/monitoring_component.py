@@ -0,0 +1,186 @@
+import aws_cdk as cdk
+import aws_cdk.aws_cloudwatch as cloudwatch
+import aws_cdk.aws_cloudwatch_actions as cw_actions
+import aws_cdk.aws_elasticache as el
+import aws_cdk.aws_elasticloadbalancingv2 as elb
+import aws_cdk.aws_kinesis as kinesis
+import aws_cdk.aws_lambda as lmb
+import aws_cdk.aws_rds as rds
+import aws_cdk.aws_sns as sns
+import aws_cdk.aws_sqs as sqs
+import constructs
+
+
+class MonitoringComponent(constructs.Construct):
+    """Dashboard and alarms for the hot-path signals of the resources passed in.
+
+    Every resource is optional. Alarms are only created for thresholds present
+    in `config['thresholds']`, the rest of the metrics are graphed only.
+    """
+
+    def __init__(
+            self,
+            scope: constructs.Construct,
+            construct_id: str,
+            *,
+            config: dict,
+            load_balancer: elb.ApplicationLoadBalancer = None,
+            services: dict = None,
+            redis: el.CfnReplicationGroup = None,
+            database: rds.DatabaseCluster = None,
+            stream: kinesis.CfnStream = None,
+            function: lmb.Function = None,
+            queue: sqs.Queue = None,
+            **kwargs
+    ):
+        super().__init__(scope, construct_id)
+
+        stack = cdk.Stack.of(self)
+
+        self.thresholds = config.get('thresholds') or {}
+        self.period = cdk.Duration.minutes(config.get('period_minutes', 1))
+        self.evaluation_periods = config.get('evaluation_periods', 3)
+        self.alarms = []
+
+        # optional existing topic to notify on alarm
+        self.topic = None
+        if config.get('alarm_topic_arn'):
+            self.topic = sns.Topic.from_topic_arn(self, 'alarm-topic', config['alarm_topic_arn'])
+
+        self.dashboard = cloudwatch.Dashboard(
+            self,
+            'dashboard',
+            dashboard_name=config.get('dashboard_name', f"{stack.stack_name}-performance"),
+        )
+
+        # application load balancer
+        if load_balancer:
+            response_time = load_balancer.metrics.target_response_time(statistic="p99", period=self.period)
+            target_5xx = load_balancer.metrics.http_code_target(
+                elb.HttpCodeTarget.TARGET_5XX_COUNT, statistic="Sum", period=self.period
+            )
+            elb_5xx = load_balancer.metrics.http_code_elb(
+                elb.HttpCodeElb.ELB_5XX_COUNT, statistic="Sum", period=self.period
+            )
+            self._alarm('alb-p99', response_time, 'alb_p99_response_seconds')
+            self._alarm('alb-target-5xx', target_5xx, 'alb_5xx_count')
+            self._alarm('alb-elb-5xx', elb_5xx, 'alb_5xx_count')
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(title="ALB TargetResponseTime p99", left=[response_time]),
+                cloudwatch.GraphWidget(title="ALB 5xx", left=[target_5xx, elb_5xx]),
+            )
+
+        # fargate services
+        for name, service in (services or {}).items():
+            cpu = service.metric_cpu_utilization(period=self.period)
+            memory = service.metric_memory_utilization(period=self.period)
+            self._alarm(f'{name}-cpu', cpu, 'ecs_cpu_percent')
+            self._alarm(f'{name}-memory', memory, 'ecs_memory_percent')
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(title=f"{name} CPU / memory", left=[cpu, memory]),
+            )
+
+        # elasticache redis, metrics are reported per member cluster
+        if redis:
+            redis_metrics = {}
+            for metric_name, statistic in (("EngineCPUUtilization", "Average"), ("Evictions", "Sum"), ("CurrConnections", "Maximum")):
+                redis_metrics[metric_name] = [
+                    cloudwatch.Metric(
+                        namespace="AWS/ElastiCache",
+                        metric_name=metric_name,
+                        dimensions_map={"CacheClusterId": f"{redis.replication_group_id.lower()}-{node:03d}"},
+                        statistic=statistic,
+                        period=self.period,
+                    )
+                    for node in range(1, (redis.num_cache_clusters or 1) + 1)
+                ]
+            # alarm on every node, the primary moves to a replica on failover
+            for node, (engine_cpu, evictions, connections) in enumerate(zip(*redis_metrics.values()), start=1):
+                self._alarm(f'redis-engine-cpu-{node:03d}', engine_cpu, 'redis_engine_cpu_percent')
+                self._alarm(f'redis-evictions-{node:03d}', evictions, 'redis_evictions')
+                self._alarm(f'redis-connections-{node:03d}', connections, 'redis_connections')
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(title="Redis EngineCPUUtilization", left=redis_metrics["EngineCPUUtilization"]),
+                cloudwatch.GraphWidget(title="Redis evictions", left=redis_metrics["Evictions"]),
+                cloudwatch.GraphWidget(title="Redis connections", left=redis_metrics["CurrConnections"]),
+            )
+
+        # aurora serverless v2
+        if database:
+            acu = database.metric("ACUUtilization", statistic="Maximum", period=self.period)
+            connections = database.metric_database_connections(statistic="Maximum", period=self.period)
+            self._alarm('aurora-acu', acu, 'aurora_acu_utilization_percent')
+            self._alarm('aurora-connections', connections, 'aurora_connections')
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(title="Aurora ACU utilization", left=[acu]),
+                cloudwatch.GraphWidget(title="Aurora connections", left=[connections]),
+            )
+
+        # kinesis data stream
+        if stream:
+            write_throttled = cloudwatch.Metric(
+                namespace="AWS/Kinesis",
+                metric_name="WriteProvisionedThroughputExceeded",
+                dimensions_map={"StreamName": stream.name},
+                statistic="Sum",
+                period=self.period,
+            )
+            iterator_age = cloudwatch.Metric(
+                namespace="AWS/Kinesis",
+                metric_name="GetRecords.IteratorAgeMilliseconds",
+                dimensions_map={"StreamName": stream.name},
+                statistic="Maximum",
+                period=self.period,
+            )
+            self._alarm('kinesis-write-throttled', write_throttled, 'kinesis_write_throttled_records')
+            self._alarm('kinesis-iterator-age', iterator_age, 'kinesis_iterator_age_ms')
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(title="Kinesis write throttling", left=[write_throttled]),
+                cloudwatch.GraphWidget(title="Kinesis iterator age", left=[iterator_age]),
+            )
+
+        # ingest lambda
+        if function:
+            duration = function.metric_duration(statistic="p99", period=self.period)
+            throttles = function.metric_throttles(statistic="Sum", period=self.period)
+            self._alarm('lambda-p99', duration, 'lambda_p99_duration_ms')
+            self._alarm('lambda-throttles', throttles, 'lambda_throttles')
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(title="Ingest Lambda duration p99", left=[duration]),
+                cloudwatch.GraphWidget(title="Ingest Lambda throttles", left=[throttles]),
+            )
+
+        # write-behind ingest queue, a growing backlog means the consumer can't keep up
+        if queue:
+            oldest_message = queue.metric_approximate_age_of_oldest_message(statistic="Maximum", period=self.period)
+            visible_messages = queue.metric_approximate_number_of_messages_visible(statistic="Maximum", period=self.period)
+            self._alarm('ingest-queue-age', oldest_message, 'sqs_oldest_message_seconds')
+            self.dashboard.add_widgets(
+                cloudwatch.GraphWidget(title="Ingest queue oldest message age", left=[oldest_message]),
+                cloudwatch.GraphWidget(title="Ingest queue backlog", left=[visible_messages]),
+            )
+
+        if self.alarms:
+            self.dashboard.add_widgets(
+                cloudwatch.AlarmStatusWidget(title="Alarms", alarms=self.alarms, width=24),
+            )
+
+    def _alarm(self, alarm_id: str, metric: cloudwatch.IMetric, threshold_key: str):
+        """Create an alarm for the metric if a threshold is configured."""
+        threshold = self.thresholds.get(threshold_key)
+        if threshold is None:
+            return None
+
+        alarm = metric.create_alarm(
+            self,
+            alarm_id,
+            threshold=threshold,
+            evaluation_periods=self.evaluation_periods,
+            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD,
+            treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+        )
+        if self.topic:
+            alarm.add_alarm_action(cw_actions.SnsAction(self.topic))
+
+        self.alarms.append(alarm)
+        return alarm
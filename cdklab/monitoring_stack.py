@@ -0,0 +1,28 @@
+from aws_cdk import Stack
+from constructs import Construct
+from cdklab.cdklab_stack import LabDeployStack
+from cdklab.event_stack import AnalyticsDeployStack
+from cdklab.monitoring_component import MonitoringComponent
+
+
+class MonitoringStack(Stack):
+
+    def __init__(self, scope: Construct, construct_id: str, app_config: dict, lab: LabDeployStack, analytics: AnalyticsDeployStack, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self.monitoring = MonitoringComponent(
+            self,
+            "monitoring",
+            config=app_config["monitoring"],
+            load_balancer=lab.lb,
+            services={
+                "fastapi": lab.fastapi.service,
+                **{pool_id: pool.service for pool_id, pool in lab.celery_pools.items()},
+                "flower": lab.flower.service,
+            },
+            redis=lab.redis,
+            database=lab.postgres.database,
+            stream=analytics.stream,
+            function=analytics.lambda_deploy.func_events,
+            queue=getattr(analytics.lambda_deploy, 'queue', None),
+        )
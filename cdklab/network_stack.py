@@ -0,0 +1,84 @@
+from aws_cdk import (
+    Stack,
+    aws_ec2 as ec2,
+)
+from constructs import Construct
+
+# config names for the endpoints private subnets can use instead of the NAT gateway
+GATEWAY_ENDPOINTS = {
+    "s3": ec2.GatewayVpcEndpointAwsService.S3,
+    "dynamodb": ec2.GatewayVpcEndpointAwsService.DYNAMODB,
+}
+
+INTERFACE_ENDPOINTS = {
+    "ecr_api": ec2.InterfaceVpcEndpointAwsService.ECR,
+    "ecr_dkr": ec2.InterfaceVpcEndpointAwsService.ECR_DOCKER,
+    "secrets_manager": ec2.InterfaceVpcEndpointAwsService.SECRETS_MANAGER,
+    "logs": ec2.InterfaceVpcEndpointAwsService.CLOUDWATCH_LOGS,
+    "kinesis": ec2.InterfaceVpcEndpointAwsService.KINESIS_STREAMS,
+    "xray": ec2.InterfaceVpcEndpointAwsService.XRAY,
+    "sqs": ec2.InterfaceVpcEndpointAwsService.SQS,
+}
+
+
+class NetworkStack(Stack):
+
+    def __init__(self, scope: Construct, construct_id: str, app_config: dict, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        network_config = app_config.get('network') or {}
+        max_azs = network_config.get('max_azs', 2)
+
+        # one NAT gateway per AZ survives an AZ outage, a single shared one is cheaper
+        nat_mode = network_config.get('nat_mode', 'per_az')
+        if nat_mode not in ('per_az', 'single'):
+            raise ValueError(f"unsupported nat_mode '{nat_mode}', use 'per_az' or 'single'")
+
+        # shared vpc consumed by the lab and analytics stacks
+        self.vpc = ec2.Vpc(self, "labvpc",
+            max_azs=max_azs,  # Multi-AZ for high availability
+            nat_gateways=1 if nat_mode == 'single' else max_azs,
+            subnet_configuration=[
+                ec2.SubnetConfiguration(
+                    name="Public",
+                    subnet_type=ec2.SubnetType.PUBLIC,
+                    cidr_mask=24
+                ),
+                ec2.SubnetConfiguration(
+                    name="Private",
+                    subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS, # Private subnets with NAT for outbound internet
+                    cidr_mask=24
+                ),
+                ec2.SubnetConfiguration(
+                    name="Isolated",
+                    subnet_type=ec2.SubnetType.PRIVATE_ISOLATED, # Isolated subnets for RDS (no internet access)
+                    cidr_mask=24
+                )
+            ]
+        )
+
+        # gateway endpoints are free and attach to the private route tables
+        self.gateway_endpoints = {}
+        for name in network_config.get('gateway_endpoints') or []:
+            if name not in GATEWAY_ENDPOINTS:
+                raise ValueError(f"unsupported gateway endpoint '{name}', use one of {sorted(GATEWAY_ENDPOINTS)}")
+            self.gateway_endpoints[name] = self.vpc.add_gateway_endpoint(
+                f'{name}-endpoint',
+                service=GATEWAY_ENDPOINTS[name],
+                subnets=[
+                    ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
+                    ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_ISOLATED),
+                ]
+            )
+
+        # interface endpoints with private DNS so the AWS SDKs resolve them transparently
+        self.interface_endpoints = {}
+        for name in network_config.get('interface_endpoints') or []:
+            if name not in INTERFACE_ENDPOINTS:
+                raise ValueError(f"unsupported interface endpoint '{name}', use one of {sorted(INTERFACE_ENDPOINTS)}")
+            self.interface_endpoints[name] = self.vpc.add_interface_endpoint(
+                f'{name}-endpoint',
+                service=INTERFACE_ENDPOINTS[name],
+                subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
+                private_dns_enabled=True,
+            )
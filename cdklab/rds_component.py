@@ -5,6 +5,8 @@ import aws_cdk.aws_iam as iam
 import aws_cdk.aws_rds as rds
 import constructs
 
+from cdklab.app_config import AuroraCapacity
+
 
 class RDSComponent(constructs.Construct):
     def __init__(
@@ -15,6 +17,7 @@ class RDSComponent(constructs.Construct):
             vpc: ec2.IVpc,
             ecs_task_role: iam.Role,
             config: dict,
+            capacity: AuroraCapacity,
             **kwargs
     ) -> None:
         super().__init__(scope, construct_id)
@@ -35,8 +38,8 @@ class RDSComponent(constructs.Construct):
             storage_encrypted=True,
             credentials=rds.Credentials.from_generated_secret(config.get("database_name")),
             default_database_name=config.get("database_name"),
-            serverless_v2_max_capacity=config.get("db_max_acu", 16),
-            serverless_v2_min_capacity=config.get("db_min_acu", 0.5),
+            serverless_v2_max_capacity=capacity.max_acu,
+            serverless_v2_min_capacity=capacity.min_acu,
             vpc=vpc,
             backup=rds.BackupProps(
                 retention=cdk.Duration.days(7),
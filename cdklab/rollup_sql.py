@@ -0,0 +1,61 @@
+# athena sql for the hourly rollups, generated from the event table columns
+
+
+def struct_fields(type_string: str) -> dict:
+    """Top level fields of a glue struct type, e.g. struct<os:string,ip:string>."""
+    if not (type_string.startswith("struct<") and type_string.endswith(">")):
+        return {}
+    fields, depth, current = {}, 0, ""
+    for char in type_string[len("struct<"):-1] + ",":
+        if char == "," and depth == 0:
+            name, _, field_type = current.partition(":")
+            fields[name.strip()] = field_type.strip()
+            current = ""
+            continue
+        depth += {"<": 1, ">": -1}.get(char, 0)
+        current += char
+    return fields
+
+
+def dimension_column(columns: dict, dimension: str) -> tuple:
+    """Resolve a dimension like 'device.os' to its select expression, column name and type."""
+    name, *path = dimension.split(".")
+    if name not in columns:
+        raise ValueError(f"unsupported rollup dimension '{dimension}', use one of {sorted(columns)}")
+    column_type = columns[name]
+    for field in path:
+        fields = struct_fields(column_type)
+        if field not in fields:
+            raise ValueError(f"unsupported rollup dimension '{dimension}', '{field}' is not a field of {column_type}")
+        column_type = fields[field]
+    if column_type.startswith(("struct<", "array<", "map<")):
+        raise ValueError(f"unsupported rollup dimension '{dimension}', group by a primitive field of {column_type}")
+    expression = ".".join(f'"{part}"' for part in [name, *path])
+    return expression, "_".join([name, *path]), column_type
+
+
+def rollup_columns(columns: dict, dimensions: list) -> list:
+    """(name, type) columns of the rollup table, excluding the dt partition."""
+    return [dimension_column(columns, dimension)[1:] for dimension in dimensions] + [("event_count", "bigint")]
+
+
+def rollup_insert_sql(database: str, source_table: str, target_table: str, columns: dict, dimensions: list) -> str:
+    """INSERT INTO the rollup table for one hour, with {dt} left to fill in.
+
+    The event table is pruned to the hour's dt partition, a filter on the event time
+    alone would scan the whole table every hour.
+    """
+    resolved = [dimension_column(columns, dimension) for dimension in dimensions]
+
+    select = ",\n    ".join(
+        [f'{expression} AS "{alias}"' for expression, alias, _ in resolved]
+        + ['count(*) AS "event_count"', """'{dt}' AS "dt\""""]
+    )
+    group_by = ", ".join(expression for expression, _, _ in resolved)
+    return (
+        f'INSERT INTO "{database}"."{target_table}"\n'
+        f"SELECT\n    {select}\n"
+        f'FROM "{database}"."{source_table}"\n'
+        "WHERE dt = '{dt}'\n"
+        f"GROUP BY {group_by}"
+    )
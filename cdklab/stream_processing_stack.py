@@ -0,0 +1,24 @@
+from aws_cdk import Stack
+from constructs import Construct
+from cdklab.app_config import AppConfig
+from cdklab.cdklab_stack import LabDeployStack
+from cdklab.event_stack import AnalyticsDeployStack
+from cdklab.stream_processor_component import StreamProcessorComponent
+
+
+class StreamProcessingStack(Stack):
+
+    def __init__(self, scope: Construct, construct_id: str, app_config: dict, vpc, lab: LabDeployStack, analytics: AnalyticsDeployStack, *, capacity: AppConfig, **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        self.processor = StreamProcessorComponent(
+            self,
+            "aggregator",
+            config=app_config["analytics"]["stream_processing"],
+            memory_size=capacity.lambda_memory['stream_processing'],
+            capacity=capacity.stream,
+            vpc=vpc,
+            stream=analytics.stream,
+            redis=lab.redis,
+            redis_security_group=lab.redis_security_group,
+        )
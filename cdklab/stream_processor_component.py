@@ -0,0 +1,106 @@
+import aws_cdk as cdk
+import aws_cdk.aws_ec2 as ec2
+import aws_cdk.aws_elasticache as el
+import aws_cdk.aws_iam as iam
+import aws_cdk.aws_kinesis as kinesis
+import aws_cdk.aws_lambda as lmb
+import aws_cdk.aws_lambda_event_sources as event_sources
+import aws_cdk.aws_logs as logs
+import constructs
+
+from cdklab.app_config import StreamCapacity
+
+
+class StreamProcessorComponent(constructs.Construct):
+    """Lambda aggregating the event stream into redis in near real time."""
+
+    def __init__(
+            self,
+            scope: constructs.Construct,
+            construct_id: str,
+            *,
+            config: dict,
+            memory_size: int,
+            capacity: StreamCapacity,
+            vpc: ec2.IVpc,
+            stream: kinesis.CfnStream,
+            redis: el.CfnReplicationGroup,
+            redis_security_group: ec2.ISecurityGroup,
+            **kwargs
+    ):
+        super().__init__(scope, construct_id)
+
+        stack = cdk.Stack.of(self)
+
+        self.role = iam.Role(
+            self,
+            'role',
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole"),
+                iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaVPCAccessExecutionRole")
+            ],
+        )
+
+        self.security_group = ec2.SecurityGroup(
+            self,
+            'sg',
+            vpc=vpc,
+            allow_all_outbound=True
+        )
+
+        # allow access to redis, the rule lives in this stack so the lab stack is left untouched
+        ec2.CfnSecurityGroupIngress(
+            self,
+            'redis-ingress',
+            group_id=redis_security_group.security_group_id,
+            source_security_group_id=self.security_group.security_group_id,
+            ip_protocol='tcp',
+            from_port=6379,
+            to_port=6379,
+            description='stream processor redis connection [CDK]'
+        )
+
+        self.function = lmb.Function(
+            self,
+            'fn',
+            function_name=f"{stack.stack_name}-aggregator",
+            code=lmb.Code.from_asset(path='./lambda', exclude=["__pycache__"]),
+            runtime=lmb.Runtime('python3.11'),
+            handler="stream_aggregator.handler",
+            role=self.role,
+            memory_size=memory_size,
+            timeout=cdk.Duration.seconds(config.get('timeout_seconds', 60)),
+            vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
+            security_groups=[self.security_group],
+            log_group=logs.LogGroup(
+                self,
+                "log_group",
+                log_group_name=f"{stack.stack_name}-aggregator",
+                retention=logs.RetentionDays.ONE_MONTH,
+                removal_policy=cdk.RemovalPolicy.DESTROY,
+            ),
+            environment={
+                "REDIS_HOST": redis.attr_primary_end_point_address,
+                "REDIS_PORT": redis.attr_primary_end_point_port,
+                "REDIS_TTL_SECONDS": str(config.get('redis_ttl_seconds', 86400)),
+                # windows with more sessions are flushed early, lambda caps the state at 1 MB
+                "MAX_STATE_BYTES": str(config.get('max_state_kb', 800) * 1024),
+                "SESSION_RANK_SIZE": str(config.get('session_rank_size', 1000)),
+            },
+        )
+
+        # tumbling windows keep the aggregation state in lambda between invocations of a window
+        tumbling_window_seconds = config.get('tumbling_window_seconds')
+        self.function.add_event_source(event_sources.KinesisEventSource(
+            kinesis.Stream.from_stream_arn(self, 'stream', stream.attr_arn),
+            starting_position=lmb.StartingPosition.LATEST,
+            batch_size=config.get('batch_size', 500),
+            max_batching_window=cdk.Duration.seconds(config.get('max_batching_window_seconds', 5)),
+            parallelization_factor=capacity.parallelization_factor,
+            tumbling_window=cdk.Duration.seconds(tumbling_window_seconds) if tumbling_window_seconds else None,
+            bisect_batch_on_error=config.get('bisect_batch_on_error', True),
+            retry_attempts=config.get('retry_attempts', 3),
+            max_record_age=cdk.Duration.seconds(config.get('max_record_age_seconds', 3600)),
+        ))
@@ -0,0 +1,252 @@
+import argparse
+import datetime
+import logging
+import uuid
+
+import boto3
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# firehose writes one hive style partition per arrival hour
+PARTITION_KEY = "dt"
+PARTITION_FORMAT = "%Y-%m-%d-%H"
+
+# queries filter on these, sorted files keep the parquet min/max statistics selective.
+# createts is filled from the producers' create_ts key by the firehose deserializer.
+SORT_KEYS = ["app_id", "event_type", "createts"]
+
+# raw files merged into a compacted run, hidden from athena by the leading underscore
+MANIFEST = "_sources"
+
+RUN_PREFIX = "run="
+RUN_TIME_FORMAT = "%Y%m%d%H%M%S"
+
+
+def hour_floor(now: datetime.datetime) -> datetime.datetime:
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+def open_partitions(now: datetime.datetime) -> list:
+    """The current and next hour, registered ahead so fresh data is queryable."""
+    current = hour_floor(now)
+    return [(current + datetime.timedelta(hours=offset)).strftime(PARTITION_FORMAT) for offset in (0, 1)]
+
+
+def closed_partitions(now: datetime.datetime, lookback_hours: int, min_age_hours: int) -> list:
+    """Hours firehose no longer writes to, oldest first."""
+    current = hour_floor(now)
+    return [
+        (current - datetime.timedelta(hours=age)).strftime(PARTITION_FORMAT)
+        for age in range(lookback_hours, min_age_hours - 1, -1)
+    ]
+
+
+def data_files(filesystem: pafs.FileSystem, directory: str) -> list:
+    """Parquet objects under a partition, skipping hidden and temporary files like athena does."""
+    selector = pafs.FileSelector(directory, recursive=True, allow_not_found=True)
+    return sorted(
+        info.path for info in filesystem.get_file_info(selector)
+        if info.type == pafs.FileType.File and not info.base_name.startswith(("_", "."))
+    )
+
+
+def rows_per_file(total_rows: int, input_bytes: int, target_bytes: int) -> int:
+    """Estimate the rows of a target sized file from the size of the input files."""
+    if not total_rows:
+        return 0
+    return min(total_rows, max(1, int(total_rows * target_bytes / max(input_bytes, 1))))
+
+
+def merge(table, file_rows: int) -> list:
+    """Sort the partition and slice it into consecutive, non overlapping files."""
+    sort_keys = [(key, "ascending") for key in SORT_KEYS if key in table.column_names]
+    if sort_keys:
+        table = table.sort_by(sort_keys)
+    if not file_rows:
+        return []
+    return [table.slice(offset, file_rows) for offset in range(0, table.num_rows, file_rows)]
+
+
+def compact_files(filesystem: pafs.FileSystem, sources: list, target_dir: str, target_bytes: int, compression: str = "snappy") -> list:
+    """Merge the source files into target sized, sorted files under target_dir."""
+    input_bytes = sum(info.size for info in filesystem.get_file_info(sources))
+    table = ds.dataset(sources, filesystem=filesystem, format="parquet").to_table()
+
+    filesystem.create_dir(target_dir, recursive=True)
+    written = []
+    for index, part in enumerate(merge(table, rows_per_file(table.num_rows, input_bytes, target_bytes))):
+        path = f"{target_dir}/part-{index:05d}.parquet"
+        pq.write_table(part, path, filesystem=filesystem, compression=compression)
+        written.append(path)
+    return written
+
+
+def s3_uri(path: str) -> str:
+    return f"s3://{path.rstrip('/')}/"
+
+
+def partition_location(glue, database: str, table: str, value: str):
+    try:
+        partition = glue.get_partition(DatabaseName=database, TableName=table, PartitionValues=[value])
+    except glue.exceptions.EntityNotFoundException:
+        return None
+    return partition["Partition"]["StorageDescriptor"]["Location"]
+
+
+def partition_input(value: str, location: str, storage_descriptor: dict) -> dict:
+    return {
+        "Values": [value],
+        "StorageDescriptor": {**storage_descriptor, "Location": location},
+    }
+
+
+def set_partition_location(glue, database: str, table: str, value: str, location: str, storage_descriptor: dict, exists: bool) -> None:
+    """Point a partition at a new location, readers switch over in a single catalog update."""
+    if exists:
+        glue.update_partition(
+            DatabaseName=database,
+            TableName=table,
+            PartitionValueList=[value],
+            PartitionInput=partition_input(value, location, storage_descriptor),
+        )
+    else:
+        glue.create_partition(
+            DatabaseName=database,
+            TableName=table,
+            PartitionInput=partition_input(value, location, storage_descriptor),
+        )
+
+
+def read_manifest(filesystem: pafs.FileSystem, run_dir: str) -> set:
+    """Raw files merged into a compacted run, empty for a run without a manifest."""
+    try:
+        with filesystem.open_input_stream(f"{run_dir}/{MANIFEST}") as manifest:
+            return set(manifest.read().decode("utf-8").split())
+    except FileNotFoundError:
+        return set()
+
+
+def write_manifest(filesystem: pafs.FileSystem, run_dir: str, sources: list) -> None:
+    with filesystem.open_output_stream(f"{run_dir}/{MANIFEST}") as manifest:
+        manifest.write("".join(f"{path}\n" for path in sources).encode("utf-8"))
+
+
+def run_started(run_dir: str):
+    """Start time of the run that wrote run_dir, None for a directory not named by run()."""
+    stamp = run_dir.rsplit("/", 1)[-1][len(RUN_PREFIX):].split("-", 1)[0]
+    try:
+        return datetime.datetime.strptime(stamp, RUN_TIME_FORMAT).replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
+
+def replaced_runs(filesystem: pafs.FileSystem, compacted_dir: str, current_dir: str) -> list:
+    """Run directories of a partition other than the one the catalog points at."""
+    selector = pafs.FileSelector(compacted_dir, allow_not_found=True)
+    return sorted(
+        info.path for info in filesystem.get_file_info(selector)
+        if info.type == pafs.FileType.Directory and info.base_name.startswith(RUN_PREFIX) and info.path != current_dir
+    )
+
+
+def compact_partition(glue, filesystem: pafs.FileSystem, options, value: str, storage_descriptor: dict, run_id: str, now: datetime.datetime) -> list:
+    """Compact one closed hour, returning the files written.
+
+    Raw files arriving after the hour was compacted, from late or retried firehose
+    deliveries, are merged with the current compacted files into a new run.
+
+    Nothing is deleted at the swap, queries planned against the old location still
+    read it. The raw files and replaced runs are deleted by the first run after
+    `delete_grace_minutes` have passed since the swap.
+    """
+    raw_dir = f"{options.bucket}/{options.raw_prefix}/{PARTITION_KEY}={value}"
+    compacted_dir = f"{options.bucket}/{options.compacted_prefix}/{PARTITION_KEY}={value}"
+    location = partition_location(glue, options.database, options.table, value)
+    sources = data_files(filesystem, raw_dir)
+    current, leftover = [], []
+
+    if location is not None and location != s3_uri(raw_dir):
+        current_dir = location[len("s3://"):].rstrip("/")
+        merged = read_manifest(filesystem, current_dir)
+        swapped = run_started(current_dir)
+        expired = swapped is None or now - swapped >= datetime.timedelta(minutes=options.delete_grace_minutes)
+        if expired:
+            for path in sources:
+                if path in merged:
+                    filesystem.delete_file(path)
+            for run_dir in replaced_runs(filesystem, compacted_dir, current_dir):
+                filesystem.delete_dir(run_dir)
+        else:
+            # raw files still waiting for their delete stay listed in the next manifest
+            leftover = [path for path in sources if path in merged]
+        sources = [path for path in sources if path not in merged]
+        if not sources:
+            return []
+        current = data_files(filesystem, current_dir)
+    elif len(sources) < options.min_files:
+        if sources and location is None:
+            set_partition_location(glue, options.database, options.table, value, s3_uri(raw_dir), storage_descriptor, exists=False)
+        return []
+
+    # a fresh directory per run, readers never see a partially written partition
+    target_dir = f"{compacted_dir}/{RUN_PREFIX}{run_id}"
+    written = compact_files(filesystem, current + sources, target_dir, options.target_file_size_mb * 1024 * 1024, options.compression)
+    write_manifest(filesystem, target_dir, sorted(leftover + sources))
+    set_partition_location(glue, options.database, options.table, value, s3_uri(target_dir), storage_descriptor, exists=location is not None)
+
+    logger.info("compacted %s: %s raw and %s compacted files into %s", value, len(sources), len(current), len(written))
+    return written
+
+
+def run(glue, filesystem: pafs.FileSystem, options, now: datetime.datetime) -> dict:
+    storage_descriptor = glue.get_table(DatabaseName=options.database, Name=options.table)["Table"]["StorageDescriptor"]
+    run_id = f"{now.strftime(RUN_TIME_FORMAT)}-{uuid.uuid4().hex[:8]}"
+
+    for value in open_partitions(now):
+        if partition_location(glue, options.database, options.table, value) is None:
+            raw_dir = f"{options.bucket}/{options.raw_prefix}/{PARTITION_KEY}={value}"
+            set_partition_location(glue, options.database, options.table, value, s3_uri(raw_dir), storage_descriptor, exists=False)
+
+    compacted = {}
+    for value in closed_partitions(now, options.lookback_hours, options.min_age_hours):
+        written = compact_partition(glue, filesystem, options, value, storage_descriptor, run_id, now)
+        if written:
+            compacted[value] = written
+    return compacted
+
+
+def parse_options(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--raw_prefix", required=True)
+    parser.add_argument("--compacted_prefix", required=True)
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--target_file_size_mb", type=int, default=128)
+    parser.add_argument("--min_files", type=int, default=2)
+    parser.add_argument("--min_age_hours", type=int, default=1)
+    parser.add_argument("--lookback_hours", type=int, default=24)
+    parser.add_argument("--compression", default="snappy")
+    parser.add_argument("--delete_grace_minutes", type=int, default=30)
+    # glue adds its own job arguments
+    options, _ = parser.parse_known_args(argv)
+    return options
+
+
+def main():
+    options = parse_options()
+    compacted = run(
+        boto3.client("glue"),
+        pafs.S3FileSystem(),
+        options,
+        datetime.datetime.now(datetime.timezone.utc),
+    )
+    logger.info("compacted %s partitions", len(compacted))
+
+
+if __name__ == "__main__":
+    main()
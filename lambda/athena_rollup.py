@@ -0,0 +1,100 @@
+import os
+import json
+import datetime
+import logging
+import boto3
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PARTITION_FORMAT = "%Y-%m-%d-%H"
+
+# statements a read only query may start with
+READ_STATEMENTS = ("SELECT", "WITH")
+
+
+def pending_hours(now: datetime.datetime, lookback_hours: int, min_age_hours: int) -> list:
+    """Closed hours to roll up, oldest first, so a failed run is picked up by the next one."""
+    current = now.replace(minute=0, second=0, microsecond=0)
+    return [current - datetime.timedelta(hours=age) for age in range(lookback_hours, min_age_hours - 1, -1)]
+
+
+def render(template: str, hour: datetime.datetime) -> str:
+    return template.format(dt=hour.strftime(PARTITION_FORMAT))
+
+
+def partition_exists(glue, database: str, table: str, value: str) -> bool:
+    try:
+        glue.get_partition(DatabaseName=database, TableName=table, PartitionValues=[value])
+    except glue.exceptions.EntityNotFoundException:
+        return False
+    return True
+
+
+def start_rollups(athena, glue, queries: dict, hours: list, database: str, workgroup: str) -> list:
+    """Start the INSERT of every rollup hour not in the catalog yet, returning the execution ids."""
+    executions = []
+    for table, template in queries.items():
+        for hour in hours:
+            # inserting twice would double the counts
+            if partition_exists(glue, database, table, hour.strftime(PARTITION_FORMAT)):
+                continue
+            response = athena.start_query_execution(
+                QueryString=render(template, hour),
+                QueryExecutionContext={"Database": database},
+                WorkGroup=workgroup,
+            )
+            executions.append(response["QueryExecutionId"])
+            logger.info("started %s rollup for %s: %s", table, hour.strftime(PARTITION_FORMAT), response["QueryExecutionId"])
+    return executions
+
+
+def start_read_query(athena, query: str, database: str, workgroup: str, reuse_max_age_minutes: int) -> str:
+    """Start a dashboard query, answered from a result up to reuse_max_age_minutes old.
+
+    Only read only queries may reuse results, an INSERT has to run every time.
+    """
+    if not query.lstrip().upper().startswith(READ_STATEMENTS):
+        raise ValueError(f"only read only queries starting with {READ_STATEMENTS} can reuse results")
+    request = {
+        "QueryString": query,
+        "QueryExecutionContext": {"Database": database},
+        "WorkGroup": workgroup,
+    }
+    if reuse_max_age_minutes:
+        request["ResultReuseConfiguration"] = {
+            "ResultReuseByAgeConfiguration": {"Enabled": True, "MaxAgeInMinutes": reuse_max_age_minutes},
+        }
+    return athena.start_query_execution(**request)["QueryExecutionId"]
+
+
+def handler(event, context):
+    # dashboards start their reads with {"query": "SELECT ..."}, the rollups change once an hour
+    if event.get("query"):
+        execution = start_read_query(
+            boto3.client("athena"),
+            event["query"],
+            os.getenv("DATABASE", ""),
+            os.getenv("WORKGROUP", ""),
+            int(os.getenv("RESULT_REUSE_MAX_AGE_MINUTES", "0")),
+        )
+        return {"executions": [execution]}
+
+    # a single hour can be backfilled with {"hour": "yyyy-mm-dd-hh"}
+    if event.get("hour"):
+        hours = [datetime.datetime.strptime(event["hour"], PARTITION_FORMAT)]
+    else:
+        hours = pending_hours(
+            datetime.datetime.now(datetime.timezone.utc),
+            int(os.getenv("LOOKBACK_HOURS", "3")),
+            int(os.getenv("MIN_AGE_HOURS", "1")),
+        )
+    executions = start_rollups(
+        boto3.client("athena"),
+        boto3.client("glue"),
+        json.loads(os.getenv("ROLLUP_QUERIES", "{}")),
+        hours,
+        os.getenv("DATABASE", ""),
+        os.getenv("WORKGROUP", ""),
+    )
+    return {"executions": executions}
@@ -2,9 +2,10 @@ import os
 import json
 import datetime
 import logging
-import uuid
 import boto3
 
+from partition_keys import record_entry, settings_from_env
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
@@ -16,11 +17,9 @@ def handler(event, context):
             event_data["create_ts"]= datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
             data = json.dumps(event_data)
             payload = str(data) + "\n"
-            partition_key = event_data.get("session_id") if event_data.get("session_id") else str(uuid.uuid4())
             kinesis.put_record(
                     StreamName=os.getenv('KDS_NAME', ''),
-                    Data=payload,
-                    PartitionKey=partition_key)
+                    **record_entry(event_data, payload, settings_from_env()))
             logger.debug('data ingested in Kinesis...')
             return {
                 'statusCode': 200,
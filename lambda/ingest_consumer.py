@@ -0,0 +1,90 @@
+import os
+import json
+import datetime
+import logging
+import boto3
+
+from partition_keys import record_entry, settings_from_env
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# PutRecords limits
+MAX_RECORDS_PER_PUT = 500
+MAX_BYTES_PER_PUT = 5 * 1024 * 1024
+
+_kinesis = None
+
+
+def kinesis_client():
+    # reuse the client across invocations of a warm container
+    global _kinesis
+    if _kinesis is None:
+        _kinesis = boto3.client('kinesis')
+    return _kinesis
+
+
+def to_kinesis_record(message: dict, settings: dict = None) -> dict:
+    """Build a PutRecords entry from an SQS message queued by API Gateway."""
+    event_data = json.loads(message["body"])
+    if not isinstance(event_data, dict):
+        raise ValueError("event data must be a JSON object")
+    # the event was accepted when it was queued, not when it is drained
+    sent_ts = int(message["attributes"]["SentTimestamp"]) / 1000
+    event_data["create_ts"] = datetime.datetime.fromtimestamp(sent_ts, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+    return record_entry(event_data, (json.dumps(event_data) + "\n").encode("utf-8"), settings or settings_from_env())
+
+
+def batches(entries: list):
+    """Split (message id, record) pairs into PutRecords sized batches."""
+    batch, batch_bytes = [], 0
+    for message_id, record in entries:
+        record_bytes = len(record["Data"]) + len(record["PartitionKey"].encode("utf-8"))
+        if batch and (len(batch) == MAX_RECORDS_PER_PUT or batch_bytes + record_bytes > MAX_BYTES_PER_PUT):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append((message_id, record))
+        batch_bytes += record_bytes
+    if batch:
+        yield batch
+
+
+def process_records(records: list, kinesis, stream_name: str, settings: dict = None) -> list:
+    """Write the SQS messages to Kinesis, returning the ids of the messages to retry."""
+    settings = settings or settings_from_env()
+    failures = []
+    entries = []
+    for message in records:
+        try:
+            entries.append((message["messageId"], to_kinesis_record(message, settings)))
+        except (KeyError, TypeError, ValueError) as error:
+            # leave malformed messages on the queue so they end up in the dead letter queue
+            logger.error("malformed message %s: %s", message.get("messageId"), error)
+            failures.append(message.get("messageId"))
+
+    for batch in batches(entries):
+        try:
+            response = kinesis.put_records(
+                StreamName=stream_name,
+                Records=[record for _, record in batch]
+            )
+        except Exception as error:
+            logger.exception(error)
+            failures.extend(message_id for message_id, _ in batch)
+            continue
+
+        # PutRecords is not atomic, only retry the throttled or failed entries
+        if response.get("FailedRecordCount"):
+            for (message_id, _), result in zip(batch, response["Records"]):
+                if result.get("ErrorCode"):
+                    failures.append(message_id)
+
+    logger.info("wrote %s of %s records to Kinesis", len(records) - len(failures), len(records))
+    return failures
+
+
+def handler(event, context):
+    failures = process_records(event.get("Records", []), kinesis_client(), os.getenv('KDS_NAME', ''))
+    return {
+        "batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]
+    }
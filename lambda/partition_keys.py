@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import uuid
+import hashlib
+import argparse
+
+# kinesis maps the md5 of the partition key onto the 128 bit hash key space
+HASH_KEY_SPACE = 2 ** 128
+
+# strategy -> the event fields identifying the key, in order of preference
+FIELD_STRATEGIES = {
+    "session": ["session_id"],
+    "user": ["user_id", "session_id"],
+    "app": ["app_id"],
+}
+STRATEGIES = sorted(FIELD_STRATEGIES) + ["balanced", "composite"]
+
+COMPOSITE_SEPARATOR = "|"
+
+
+def md5_hash_key(value: str) -> int:
+    return int(hashlib.md5(value.encode("utf-8")).hexdigest(), 16)
+
+
+def shard_index(hash_key: int, shard_count: int, ranges: list = None) -> int:
+    """Shard owning a hash key.
+
+    Without `ranges` the stream is assumed split into equal hash key ranges, which
+    only holds until a shard is split or merged.
+    """
+    if ranges is None:
+        return hash_key * shard_count // HASH_KEY_SPACE
+    for index, (start, end) in enumerate(ranges):
+        if start <= hash_key <= end:
+            return index
+    raise ValueError(f"hash key {hash_key} is not covered by the shard ranges")
+
+
+def shard_ranges(list_shards: dict) -> list:
+    """Sorted (start, end) hash key ranges of the open shards in a ListShards response."""
+    return sorted(
+        (int(shard["HashKeyRange"]["StartingHashKey"]), int(shard["HashKeyRange"]["EndingHashKey"]))
+        for shard in list_shards["Shards"]
+        if "EndingSequenceNumber" not in shard.get("SequenceNumberRange", {})
+    )
+
+
+def composite_value(event: dict, fields: list):
+    values = [event.get(field) for field in fields]
+    if not all(values):
+        return None
+    return COMPOSITE_SEPARATOR.join(str(value) for value in values)
+
+
+def partition_key(event: dict, strategy: str = "session", fields: list = None, shard_count: int = 1, spread: int = 1) -> tuple:
+    """(PartitionKey, ExplicitHashKey or None) for an event.
+
+    Events missing the key fields fall back to a random key, they have no ordering to keep.
+    """
+    if strategy in FIELD_STRATEGIES:
+        for field in fields or FIELD_STRATEGIES[strategy]:
+            if event.get(field):
+                return str(event[field]), None
+        return str(uuid.uuid4()), None
+
+    if strategy not in ("composite", "balanced"):
+        raise ValueError(f"unsupported partition key strategy '{strategy}', use one of {STRATEGIES}")
+
+    value = composite_value(event, fields or FIELD_STRATEGIES["session"])
+    if value is None:
+        return str(uuid.uuid4()), None
+
+    # hashing keeps long composite values under the 256 character key limit
+    key = hashlib.md5(value.encode("utf-8")).hexdigest()
+    if strategy == "composite":
+        return key, None
+
+    # balanced only spreads hot keys, it distributes distinct keys no better than
+    # composite. a hot key goes to `spread` neighbouring shards by event id, ordering
+    # is only kept within each of them. the hash key is the middle of the shard's
+    # range assuming equal ranges, a resharded stream can map it elsewhere.
+    offset = md5_hash_key(str(event.get("event_id") or uuid.uuid4())) % spread if spread > 1 else 0
+    shard = (md5_hash_key(value) + offset) % shard_count
+    range_size = HASH_KEY_SPACE // shard_count
+    return key, str(shard * range_size + range_size // 2)
+
+
+def settings_from_env() -> dict:
+    fields = os.getenv("PARTITION_KEY_FIELDS", "")
+    return {
+        "strategy": os.getenv("PARTITION_KEY_STRATEGY", "session"),
+        "fields": [field for field in fields.split(",") if field] or None,
+        "shard_count": int(os.getenv("SHARD_COUNT", "1")),
+        "spread": int(os.getenv("PARTITION_KEY_SPREAD", "1")),
+    }
+
+
+def record_entry(event: dict, data: str, settings: dict) -> dict:
+    """Kinesis put entry for an event using the configured strategy."""
+    key, explicit_hash_key = partition_key(event, **settings)
+    entry = {"Data": data, "PartitionKey": key}
+    if explicit_hash_key is not None:
+        entry["ExplicitHashKey"] = explicit_hash_key
+    return entry
+
+
+def simulate(events: list, strategy: str, fields: list = None, shard_count: int = 1, spread: int = 1, ranges: list = None) -> dict:
+    """Per shard record and byte counts a sample of events would produce.
+
+    Pass the `ranges` of a live stream to use its real shard hash key ranges.
+    """
+    if ranges is not None:
+        shard_count = len(ranges)
+    records = [0] * shard_count
+    data_bytes = [0] * shard_count
+    keys = {}
+    for event in events:
+        key, explicit_hash_key = partition_key(event, strategy, fields, shard_count, spread)
+        hash_key = int(explicit_hash_key) if explicit_hash_key is not None else md5_hash_key(key)
+        shard = shard_index(hash_key, shard_count, ranges)
+        records[shard] += 1
+        data_bytes[shard] += len(json.dumps(event)) + 1 + len(key.encode("utf-8"))
+        keys[key] = keys.get(key, 0) + 1
+    return {"records": records, "bytes": data_bytes, "keys": keys}
+
+
+def imbalance_report(simulation: dict, top_keys: int = 5) -> dict:
+    """Max to mean ratio of the shard loads, 1.0 is a perfectly even stream."""
+    records = simulation["records"]
+    total = sum(records)
+    mean = total / len(records) if records else 0
+    return {
+        "shards": [
+            {"shard": index, "records": count, "bytes": simulation["bytes"][index], "share": count / total if total else 0}
+            for index, count in enumerate(records)
+        ],
+        "imbalance": max(records) / mean if mean else 0,
+        "distinct_keys": len(simulation["keys"]),
+        "hot_keys": sorted(simulation["keys"].items(), key=lambda item: item[1], reverse=True)[:top_keys],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="simulate the shard load of an event sample, one JSON event per line")
+    parser.add_argument("sample")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--shards-file", help="output of `aws kinesis list-shards`, overrides --shards")
+    parser.add_argument("--strategy", action="append", choices=STRATEGIES)
+    parser.add_argument("--fields", default="")
+    parser.add_argument("--spread", type=int, default=1)
+    options = parser.parse_args(argv)
+
+    with open(options.sample, "r") as sample_file:
+        events = [json.loads(line) for line in sample_file if line.strip()]
+    fields = [field for field in options.fields.split(",") if field] or None
+    ranges = None
+    if options.shards_file:
+        with open(options.shards_file, "r") as shards_file:
+            ranges = shard_ranges(json.load(shards_file))
+
+    for strategy in options.strategy or STRATEGIES:
+        report = imbalance_report(simulate(events, strategy, fields, options.shards, options.spread, ranges))
+        sys.stdout.write(f"{strategy}: imbalance {report['imbalance']:.2f}, {report['distinct_keys']} keys\n")
+        for shard in report["shards"]:
+            sys.stdout.write(f"  shard {shard['shard']}: {shard['records']} records, {shard['bytes']} bytes, {shard['share']:.1%}\n")
+        for key, count in report["hot_keys"]:
+            sys.stdout.write(f"  hot key {key}: {count}\n")
+
+
+if __name__ == "__main__":
+    main()
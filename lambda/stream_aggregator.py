@@ -0,0 +1,262 @@
+import os
+import json
+import base64
+import hashlib
+import datetime
+import logging
+import socket
+import ssl
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+COUNT_SEPARATOR = "|"
+
+# keep the earliest first_ts and latest last_ts of a session and rank its duration per
+# app, only the ARGV[5] longest sessions stay ranked
+SESSION_SCRIPT = """
+local first = redis.call('HGET', KEYS[1], 'first_ts')
+if (not first) or tonumber(ARGV[1]) < tonumber(first) then
+    redis.call('HSET', KEYS[1], 'first_ts', ARGV[1])
+    first = ARGV[1]
+end
+local last = redis.call('HGET', KEYS[1], 'last_ts')
+if (not last) or tonumber(ARGV[2]) > tonumber(last) then
+    redis.call('HSET', KEYS[1], 'last_ts', ARGV[2])
+    last = ARGV[2]
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], tonumber(last) - tonumber(first), ARGV[4])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[5]) - 1)
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+SESSION_SCRIPT_SHA = hashlib.sha1(SESSION_SCRIPT.encode("utf-8")).hexdigest()
+
+# add the counters once per flush marker, KEYS[1], a retried flush finds it set.
+# then pairs of window and total hash keys with their event type and count in ARGV
+COUNTS_SCRIPT = """
+if not redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+for i = 1, (#KEYS - 1) / 2 do
+    local field, count = ARGV[2 * i], ARGV[2 * i + 1]
+    redis.call('HINCRBY', KEYS[2 * i], field, count)
+    redis.call('EXPIRE', KEYS[2 * i], ARGV[1])
+    redis.call('HINCRBY', KEYS[2 * i + 1], field, count)
+end
+return 1
+"""
+COUNTS_SCRIPT_SHA = hashlib.sha1(COUNTS_SCRIPT.encode("utf-8")).hexdigest()
+
+# sessions ranked by duration per app
+SESSION_RANK_SIZE = 1000
+
+# lambda caps the state carried between invocations of a tumbling window at 1 MB
+MAX_STATE_BYTES = 800 * 1024
+
+_scripts_loaded = False
+
+
+class RedisPipeline:
+    """Minimal RESP client sending a batch of commands in one round trip.
+
+    The Lambda runtime has no redis package, the handful of commands used
+    here don't justify bundling one.
+    """
+
+    def __init__(self, host: str, port: int, use_tls: bool = True, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.commands = []
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+        return self
+
+    def encode(self) -> bytes:
+        payload = bytearray()
+        for command in self.commands:
+            payload += f"*{len(command)}\r\n".encode()
+            for arg in command:
+                value = str(arg).encode("utf-8")
+                payload += f"${len(value)}\r\n".encode() + value + b"\r\n"
+        return bytes(payload)
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        if self.use_tls:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+        return sock
+
+    def execute(self, raise_on_error: bool = True) -> list:
+        if not self.commands:
+            return []
+        with self.connect() as sock:
+            sock.sendall(self.encode())
+            reader = sock.makefile("rb")
+            replies = [read_reply(reader) for _ in self.commands]
+        self.commands = []
+        errors = [reply for reply in replies if isinstance(reply, RedisError)]
+        if errors and raise_on_error:
+            raise errors[0]
+        return replies
+
+
+class RedisError(Exception):
+    pass
+
+
+def read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("connection closed by redis")
+    prefix, body = line[:1], line[1:-2].decode("utf-8")
+    if prefix == b"+":
+        return body
+    if prefix == b"-":
+        return RedisError(body)
+    if prefix == b":":
+        return int(body)
+    if prefix == b"$":
+        length = int(body)
+        if length == -1:
+            return None
+        value = reader.read(length + 2)[:-2]
+        return value.decode("utf-8")
+    if prefix == b"*":
+        length = int(body)
+        return None if length == -1 else [read_reply(reader) for _ in range(length)]
+    raise RedisError(f"unexpected reply {line!r}")
+
+
+def parse_ts(value) -> float:
+    """Epoch seconds from the ingest create_ts format."""
+    parsed = datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+    return parsed.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def aggregate(records: list, state: dict = None) -> dict:
+    """Fold Kinesis records into per app_id/event_type counts and per session first/last timestamps."""
+    state = state or {}
+    counts = state.setdefault("counts", {})
+    sessions = state.setdefault("sessions", {})
+    for record in records:
+        # the last record folded in names the flush, see flush()
+        state["last_record"] = record.get("eventID") or record.get("kinesis", {}).get("sequenceNumber")
+        try:
+            event = json.loads(base64.b64decode(record["kinesis"]["data"]))
+            app_id = event.get("app_id") or "unknown"
+            event_type = event.get("event_type") or "unknown"
+            key = f"{app_id}{COUNT_SEPARATOR}{event_type}"
+            counts[key] = counts.get(key, 0) + 1
+
+            session_id = event.get("session_id")
+            created = event.get("create_ts") or event.get("createts")
+            if session_id and created:
+                ts = parse_ts(created)
+                current = sessions.get(session_id)
+                if current:
+                    current[1] = min(current[1], ts)
+                    current[2] = max(current[2], ts)
+                else:
+                    sessions[session_id] = [app_id, ts, ts]
+        except (KeyError, TypeError, ValueError) as error:
+            # a malformed event must not block the shard
+            logger.error("skipping record %s: %s", record.get("kinesis", {}).get("sequenceNumber"), error)
+    return state
+
+
+def send(pipeline: RedisPipeline, commands: list) -> list:
+    for command in commands:
+        pipeline.execute_command(*command)
+    return pipeline.execute(raise_on_error=False)
+
+
+def flush(state: dict, pipeline: RedisPipeline, window_start: str, ttl_seconds: int, rank_size: int = SESSION_RANK_SIZE) -> list:
+    """Write the aggregates to redis in a single pipelined round trip.
+
+    The counters are added once per last record folded into the state, so a retried
+    invocation doesn't count its records twice. A batch bisected after a
+    failed flush ends on another record and can still be counted again.
+    The scripts are loaded once per container and then called by their sha.
+    """
+    global _scripts_loaded
+    load = [("SCRIPT", "LOAD", SESSION_SCRIPT), ("SCRIPT", "LOAD", COUNTS_SCRIPT)]
+    commands = [] if _scripts_loaded else list(load)
+    counts = state.get("counts", {})
+    if counts:
+        keys, args = [f"flushed:{state.get('last_record')}"], [ttl_seconds]
+        for key, count in counts.items():
+            app_id, event_type = key.split(COUNT_SEPARATOR, 1)
+            keys += [f"events:{app_id}:{window_start}", f"events:{app_id}:total"]
+            args += [event_type, count]
+        commands.append(("EVALSHA", COUNTS_SCRIPT_SHA, len(keys), *keys, *args))
+    for session_id, (app_id, first_ts, last_ts) in state.get("sessions", {}).items():
+        commands.append((
+            "EVALSHA", SESSION_SCRIPT_SHA, 2,
+            f"session:{session_id}", f"session_durations:{app_id}",
+            first_ts, last_ts, ttl_seconds, session_id, rank_size
+        ))
+
+    replies = send(pipeline, commands)
+    _scripts_loaded = True
+
+    # a restarted or failed over redis has lost the scripts, both are safe to run
+    # again so the calls that weren't applied are sent again
+    missing = [
+        index for index, reply in enumerate(replies)
+        if isinstance(reply, RedisError) and str(reply).startswith("NOSCRIPT")
+    ]
+    if missing:
+        retried = send(pipeline, load + [commands[index] for index in missing])
+        for index, reply in zip(missing, retried[len(load):]):
+            replies[index] = reply
+
+    errors = [reply for reply in replies if isinstance(reply, RedisError)]
+    if errors:
+        raise errors[0]
+    return replies
+
+
+def state_size(state: dict) -> int:
+    return len(json.dumps(state, separators=(",", ":")))
+
+
+def redis_pipeline() -> RedisPipeline:
+    return RedisPipeline(
+        os.getenv("REDIS_HOST", ""),
+        int(os.getenv("REDIS_PORT", "6379")),
+        use_tls=os.getenv("REDIS_TLS", "true") == "true",
+    )
+
+
+def handler(event, context):
+    ttl_seconds = int(os.getenv("REDIS_TTL_SECONDS", "86400"))
+    rank_size = int(os.getenv("SESSION_RANK_SIZE", str(SESSION_RANK_SIZE)))
+    window = event.get("window")
+
+    # without a tumbling window every batch is flushed on its own into the current minute
+    if not window:
+        state = aggregate(event.get("Records", []))
+        minute = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:00Z")
+        flush(state, redis_pipeline(), minute, ttl_seconds, rank_size)
+        return {}
+
+    state = aggregate(event.get("Records", []), event.get("state"))
+    if event.get("isFinalInvokeForWindow"):
+        flush(state, redis_pipeline(), window["start"], ttl_seconds, rank_size)
+        logger.info("flushed window %s, %s counters, %s sessions", window["start"], len(state["counts"]), len(state["sessions"]))
+        return {}
+
+    # counters add up under their own flush marker and the session script keeps the
+    # min/max, so part of a window can be flushed early rather than growing the state past the limit with many sessions
+    if state_size(state) > int(os.getenv("MAX_STATE_BYTES", str(MAX_STATE_BYTES))):
+        flush(state, redis_pipeline(), window["start"], ttl_seconds, rank_size)
+        logger.info("flushed window %s early, %s sessions", window["start"], len(state["sessions"]))
+        return {"state": {}}
+
+    # carried into the next invocation of the same window
+    return {"state": state}
@@ -0,0 +1,70 @@
+import json
+import os
+import re
+import sys
+
+import aws_cdk as core
+import aws_cdk.aws_ec2 as ec2
+import pytest
+from yaml import load, SafeLoader
+
+FIXTURE_CONFIG = os.path.join(os.path.dirname(__file__), "fixtures", "config.yaml")
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "snapshots")
+
+# lambda handlers and glue scripts are deployed as flat assets, make them importable in tests
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "glue"))
+
+# regenerate the stored templates with UPDATE_SNAPSHOTS=1 python -m pytest
+UPDATE_SNAPSHOTS = os.getenv("UPDATE_SNAPSHOTS") == "1"
+
+# asset hashes change whenever lambda source changes, which is not a template change
+ASSET_HASH = re.compile(r"[0-9a-f]{64}")
+
+
+@pytest.fixture
+def app_config():
+    # constructs update the nested environment maps in place, so load a fresh copy per test
+    with open(FIXTURE_CONFIG, 'r') as config_file:
+        return load(config_file, Loader=SafeLoader)
+
+
+@pytest.fixture
+def component_stack():
+    """Bare stack with its own vpc for testing a single construct."""
+    app = core.App()
+    stack = core.Stack(app, "component")
+    vpc = ec2.Vpc(stack, "vpc",
+        max_azs=2,
+        subnet_configuration=[
+            ec2.SubnetConfiguration(name="Public", subnet_type=ec2.SubnetType.PUBLIC, cidr_mask=24),
+            ec2.SubnetConfiguration(name="Private", subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS, cidr_mask=24),
+            ec2.SubnetConfiguration(name="Isolated", subnet_type=ec2.SubnetType.PRIVATE_ISOLATED, cidr_mask=24),
+        ]
+    )
+    return stack, vpc
+
+
+@pytest.fixture
+def snapshot():
+    """Compare a template against the stored snapshot, which is only written with UPDATE_SNAPSHOTS=1."""
+    def match(name: str, template: core.assertions.Template) -> None:
+        rendered = ASSET_HASH.sub("ASSET_HASH", json.dumps(template.to_json(), indent=2, sort_keys=True)) + "\n"
+        path = os.path.join(SNAPSHOT_DIR, f"{name}.json")
+
+        if UPDATE_SNAPSHOTS:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            with open(path, 'w') as snapshot_file:
+                snapshot_file.write(rendered)
+            return
+
+        # a deleted or misnamed snapshot must fail rather than quietly pass
+        if not os.path.exists(path):
+            pytest.fail(f"no snapshot for {name}, run with UPDATE_SNAPSHOTS=1 to create it")
+
+        with open(path, 'r') as snapshot_file:
+            expected = snapshot_file.read()
+
+        assert rendered == expected, f"template for {name} changed, rerun with UPDATE_SNAPSHOTS=1 if intended"
+
+    return match
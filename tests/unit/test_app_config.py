@@ -0,0 +1,219 @@
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+import yaml
+
+from cdklab.app_config import DEFAULTS, SIZING_PROFILES, AppConfig, FargateSize, apply_profile, load_config
+from cdklab.app_stacks import build_stacks
+
+
+def errors(app_config):
+    return AppConfig.from_dict(app_config).errors()
+
+
+def without_profile_keys(config, profile):
+    """Drop the settings the profile owns, a config can't set them as well."""
+    for key, value in profile.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            without_profile_keys(config[key], value)
+        else:
+            config.pop(key, None)
+    return config
+
+
+def test_fixture_config_is_valid(app_config):
+    config = AppConfig.from_dict(app_config).validate()
+
+    assert config.services["fastapi"].cpu == 512
+    assert config.stream.shard_count == 4
+    assert config.aurora.max_acu == 4
+
+
+@pytest.mark.parametrize("service, cpu, memory, message", [
+    ("fastapi", 512, 512, "fastapi: memory_limit 512 is not valid with cpu_limit 512, use 1024-4096"),
+    ("flower", 256, 4096, "flower: memory_limit 4096 is not valid with cpu_limit 256, use [512, 1024, 2048]"),
+    ("celery", 768, 2048, "celery: unsupported fargate cpu_limit 768"),
+])
+def test_invalid_fargate_pairs(app_config, service, cpu, memory, message):
+    app_config["cdklab"][service] |= {"cpu_limit": cpu, "memory_limit": memory}
+
+    assert any(error.startswith(message) for error in errors(app_config))
+
+
+def test_celery_pools_are_validated_each(app_config):
+    app_config["cdklab"]["celery"]["pools"] = [
+        {"name": "default", "queues": ["celery"]},
+        {"name": "cpu", "queues": ["reports"], "cpu_limit": 4096, "memory_limit": 4096},
+    ]
+
+    assert [error.split(":")[0] for error in errors(app_config)] == ["celery-cpu"]
+
+
+def test_cpu_scaled_services_keep_a_task_running(app_config):
+    app_config["cdklab"]["celery"]["pools"] = [
+        {"name": "default", "queues": ["celery"], "scaling": {"min_capacity": 1, "max_capacity": 4}},
+        {"name": "reports", "queues": ["reports"], "scaling": {"min_capacity": 0, "max_capacity": 8}},
+    ]
+    app_config["cdklab"]["fastapi"]["scaling"] = {"min_capacity": 6, "max_capacity": 2}
+
+    assert errors(app_config) == [
+        "fastapi: scaling min_capacity 6 is above max_capacity 2",
+        "celery-reports: scaling min_capacity 0 must be at least 1 with cpu scaling",
+    ]
+
+
+@pytest.mark.parametrize("database, message", [
+    ({"db_min_acu": 8, "db_max_acu": 4}, "db_min_acu 8 is above db_max_acu 4"),
+    ({"db_min_acu": 0.25, "db_max_acu": 4}, "db_min_acu 0.25 must be between 0 and 256 in steps of 0.5"),
+    ({"db_min_acu": 0.5, "db_max_acu": 512}, "db_max_acu 512 must be between 0 and 256"),
+    ({"db_min_acu": 0, "db_max_acu": 0.5}, "db_max_acu 0.5 must be at least 1"),
+])
+def test_invalid_aurora_capacity(app_config, database, message):
+    app_config["cdklab"]["database"] |= database
+
+    assert any(message in error for error in errors(app_config))
+
+
+@pytest.mark.parametrize("analytics, message", [
+    ({"kinesis_shard_count": 0}, "kinesis_shard_count 0 must be between 1 and 500"),
+    ({"kinesis_retention_hours": 12}, "kinesis_retention_hours 12"),
+    ({"firehose_buffer_size_mb": 32}, "firehose_buffer_size_mb 32 must be between 64 and 128"),
+    ({"firehose_buffer_interval_seconds": 1200}, "firehose_buffer_interval_seconds 1200"),
+])
+def test_invalid_stream_limits(app_config, analytics, message):
+    app_config["analytics"] |= analytics
+
+    assert any(message in error for error in errors(app_config))
+
+
+def test_lambda_and_stream_processing_limits(app_config):
+    app_config["analytics"]["ingest"]["memory_size"] = 64
+    app_config["analytics"]["ingest"]["partition_key"]["spread"] = 8
+    app_config["analytics"]["stream_processing"]["parallelization_factor"] = 12
+
+    messages = errors(app_config)
+
+    assert "ingest: memory_size 64 must be between 128 and 10240" in messages
+    assert "ingest: partition_key spread 8 must be between 1 and the 4 shards" in messages
+    assert "stream_processing: parallelization_factor 12 must be between 1 and 10" in messages
+
+
+def test_validate_reports_every_error(app_config):
+    app_config["cdklab"]["fastapi"]["memory_limit"] = 512
+    app_config["analytics"]["kinesis_shard_count"] = 0
+
+    with pytest.raises(ValueError, match="invalid config") as error:
+        AppConfig.from_dict(app_config).validate()
+    assert "fastapi" in str(error.value) and "kinesis_shard_count" in str(error.value)
+
+
+@pytest.mark.parametrize("profile", sorted(SIZING_PROFILES))
+def test_profiles_are_valid(app_config, profile):
+    for service in ("fastapi", "celery", "flower"):
+        for key in ("cpu_limit", "memory_limit"):
+            del app_config["cdklab"][service][key]
+    del app_config["cdklab"]["database"]["db_max_acu"]
+    without_profile_keys(app_config, SIZING_PROFILES[profile])
+
+    config = AppConfig.from_dict(apply_profile(app_config, profile)).validate()
+
+    assert config.profile == profile
+    assert config.stream.shard_count == SIZING_PROFILES[profile]["analytics"]["kinesis_shard_count"]
+
+
+def test_config_and_profile_cannot_set_the_same_keys(app_config):
+    with pytest.raises(ValueError, match="sizing profile 'prod-high-throughput' sets") as error:
+        apply_profile(app_config | {"profile": "prod-high-throughput"})
+
+    assert "cdklab.fastapi.cpu_limit" in str(error.value)
+    assert "cdklab.database.db_min_acu" in str(error.value)
+    assert "analytics.kinesis_shard_count" not in str(error.value)
+
+
+def test_profile_fills_in_what_the_config_leaves_out(app_config):
+    config = apply_profile(without_profile_keys(app_config, SIZING_PROFILES["prod-high-throughput"]), "prod-high-throughput")
+
+    assert config["cdklab"]["fastapi"]["cpu_limit"] == 1024
+    assert config["cdklab"]["redis_instance_type"] == "cache.r7g.large"
+    assert config["cdklab"]["celery"]["scaling"] == {"min_capacity": 2, "max_capacity": 20}
+    assert config["analytics"]["kinesis_shard_count"] == 16
+    assert config["cdklab"]["fastapi"]["container_port"] == app_config["cdklab"]["fastapi"]["container_port"]
+
+
+def test_unknown_profile(app_config):
+    with pytest.raises(ValueError, match="unsupported sizing profile 'huge'"):
+        apply_profile(app_config, "huge")
+
+
+def test_load_config_applies_profile(app_config, tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(without_profile_keys(app_config, SIZING_PROFILES["prod-high-throughput"])))
+
+    config = load_config(str(path), profile="prod-high-throughput")
+
+    assert config.redis_replicas == 1
+    assert config.raw["analytics"]["firehose_buffer_size_mb"] == 128
+
+
+def test_profile_capacity_reaches_the_templates(app_config):
+    app = core.App()
+    profile = SIZING_PROFILES["prod-high-throughput"]
+    stacks = build_stacks(app, apply_profile(without_profile_keys(app_config, profile), "prod-high-throughput"))
+
+    analytics = assertions.Template.from_stack(stacks["analytics"])
+    analytics.has_resource_properties("AWS::Kinesis::Stream", {"ShardCount": 16})
+    analytics.has_resource_properties("AWS::KinesisFirehose::DeliveryStream", {
+        "ExtendedS3DestinationConfiguration": assertions.Match.object_like({
+            "BufferingHints": {"IntervalInSeconds": 60, "SizeInMBs": 128},
+        }),
+    })
+    analytics.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "ingest.handler",
+        "MemorySize": 1024,
+    })
+    lab = assertions.Template.from_stack(stacks["lab"])
+    lab.has_resource_properties("AWS::ElastiCache::ReplicationGroup", {
+        "NumCacheClusters": 2,
+        "AutomaticFailoverEnabled": True,
+        "MultiAZEnabled": True,
+    })
+    lab.has_resource_properties("AWS::ECS::TaskDefinition", {"Family": "fastapi", "Cpu": "1024", "Memory": "2048"})
+    lab.has_resource_properties("AWS::RDS::DBCluster", {
+        "ServerlessV2ScalingConfiguration": {"MinCapacity": 2, "MaxCapacity": 64},
+    })
+
+
+def test_build_stacks_validates_the_config(app_config):
+    app_config["cdklab"]["fastapi"]["cpu_limit"] = 333
+
+    with pytest.raises(ValueError, match="invalid config"):
+        build_stacks(core.App(), app_config)
+
+
+def test_validated_defaults_are_the_synthesized_values(app_config, tmp_path):
+    del app_config["cdklab"]["fastapi"]["cpu_limit"], app_config["cdklab"]["fastapi"]["memory_limit"]
+    del app_config["cdklab"]["database"]["db_max_acu"]
+    app_config["cdklab"]["celery"]["pools"] = [{"name": "reports", "queues": ["reports"], "scaling": {"max_capacity": 3}}]
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(app_config))
+
+    config = load_config(str(path))
+
+    assert config.services["fastapi"] == FargateSize(DEFAULTS["cdklab"]["fastapi"]["cpu_limit"], DEFAULTS["cdklab"]["fastapi"]["memory_limit"])
+    assert config.aurora.max_acu == config.raw["cdklab"]["database"]["db_max_acu"] == DEFAULTS["cdklab"]["database"]["db_max_acu"]
+    assert config.stream.shard_count == config.raw["analytics"]["kinesis_shard_count"] == DEFAULTS["analytics"]["kinesis_shard_count"]
+    assert config.raw["cdklab"]["celery"]["pools"][0]["scaling"] == {"min_capacity": 1, "max_capacity": 3}
+
+    stacks = build_stacks(core.App(), config.raw)
+    lab = assertions.Template.from_stack(stacks["lab"])
+    fastapi = [
+        definition["Properties"] for definition in lab.find_resources("AWS::ECS::TaskDefinition").values()
+        if definition["Properties"]["Family"] == "fastapi"
+    ][0]
+    assert (fastapi["Cpu"], fastapi["Memory"]) == (str(config.services["fastapi"].cpu), str(config.services["fastapi"].memory))
+    lab.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {"MinCapacity": 1, "MaxCapacity": 3})
+    lab.has_resource_properties("AWS::RDS::DBCluster", {
+        "ServerlessV2ScalingConfiguration": {"MinCapacity": config.aurora.min_acu, "MaxCapacity": config.aurora.max_acu},
+    })
+    analytics = assertions.Template.from_stack(stacks["analytics"])
+    analytics.has_resource_properties("AWS::Kinesis::Stream", {"ShardCount": config.stream.shard_count})
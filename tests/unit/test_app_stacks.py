@@ -0,0 +1,40 @@
+import aws_cdk as core
+
+from cdklab.app_stacks import build_stacks
+
+
+def test_stacks_depend_only_on_network(app_config):
+    app = core.App()
+    stacks = build_stacks(app, app_config)
+
+    assert stacks["network"].dependencies == []
+    assert stacks["lab"].dependencies == [stacks["network"]]
+    assert stacks["analytics"].dependencies == [stacks["network"]]
+    assert set(stacks["monitoring"].dependencies) == {stacks["lab"], stacks["analytics"]}
+
+
+def test_synth_keeps_lab_and_analytics_independent(app_config):
+    app = core.App()
+    stacks = build_stacks(app, app_config)
+    assembly = app.synth()
+
+    stack_ids = {stack.artifact_id for stack in stacks.values()}
+
+    def depends_on(stack_name):
+        artifact = assembly.get_stack_artifact(stacks[stack_name].artifact_id)
+        # ignore the per-stack asset manifests, only stack ordering matters here
+        return {dependency.id for dependency in artifact.dependencies} & stack_ids
+
+    assert depends_on("network") == set()
+    assert depends_on("lab") == {stacks["network"].artifact_id}
+    assert depends_on("analytics") == {stacks["network"].artifact_id}
+    assert depends_on("monitoring") == {stacks["lab"].artifact_id, stacks["analytics"].artifact_id}
+
+
+def test_vpc_is_owned_by_network_stack(app_config):
+    app = core.App()
+    stacks = build_stacks(app, app_config)
+
+    assert core.assertions.Template.from_stack(stacks["network"]).find_resources("AWS::EC2::VPC")
+    assert not core.assertions.Template.from_stack(stacks["lab"]).find_resources("AWS::EC2::VPC")
+    assert not core.assertions.Template.from_stack(stacks["analytics"]).find_resources("AWS::EC2::VPC")
@@ -0,0 +1,89 @@
+import datetime
+
+import pytest
+
+import athena_rollup
+
+NOW = datetime.datetime(2024, 1, 1, 12, 30, tzinfo=datetime.timezone.utc)
+TEMPLATE = "INSERT INTO rollup SELECT '{dt}' WHERE dt = '{dt}'"
+
+
+class StubGlue:
+    class exceptions:
+        class EntityNotFoundException(Exception):
+            pass
+
+    def __init__(self, partitions=()):
+        self.partitions = set(partitions)
+
+    def get_partition(self, DatabaseName, TableName, PartitionValues):
+        if (TableName, PartitionValues[0]) not in self.partitions:
+            raise self.exceptions.EntityNotFoundException(PartitionValues[0])
+        return {}
+
+
+class StubAthena:
+    def __init__(self):
+        self.queries = []
+
+    def start_query_execution(self, QueryString, QueryExecutionContext, WorkGroup, **kwargs):
+        self.queries.append((QueryString, QueryExecutionContext["Database"], WorkGroup))
+        self.reuse = kwargs.get("ResultReuseConfiguration")
+        return {"QueryExecutionId": f"q{len(self.queries)}"}
+
+
+def test_pending_hours():
+    hours = athena_rollup.pending_hours(NOW, 3, 1)
+
+    assert [hour.strftime(athena_rollup.PARTITION_FORMAT) for hour in hours] == ["2024-01-01-09", "2024-01-01-10", "2024-01-01-11"]
+
+
+def test_render_fills_the_hour():
+    assert athena_rollup.render(TEMPLATE, datetime.datetime(2024, 1, 1, 23)) == (
+        "INSERT INTO rollup SELECT '2024-01-01-23' WHERE dt = '2024-01-01-23'"
+    )
+
+
+def test_start_rollups_skips_existing_partitions():
+    athena = StubAthena()
+    glue = StubGlue({("app_events_hourly", "2024-01-01-10")})
+
+    executions = athena_rollup.start_rollups(
+        athena, glue, {"app_events_hourly": TEMPLATE},
+        athena_rollup.pending_hours(NOW, 2, 1), "cdklab", "analytics",
+    )
+
+    assert executions == ["q1"]
+    query, database, workgroup = athena.queries[0]
+    assert "'2024-01-01-11'" in query
+    assert (database, workgroup) == ("cdklab", "analytics")
+    # rollup inserts never reuse a result
+    assert athena.reuse is None
+
+
+def test_read_queries_reuse_results():
+    athena = StubAthena()
+
+    execution = athena_rollup.start_read_query(
+        athena, "SELECT * FROM app_events_hourly WHERE dt = '2024-01-01-11'", "cdklab", "analytics", 60,
+    )
+
+    assert execution == "q1"
+    assert athena.reuse == {"ResultReuseByAgeConfiguration": {"Enabled": True, "MaxAgeInMinutes": 60}}
+
+    athena_rollup.start_read_query(athena, "WITH hours AS (SELECT 1) SELECT * FROM hours", "cdklab", "analytics", 0)
+    assert athena.reuse is None
+
+
+def test_read_queries_reject_writes():
+    with pytest.raises(ValueError, match="read only"):
+        athena_rollup.start_read_query(StubAthena(), "INSERT INTO app_events_hourly SELECT 1", "cdklab", "analytics", 60)
+
+
+def test_handler_starts_dashboard_reads(monkeypatch):
+    athena = StubAthena()
+    monkeypatch.setattr(athena_rollup.boto3, "client", lambda service: athena)
+    monkeypatch.setenv("RESULT_REUSE_MAX_AGE_MINUTES", "15")
+
+    assert athena_rollup.handler({"query": "SELECT 1"}, None) == {"executions": ["q1"]}
+    assert athena.reuse["ResultReuseByAgeConfiguration"]["MaxAgeInMinutes"] == 15
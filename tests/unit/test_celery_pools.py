@@ -0,0 +1,66 @@
+import pytest
+
+from cdklab.celery_pools import celery_pool_configs, celery_start_command
+
+BASE_COMMAND = ["celery", "-A", "app.worker", "worker"]
+
+
+def test_start_command_from_pool_settings():
+    pool = {"name": "io", "queues": ["webhooks", "email"], "pool": "gevent", "concurrency": 100, "prefetch_multiplier": 4}
+
+    assert celery_start_command(BASE_COMMAND, pool, 512) == BASE_COMMAND + [
+        "--queues", "webhooks,email",
+        "--pool", "gevent",
+        "--hostname", "io@%h",
+        "--concurrency", "100",
+        "--prefetch-multiplier", "4",
+    ]
+
+
+def test_prefork_concurrency_follows_task_cpu():
+    command = celery_start_command(BASE_COMMAND, {"name": "cpu", "queues": ["reports"]}, 4096)
+
+    assert command[command.index("--concurrency") + 1] == "4"
+    assert "--prefetch-multiplier" not in command
+
+
+@pytest.mark.parametrize("pool, message", [
+    ({"name": "cpu"}, "needs a list of queues"),
+    ({"name": "cpu", "queues": ["reports"], "pool": "eventlet"}, "unsupported celery pool"),
+])
+def test_start_command_rejects_invalid_pools(pool, message):
+    with pytest.raises(ValueError, match=message):
+        celery_start_command(BASE_COMMAND, pool, 512)
+
+
+def test_without_pools_the_celery_config_is_one_service(app_config):
+    celery = app_config["cdklab"]["celery"]
+
+    assert celery_pool_configs(celery) == {"celery": celery}
+
+
+def test_pools_override_the_shared_config(app_config):
+    celery = app_config["cdklab"]["celery"] | {"pools": [
+        {"name": "default", "queues": ["celery"]},
+        {"name": "cpu", "queues": ["reports"], "cpu_limit": 2048, "memory_limit": 4096,
+         "environment": {"plaintext": {"POOL": "cpu"}}},
+    ]}
+
+    configs = celery_pool_configs(celery)
+
+    assert list(configs) == ["celery-default", "celery-cpu"]
+    assert configs["celery-default"]["cpu_limit"] == 512
+    assert configs["celery-cpu"]["memory_limit"] == 4096
+    assert configs["celery-cpu"]["environment"]["plaintext"] == {"SERVICE": "celery", "POOL": "cpu"}
+    assert "POOL" not in configs["celery-default"]["environment"]["plaintext"]
+    assert "pools" not in configs["celery-cpu"]
+
+
+def test_duplicate_pool_names(app_config):
+    celery = app_config["cdklab"]["celery"] | {"pools": [
+        {"name": "default", "queues": ["celery"]},
+        {"name": "default", "queues": ["reports"]},
+    ]}
+
+    with pytest.raises(ValueError, match="duplicate celery pool"):
+        celery_pool_configs(celery)
@@ -0,0 +1,197 @@
+import datetime
+import types
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pafs = pytest.importorskip("pyarrow.fs")
+pq = pytest.importorskip("pyarrow.parquet")
+
+import compact_events
+
+NOW = datetime.datetime(2024, 1, 1, 12, 15, tzinfo=datetime.timezone.utc)
+
+
+class StubGlue:
+    """Local stand-in for the glue catalog keeping partition locations in a dict."""
+
+    class exceptions:
+        class EntityNotFoundException(Exception):
+            pass
+
+    def __init__(self, locations=None):
+        self.locations = dict(locations or {})
+        self.updates = []
+
+    def get_table(self, DatabaseName, Name):
+        return {"Table": {"StorageDescriptor": {"Location": "s3://lake/events/", "Columns": []}}}
+
+    def get_partition(self, DatabaseName, TableName, PartitionValues):
+        value = PartitionValues[0]
+        if value not in self.locations:
+            raise self.exceptions.EntityNotFoundException(value)
+        return {"Partition": {"StorageDescriptor": {"Location": self.locations[value]}}}
+
+    def create_partition(self, DatabaseName, TableName, PartitionInput):
+        self.locations[PartitionInput["Values"][0]] = PartitionInput["StorageDescriptor"]["Location"]
+
+    def update_partition(self, DatabaseName, TableName, PartitionValueList, PartitionInput):
+        self.updates.append(PartitionValueList[0])
+        self.locations[PartitionValueList[0]] = PartitionInput["StorageDescriptor"]["Location"]
+
+
+def events(count, offset=0):
+    base = datetime.datetime(2024, 1, 1, 11)
+    return pa.table({
+        "app_id": [f"app-{(offset + i) % 3}" for i in range(count)],
+        "event_type": [("view", "click")[(offset + i) % 2] for i in range(count)],
+        "session_id": [f"s{offset + i}" for i in range(count)],
+        "createts": [base + datetime.timedelta(seconds=(offset * 7 + i * 13) % 3600) for i in range(count)],
+    })
+
+
+def write_raw(root, value, files, rows):
+    directory = root / "lake" / "events" / f"dt={value}"
+    directory.mkdir(parents=True)
+    for index in range(files):
+        pq.write_table(events(rows, offset=index * rows), directory / f"cdklab-events-firehose-{index}.parquet", compression="gzip")
+    return directory
+
+
+def options(**overrides):
+    return types.SimpleNamespace(**({
+        "bucket": "lake",
+        "raw_prefix": "events",
+        "compacted_prefix": "events-compacted",
+        "database": "cdklab",
+        "table": "app_events",
+        "target_file_size_mb": 128,
+        "min_files": 2,
+        "min_age_hours": 1,
+        "lookback_hours": 2,
+        "compression": "snappy",
+        "delete_grace_minutes": 30,
+    } | overrides))
+
+
+def test_partition_windows():
+    assert compact_events.open_partitions(NOW) == ["2024-01-01-12", "2024-01-01-13"]
+    assert compact_events.closed_partitions(NOW, 3, 1) == ["2024-01-01-09", "2024-01-01-10", "2024-01-01-11"]
+
+
+def test_merge_sorts_and_slices():
+    parts = compact_events.merge(pa.concat_tables([events(50), events(50, offset=50)]), 30)
+
+    assert [part.num_rows for part in parts] == [30, 30, 30, 10]
+    rows = [(row["app_id"], row["event_type"], row["createts"]) for part in parts for row in part.to_pylist()]
+    assert rows == sorted(rows)
+
+
+def test_rows_per_file_scales_with_target_size():
+    assert compact_events.rows_per_file(1000, 10 * 1024 * 1024, 5 * 1024 * 1024) == 500
+    assert compact_events.rows_per_file(1000, 1024, 128 * 1024 * 1024) == 1000
+    assert compact_events.rows_per_file(0, 0, 1024) == 0
+
+
+def test_compact_files_keeps_every_row(tmp_path):
+    filesystem = pafs.SubTreeFileSystem(str(tmp_path), pafs.LocalFileSystem())
+    write_raw(tmp_path, "2024-01-01-11", files=5, rows=40)
+    sources = compact_events.data_files(filesystem, "lake/events/dt=2024-01-01-11")
+
+    written = compact_events.compact_files(filesystem, sources, "lake/out", target_bytes=1024 * 1024)
+
+    assert len(sources) == 5
+    assert len(written) == 1
+    table = pq.read_table(tmp_path / "lake" / "out" / "part-00000.parquet")
+    assert table.num_rows == 200
+    assert table.column("session_id").to_pylist() != sorted(table.column("session_id").to_pylist())
+
+
+def test_run_swaps_partition_and_removes_raw_files(tmp_path):
+    filesystem = pafs.SubTreeFileSystem(str(tmp_path), pafs.LocalFileSystem())
+    raw_dir = write_raw(tmp_path, "2024-01-01-11", files=4, rows=25)
+    glue = StubGlue({"2024-01-01-11": "s3://lake/events/dt=2024-01-01-11/"})
+
+    compacted = compact_events.run(glue, filesystem, options(), NOW)
+
+    assert list(compacted) == ["2024-01-01-11"]
+    location = glue.locations["2024-01-01-11"]
+    assert location.startswith("s3://lake/events-compacted/dt=2024-01-01-11/run=")
+    assert glue.updates == ["2024-01-01-11"]
+    compacted_dir = tmp_path / location[len("s3://"):]
+    assert pq.read_table(compacted_dir).num_rows == 100
+    # queries planned before the swap may still read the raw files
+    assert len(list(raw_dir.iterdir())) == 4
+
+    # the open hours are registered ahead of firehose writing to them
+    assert glue.locations["2024-01-01-12"] == "s3://lake/events/dt=2024-01-01-12/"
+    assert glue.locations["2024-01-01-13"] == "s3://lake/events/dt=2024-01-01-13/"
+
+    # a second run leaves compacted partitions alone
+    assert compact_events.run(glue, filesystem, options(), NOW) == {}
+    assert glue.locations["2024-01-01-11"] == location
+    assert len(list(raw_dir.iterdir())) == 4
+
+    # and deletes the merged raw files once the grace period has passed
+    assert compact_events.run(glue, filesystem, options(), NOW + datetime.timedelta(minutes=30)) == {}
+    assert list(raw_dir.iterdir()) == []
+    assert pq.read_table(compacted_dir).num_rows == 100
+
+
+def test_run_skips_partitions_with_few_files(tmp_path):
+    filesystem = pafs.SubTreeFileSystem(str(tmp_path), pafs.LocalFileSystem())
+    raw_dir = write_raw(tmp_path, "2024-01-01-10", files=1, rows=10)
+    glue = StubGlue()
+
+    assert compact_events.run(glue, filesystem, options(), NOW) == {}
+    assert glue.locations["2024-01-01-10"] == "s3://lake/events/dt=2024-01-01-10/"
+    assert len(list(raw_dir.iterdir())) == 1
+
+
+def test_late_files_are_merged_into_a_new_run(tmp_path):
+    filesystem = pafs.SubTreeFileSystem(str(tmp_path), pafs.LocalFileSystem())
+    raw_dir = write_raw(tmp_path, "2024-01-01-11", files=4, rows=25)
+    glue = StubGlue({"2024-01-01-11": "s3://lake/events/dt=2024-01-01-11/"})
+    compact_events.run(glue, filesystem, options(), NOW)
+    first_location = glue.locations["2024-01-01-11"]
+
+    # a retried firehose delivery lands in the hour after it was compacted
+    pq.write_table(events(10, offset=100), raw_dir / "late.parquet")
+    compacted = compact_events.run(glue, filesystem, options(), NOW + datetime.timedelta(minutes=5))
+
+    assert list(compacted) == ["2024-01-01-11"]
+    location = glue.locations["2024-01-01-11"]
+    assert location != first_location
+    assert glue.updates == ["2024-01-01-11", "2024-01-01-11"]
+    # the replaced run and the raw files are kept for in-flight queries
+    assert (tmp_path / first_location[len("s3://"):]).exists()
+    assert len(list(raw_dir.iterdir())) == 5
+    assert len(compact_events.read_manifest(filesystem, location[len("s3://"):].rstrip("/"))) == 5
+    table = pq.read_table(tmp_path / location[len("s3://"):])
+    assert table.num_rows == 110
+    assert sorted(table.column("session_id").to_pylist()) == sorted(f"s{i}" for i in range(110))
+    rows = [(row["app_id"], row["event_type"], row["createts"]) for row in table.to_pylist()]
+    assert rows == sorted(rows)
+
+    assert compact_events.run(glue, filesystem, options(), NOW + datetime.timedelta(minutes=65)) == {}
+    assert list(raw_dir.iterdir()) == []
+    assert not (tmp_path / first_location[len("s3://"):]).exists()
+    assert pq.read_table(tmp_path / location[len("s3://"):]).num_rows == 110
+
+
+def test_files_left_after_the_swap_are_not_merged_twice(tmp_path):
+    filesystem = pafs.SubTreeFileSystem(str(tmp_path), pafs.LocalFileSystem())
+    raw_dir = write_raw(tmp_path, "2024-01-01-11", files=4, rows=25)
+    glue = StubGlue({"2024-01-01-11": "s3://lake/events/dt=2024-01-01-11/"})
+    sources = compact_events.data_files(filesystem, "lake/events/dt=2024-01-01-11")
+
+    # a run stopped between the partition swap and deleting the raw files
+    target_dir = "lake/events-compacted/dt=2024-01-01-11/run=stopped"
+    compact_events.compact_files(filesystem, sources, target_dir, target_bytes=128 * 1024 * 1024)
+    compact_events.write_manifest(filesystem, target_dir, sources)
+    glue.locations["2024-01-01-11"] = f"s3://{target_dir}/"
+
+    assert compact_events.run(glue, filesystem, options(), NOW) == {}
+    assert glue.locations["2024-01-01-11"] == f"s3://{target_dir}/"
+    assert list(raw_dir.iterdir()) == []
+    assert pq.read_table(tmp_path / target_dir).num_rows == 100
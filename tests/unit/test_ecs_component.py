@@ -0,0 +1,225 @@
+import aws_cdk.assertions as assertions
+import aws_cdk.aws_ecr as ecr
+import aws_cdk.aws_ecs as ecs
+import aws_cdk.aws_iam as iam
+import pytest
+
+from cdklab.app_config import FargateSize, TaskScaling
+from cdklab.ecs_component import EcsComponents
+
+
+def build_component(stack, vpc, config, **kwargs):
+    return EcsComponents(stack,
+        "fastapi",
+        config=config,
+        size=FargateSize.from_config(config),
+        scaling=TaskScaling.from_config(config["scaling"]) if config.get("scaling") else None,
+        image_repo=ecr.Repository.from_repository_name(stack, "ecr", "cdklab"),
+        vpc=vpc,
+        ecs_task_role=iam.Role(stack, "role", assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com")),
+        cluster=ecs.Cluster(stack, "ecs", vpc=vpc),
+        **kwargs
+    )
+
+
+def test_ecs_component_snapshot(app_config, component_stack, snapshot):
+    stack, vpc = component_stack
+    fastapi_config = app_config["cdklab"]["fastapi"]
+    build_component(stack, vpc, fastapi_config,
+        alb=True,
+        container_port=fastapi_config["container_port"],
+        health_check_path=fastapi_config["health_check_path"],
+    )
+
+    snapshot("ecs_component", assertions.Template.from_stack(stack))
+
+
+def test_ecs_component_without_alb(app_config, component_stack):
+    stack, vpc = component_stack
+    component = build_component(stack, vpc, app_config["cdklab"]["celery"], alb=False)
+    template = assertions.Template.from_stack(stack)
+
+    assert not hasattr(component, "target_group")
+    template.resource_count_is("AWS::ElasticLoadBalancingV2::TargetGroup", 0)
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "Cpu": "512",
+        "Memory": "1024",
+    })
+
+
+def test_ecs_component_tracing_sidecar(app_config, component_stack):
+    stack, vpc = component_stack
+    build_component(stack, vpc, app_config["cdklab"]["celery"], alb=False, tracing={"sampling_rate": 0.25})
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ECS::TaskDefinition", {
+        "ContainerDefinitions": assertions.Match.array_with([
+            assertions.Match.object_like({
+                "Name": "fastapi-container",
+                "DependsOn": [{"ContainerName": "fastapi-otel-collector", "Condition": "START"}],
+                "Environment": assertions.Match.array_with([
+                    {"Name": "OTEL_EXPORTER_OTLP_ENDPOINT", "Value": "http://localhost:4317"},
+                    {"Name": "OTEL_TRACES_SAMPLER_ARG", "Value": "0.25"},
+                ]),
+            }),
+            assertions.Match.object_like({
+                "Name": "fastapi-otel-collector",
+                "Essential": False,
+                "Image": "public.ecr.aws/aws-observability/aws-otel-collector:v0.40.0",
+            }),
+        ]),
+    })
+    template.has_resource_properties("AWS::IAM::Role", {
+        "ManagedPolicyArns": assertions.Match.array_with([
+            assertions.Match.object_like({
+                "Fn::Join": ["", ["arn:", {"Ref": "AWS::Partition"}, ":iam::aws:policy/AWSXRayDaemonWriteAccess"]],
+            }),
+        ]),
+    })
+
+
+def test_ecs_component_collector_image_override(app_config, component_stack):
+    stack, vpc = component_stack
+    image = "123456789012.dkr.ecr.us-east-1.amazonaws.com/aws-otel-collector:v0.41.1"
+    build_component(stack, vpc, app_config["cdklab"]["celery"], alb=False, tracing={"collector_image": image})
+    template = assertions.Template.from_stack(stack)
+
+    assert container_definition(template, "fastapi-otel-collector")["Image"] == image
+
+
+def container_definition(template, name):
+    for definition in template.find_resources("AWS::ECS::TaskDefinition").values():
+        for container in definition["Properties"]["ContainerDefinitions"]:
+            if container["Name"] == name:
+                return container
+    raise AssertionError(f"container {name} not found")
+
+
+def test_ecs_component_non_blocking_logging(app_config, component_stack):
+    stack, vpc = component_stack
+    config = app_config["cdklab"]["celery"]
+    config["logging"] = {"mode": "non-blocking", "max_buffer_size_mib": 8, "retention_days": 30}
+    build_component(stack, vpc, config, alb=False)
+    template = assertions.Template.from_stack(stack)
+
+    options = container_definition(template, "fastapi-container")["LogConfiguration"]["Options"]
+    assert options["mode"] == "non-blocking"
+    assert options["max-buffer-size"] == "8388608b"
+    template.has_resource_properties("AWS::Logs::LogGroup", {"RetentionInDays": 30})
+
+
+def test_ecs_component_firelens_to_cloudwatch(app_config, component_stack):
+    stack, vpc = component_stack
+    config = app_config["cdklab"]["celery"]
+    config["logging"] = {"mode": "non-blocking", "firelens": {"enabled": True}}
+    build_component(stack, vpc, config, alb=False)
+    template = assertions.Template.from_stack(stack)
+
+    log_configuration = container_definition(template, "fastapi-container")["LogConfiguration"]
+    assert log_configuration["LogDriver"] == "awsfirelens"
+    assert log_configuration["Options"]["Name"] == "cloudwatch_logs"
+    assert log_configuration["Options"]["mode"] == "non-blocking"
+
+    router = container_definition(template, "fastapi-log-router")
+    assert router["FirelensConfiguration"]["Type"] == "fluentbit"
+    assert router["Image"].endswith("aws-for-fluent-bit:init-2.32.4")
+    assert router["Environment"][0]["Name"] == "aws_fluent_bit_init_s3_1"
+
+
+def test_ecs_component_firelens_to_s3(app_config, component_stack):
+    stack, vpc = component_stack
+    config = app_config["cdklab"]["celery"]
+    config["logging"] = {"firelens": {"enabled": True, "destination": "s3", "bucket": "cdklab-logs", "exclude_debug": False}}
+    build_component(stack, vpc, config, alb=False)
+    template = assertions.Template.from_stack(stack)
+
+    options = container_definition(template, "fastapi-container")["LogConfiguration"]["Options"]
+    assert options["Name"] == "s3"
+    assert options["bucket"] == "cdklab-logs"
+    assert "mode" not in options
+    assert container_definition(template, "fastapi-log-router")["Image"].endswith("aws-for-fluent-bit:2.32.4")
+
+
+def test_ecs_component_firelens_debug_filter_needs_an_init_image(app_config, component_stack):
+    stack, vpc = component_stack
+    config = app_config["cdklab"]["celery"]
+    config["logging"] = {"firelens": {"enabled": True, "image": "example.com/fluent-bit:2.32.4"}}
+
+    with pytest.raises(ValueError, match="needs an init-\\* fluent bit image"):
+        build_component(stack, vpc, config, alb=False)
+
+
+def test_ecs_component_firelens_custom_init_image(app_config, component_stack):
+    stack, vpc = component_stack
+    config = app_config["cdklab"]["celery"]
+    config["logging"] = {"firelens": {"enabled": True, "image": "example.com/fluent-bit:init-2.32.4"}}
+    build_component(stack, vpc, config, alb=False)
+    template = assertions.Template.from_stack(stack)
+
+    assert container_definition(template, "fastapi-log-router")["Image"] == "example.com/fluent-bit:init-2.32.4"
+
+
+def test_ecs_component_rejects_bad_logging_config(app_config, component_stack):
+    stack, vpc = component_stack
+    config = app_config["cdklab"]["celery"]
+    config["logging"] = {"retention_days": 10}
+
+    with pytest.raises(ValueError, match="unsupported log retention"):
+        build_component(stack, vpc, config, alb=False)
+
+
+def test_ecs_component_fast_startup(app_config, component_stack):
+    stack, vpc = component_stack
+    config = app_config["cdklab"]["fastapi"]
+    config.update({
+        "health_check_grace_seconds": 30,
+        "container_health_check": {"interval_seconds": 5, "start_period_seconds": 15},
+        "alb_health_check": {"profile": "fast", "interval_seconds": 15},
+        "deregistration_delay_seconds": 20,
+        "min_healthy_percent": 50,
+        "max_healthy_percent": 300,
+        "soci": True,
+        "platform_version": "LATEST",
+    })
+    build_component(stack, vpc, config,
+        alb=True,
+        container_port=config["container_port"],
+        health_check_path=config["health_check_path"],
+    )
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ECS::Service", {
+        "HealthCheckGracePeriodSeconds": 30,
+        "PlatformVersion": "LATEST",
+        "DeploymentConfiguration": assertions.Match.object_like({
+            "MinimumHealthyPercent": 50,
+            "MaximumPercent": 300,
+        }),
+    })
+    health_check = container_definition(template, "fastapi-container")["HealthCheck"]
+    assert "http://localhost:8000/health" in health_check["Command"][1]
+    assert health_check["Interval"] == 5
+    assert health_check["StartPeriod"] == 15
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::TargetGroup", {
+        "HealthCheckIntervalSeconds": 15,
+        "HealthyThresholdCount": 2,
+        "TargetGroupAttributes": assertions.Match.array_with([
+            {"Key": "deregistration_delay.timeout_seconds", "Value": "20"},
+        ]),
+    })
+
+
+@pytest.mark.parametrize("settings, message", [
+    ({"container_health_check": {"retries": 2}}, "needs a command"),
+    ({"alb_health_check": {"profile": "slow"}}, "unsupported alb_health_check profile"),
+    ({"platform_version": "1.2.0"}, "unsupported platform_version"),
+    ({"platform_version": "1.3.0", "soci": True}, "needs platform_version 1.4.0"),
+    ({"scaling": {"min_capacity": 4, "max_capacity": 2}}, "is above max_capacity"),
+    ({"scaling": {"min_capacity": 0, "max_capacity": 2}}, "must be at least 1"),
+])
+def test_ecs_component_rejects_bad_startup_config(app_config, component_stack, settings, message):
+    stack, vpc = component_stack
+    config = app_config["cdklab"]["celery"] | settings
+
+    with pytest.raises(ValueError, match=message):
+        build_component(stack, vpc, config, alb=True, container_port=5555)
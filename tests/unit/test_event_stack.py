@@ -0,0 +1,138 @@
+import json
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+
+from cdklab.app_stacks import build_stacks
+from cdklab.event_stack import EVENT_COLUMNS, EVENT_TIME_COLUMN
+
+
+def analytics_template(app_config):
+    app = core.App()
+    stacks = build_stacks(app, app_config)
+    return assertions.Template.from_stack(stacks["analytics"])
+
+
+def test_analytics_stack_snapshot(app_config, snapshot):
+    snapshot("analytics_stack", analytics_template(app_config))
+
+
+def test_firehose_reads_from_stream(app_config):
+    template = analytics_template(app_config)
+
+    template.has_resource_properties("AWS::Kinesis::Stream", {
+        "Name": "cdklab-events",
+        "ShardCount": 4,
+    })
+    template.has_resource_properties("AWS::KinesisFirehose::DeliveryStream", {
+        "DeliveryStreamName": "cdklab-events-firehose",
+        "DeliveryStreamType": "KinesisStreamAsSource",
+    })
+
+
+def test_compaction_job_runs_on_hourly_partitions(app_config):
+    template = analytics_template(app_config)
+
+    template.has_resource_properties("AWS::KinesisFirehose::DeliveryStream", {
+        "ExtendedS3DestinationConfiguration": assertions.Match.object_like({
+            "Prefix": "events/dt=!{timestamp:yyyy-MM-dd-HH}/",
+        }),
+    })
+    template.has_resource_properties("AWS::Glue::Table", {
+        "TableInput": assertions.Match.object_like({
+            "PartitionKeys": [{"Name": "dt", "Type": "string"}],
+        }),
+    })
+    template.has_resource_properties("AWS::Glue::Job", {
+        "Command": assertions.Match.object_like({"Name": "pythonshell"}),
+        "DefaultArguments": assertions.Match.object_like({
+            "--raw_prefix": "events",
+            "--target_file_size_mb": "128",
+        }),
+        "ExecutionProperty": {"MaxConcurrentRuns": 1},
+    })
+    template.has_resource_properties("AWS::Glue::Trigger", {
+        "Type": "SCHEDULED",
+        "Schedule": "cron(15 * * * ? *)",
+    })
+
+
+def test_compaction_disabled_keeps_flat_prefix(app_config):
+    app_config['analytics']['compaction']['enabled'] = False
+    app_config['analytics']['athena']['enabled'] = False
+    template = analytics_template(app_config)
+
+    template.resource_count_is("AWS::Glue::Job", 0)
+    template.has_resource_properties("AWS::KinesisFirehose::DeliveryStream", {
+        "ExtendedS3DestinationConfiguration": assertions.Match.object_like({
+            "Prefix": "events/",
+        }),
+    })
+
+
+def test_athena_rollups_need_the_partitioned_layout(app_config):
+    app_config['analytics']['compaction']['enabled'] = False
+
+    with pytest.raises(ValueError, match="needs analytics.compaction.enabled"):
+        analytics_template(app_config)
+
+
+def test_athena_workgroup_limits_scans(app_config):
+    template = analytics_template(app_config)
+
+    template.has_resource_properties("AWS::Athena::WorkGroup", {
+        "WorkGroupConfiguration": assertions.Match.object_like({
+            "BytesScannedCutoffPerQuery": 10240 * 1024 * 1024,
+            "EnforceWorkGroupConfiguration": True,
+            "ResultConfiguration": assertions.Match.object_like({
+                "EncryptionConfiguration": {"EncryptionOption": "SSE_S3"},
+            }),
+        }),
+    })
+    template.has_resource_properties("AWS::Glue::Table", {
+        "TableInput": assertions.Match.object_like({
+            "Name": "app_events_hourly",
+            "PartitionKeys": [{"Name": "dt", "Type": "string"}],
+        }),
+    })
+    template.has_resource_properties("AWS::Events::Rule", {
+        "ScheduleExpression": "cron(30 * * * ? *)",
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": assertions.Match.object_like({"RESULT_REUSE_MAX_AGE_MINUTES": "60"})},
+    })
+
+
+def test_athena_result_reuse_is_bounded(app_config):
+    app_config['analytics']['athena']['result_reuse_max_age_minutes'] = 20000
+
+    with pytest.raises(ValueError, match="result_reuse_max_age_minutes"):
+        analytics_template(app_config)
+
+
+def test_producer_event_time_key_fills_the_event_time_column(app_config, monkeypatch):
+    import ingest
+    import ingest_consumer
+
+    class StubKinesis:
+        def put_record(self, StreamName, Data, PartitionKey, **kwargs):
+            self.data = Data
+
+    kinesis = StubKinesis()
+    monkeypatch.setattr(ingest.boto3, "client", lambda service: kinesis)
+    assert ingest.handler({"body": json.dumps({"app_id": "lab", "session_id": "s1"})}, None)["statusCode"] == 200
+    queued = ingest_consumer.to_kinesis_record({
+        "body": json.dumps({"app_id": "lab", "session_id": "s1"}),
+        "attributes": {"SentTimestamp": "1700000000123"},
+    }, {"strategy": "session"})
+
+    template = analytics_template(app_config)
+    delivery_stream = next(iter(template.find_resources("AWS::KinesisFirehose::DeliveryStream").values()))
+    serde = delivery_stream["Properties"]["ExtendedS3DestinationConfiguration"]["DataFormatConversionConfiguration"][
+        "InputFormatConfiguration"]["Deserializer"]["OpenXJsonSerDe"]
+    json_key = serde.get("ColumnToJsonKeyMappings", {}).get(EVENT_TIME_COLUMN, EVENT_TIME_COLUMN)
+
+    assert EVENT_TIME_COLUMN in dict(EVENT_COLUMNS)
+    assert json_key in json.loads(kinesis.data)
+    assert json_key in json.loads(queued["Data"])
@@ -0,0 +1,96 @@
+import json
+
+import ingest_consumer
+
+
+class StubKinesis:
+    """Local stand-in for the Kinesis client failing the configured partition keys."""
+
+    def __init__(self, fail_keys=(), error=None):
+        self.fail_keys = set(fail_keys)
+        self.error = error
+        self.calls = []
+
+    def put_records(self, StreamName, Records):
+        self.calls.append((StreamName, Records))
+        if self.error:
+            raise self.error
+        results = [
+            {"ErrorCode": "ProvisionedThroughputExceededException"} if record["PartitionKey"] in self.fail_keys
+            else {"SequenceNumber": "1", "ShardId": "shardId-000000000000"}
+            for record in Records
+        ]
+        return {"FailedRecordCount": sum("ErrorCode" in result for result in results), "Records": results}
+
+
+def sqs_message(message_id, body):
+    return {
+        "messageId": message_id,
+        "body": body if isinstance(body, str) else json.dumps(body),
+        "attributes": {"SentTimestamp": "1700000000123"},
+    }
+
+
+def test_records_are_written_with_queue_timestamp():
+    kinesis = StubKinesis()
+    records = [sqs_message(f"m{i}", {"app_id": "lab", "session_id": f"s{i}"}) for i in range(3)]
+
+    assert ingest_consumer.process_records(records, kinesis, "events") == []
+
+    stream_name, written = kinesis.calls[0]
+    assert stream_name == "events"
+    assert [record["PartitionKey"] for record in written] == ["s0", "s1", "s2"]
+    event = json.loads(written[0]["Data"])
+    assert event["create_ts"] == "2023-11-14 22:13:20.123000"
+
+
+def test_only_failed_entries_are_retried():
+    kinesis = StubKinesis(fail_keys={"s1"})
+    records = [sqs_message(f"m{i}", {"session_id": f"s{i}"}) for i in range(3)]
+
+    assert ingest_consumer.process_records(records, kinesis, "events") == ["m1"]
+
+
+def test_malformed_messages_are_left_on_the_queue():
+    kinesis = StubKinesis()
+    records = [sqs_message("bad", "not json"), sqs_message("list", [1, 2]), sqs_message("good", {"session_id": "s"})]
+
+    assert ingest_consumer.process_records(records, kinesis, "events") == ["bad", "list"]
+    assert len(kinesis.calls[0][1]) == 1
+
+
+def test_put_records_error_fails_the_whole_batch():
+    kinesis = StubKinesis(error=RuntimeError("throttled"))
+    records = [sqs_message(f"m{i}", {"session_id": f"s{i}"}) for i in range(2)]
+
+    assert ingest_consumer.process_records(records, kinesis, "events") == ["m0", "m1"]
+
+
+def test_batches_respect_put_records_limits(monkeypatch):
+    monkeypatch.setattr(ingest_consumer, "MAX_RECORDS_PER_PUT", 2)
+    kinesis = StubKinesis()
+    records = [sqs_message(f"m{i}", {"session_id": f"s{i}"}) for i in range(5)]
+
+    ingest_consumer.process_records(records, kinesis, "events")
+
+    assert [len(call[1]) for call in kinesis.calls] == [2, 2, 1]
+
+
+def test_handler_reports_batch_item_failures(monkeypatch):
+    kinesis = StubKinesis(fail_keys={"s0"})
+    monkeypatch.setattr(ingest_consumer, "kinesis_client", lambda: kinesis)
+    monkeypatch.setenv("KDS_NAME", "events")
+
+    response = ingest_consumer.handler({"Records": [sqs_message("m0", {"session_id": "s0"})]}, None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m0"}]}
+
+
+def test_partition_key_strategy_from_env(monkeypatch):
+    monkeypatch.setenv("PARTITION_KEY_STRATEGY", "user")
+    kinesis = StubKinesis()
+    records = [sqs_message("m0", {"app_id": "lab", "user_id": "u1", "session_id": "s0"})]
+
+    ingest_consumer.process_records(records, kinesis, "events")
+
+    assert kinesis.calls[0][1][0]["PartitionKey"] == "u1"
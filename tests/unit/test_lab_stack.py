@@ -1,14 +1,214 @@
+import json
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
 
-from cdklab.cdklab_stack import LabDeployStack
+from cdklab.app_stacks import build_stacks
+
+
+def lab_template(app_config):
+    app = core.App()
+    stacks = build_stacks(app, app_config)
+    return assertions.Template.from_stack(stacks["lab"])
+
+
+def test_lab_stack_snapshot(app_config, snapshot):
+    snapshot("lab_stack", lab_template(app_config))
+
+
+def test_redis_replication_group(app_config):
+    template = lab_template(app_config)
+
+    template.has_resource_properties("AWS::ElastiCache::ReplicationGroup", {
+        "CacheNodeType": "cache.t4g.micro",
+        "Engine": "redis",
+        "TransitEncryptionEnabled": True,
+    })
+
+
+def test_services_and_listener_rule(app_config):
+    template = lab_template(app_config)
+
+    template.resource_count_is("AWS::ECS::Service", 3)
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::ListenerRule", {
+        "Priority": 10,
+        "Conditions": [{
+            "Field": "path-pattern",
+            "PathPatternConfig": {"Values": ["/api/*", "/docs"]},
+        }],
+    })
+
+
+def test_tracing_adds_collector_to_fastapi_and_celery(app_config):
+    app_config["tracing"] = {"enabled": True, "sampling_rate": 0.1}
+    template = lab_template(app_config)
+
+    task_definitions = template.find_resources("AWS::ECS::TaskDefinition")
+    collectors = {
+        definition["Properties"]["Family"]
+        for definition in task_definitions.values()
+        for container in definition["Properties"]["ContainerDefinitions"]
+        if container["Name"].endswith("-otel-collector")
+    }
+    assert collectors == {"fastapi", "celery"}
+
+
+def cloudfront_origin(template):
+    distribution = template.find_resources("AWS::CloudFront::Distribution")
+    return list(distribution.values())[0]["Properties"]["DistributionConfig"]
+
+
+def load_balancer_ingress(template):
+    return [
+        rule
+        for group in template.find_resources("AWS::EC2::SecurityGroup").values()
+        if "Application Load Balancer" in group["Properties"].get("GroupDescription", "")
+        for rule in group["Properties"].get("SecurityGroupIngress", [])
+    ] + [
+        ingress["Properties"] for ingress in template.find_resources("AWS::EC2::SecurityGroupIngress").values()
+        if "CloudFront" in ingress["Properties"].get("Description", "")
+    ]
+
+
+def test_cloudfront_in_front_of_load_balancer(app_config):
+    app_config["cdklab"]["cloudfront"] = {
+        "enabled": True,
+        "origin_shield_region": "us-east-1",
+        "path_ttls": {"/docs": {"default_ttl_seconds": 3600, "max_ttl_seconds": 86400}},
+    }
+    template = lab_template(app_config)
+
+    config = cloudfront_origin(template)
+    assert [behavior["PathPattern"] for behavior in config["CacheBehaviors"]] == ["/api/*", "/docs", "/static/*"]
+    assert all(behavior["Compress"] for behavior in config["CacheBehaviors"])
+    origin = config["Origins"][0]
+    assert origin["OriginShield"] == {"Enabled": True, "OriginShieldRegion": "us-east-1"}
+    # no secret header over plain http, the prefix list keeps other traffic out
+    assert "OriginCustomHeaders" not in origin
+    template.resource_count_is("AWS::SecretsManager::Secret", 1)
+
+    template.has_resource_properties("AWS::CloudFront::CachePolicy", {
+        "CachePolicyConfig": assertions.Match.object_like({
+            "DefaultTTL": 3600,
+            "MaxTTL": 86400,
+            "ParametersInCacheKeyAndForwardedToOrigin": assertions.Match.object_like({
+                "EnableAcceptEncodingBrotli": True,
+                "EnableAcceptEncodingGzip": True,
+            }),
+        }),
+    })
+
+    # only CloudFront's origin facing addresses reach the ALB
+    ingress = load_balancer_ingress(template)
+    assert not any(rule.get("CidrIp") == "0.0.0.0/0" for rule in ingress)
+    assert [rule["FromPort"] for rule in ingress if "SourcePrefixListId" in rule] == [80]
+    template.has_resource_properties("Custom::AWS", {
+        "Create": assertions.Match.string_like_regexp("com.amazonaws.global.cloudfront.origin-facing"),
+    })
+
+
+def test_cloudfront_caches_api_paths_per_authorization(app_config):
+    app_config["cdklab"]["cloudfront"] = {
+        "enabled": True,
+        "path_ttls": {
+            "/api/*": {"cache_headers": ["Accept-Language"]},
+            "/docs": {"public": True, "default_ttl_seconds": 3600},
+        },
+    }
+    template = lab_template(app_config)
+
+    policies = {
+        policy["Properties"]["CachePolicyConfig"]["DefaultTTL"]:
+            policy["Properties"]["CachePolicyConfig"]["ParametersInCacheKeyAndForwardedToOrigin"]["HeadersConfig"]
+        for policy in template.find_resources("AWS::CloudFront::CachePolicy").values()
+    }
+    assert policies[0] == {"HeaderBehavior": "whitelist", "Headers": ["Authorization", "Accept-Language"]}
+    assert policies[3600] == {"HeaderBehavior": "none"}
+
+
+def test_cloudfront_reaches_https_origin_with_verify_header(app_config):
+    app_config["cdklab"]["cloudfront"] = {
+        "enabled": True,
+        "origin_domain_name": "origin.cdklab.example.com",
+        "origin_certificate_arn": "arn:aws:acm:us-east-1:123456789012:certificate/abc",
+        "origin_prefix_list_id": "pl-3b927c52",
+    }
+    template = lab_template(app_config)
+
+    origin = cloudfront_origin(template)["Origins"][0]
+    assert origin["DomainName"] == "origin.cdklab.example.com"
+    assert origin["CustomOriginConfig"]["OriginProtocolPolicy"] == "https-only"
+    assert origin["OriginCustomHeaders"][0]["HeaderName"] == "X-Origin-Verify"
+
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::Listener", {
+        "Protocol": "HTTPS",
+        "Port": 443,
+        "Certificates": [{"CertificateArn": "arn:aws:acm:us-east-1:123456789012:certificate/abc"}],
+    })
+    # requests from other distributions without the header are rejected
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::Listener", {
+        "DefaultActions": [assertions.Match.object_like({
+            "Type": "fixed-response",
+            "FixedResponseConfig": assertions.Match.object_like({"StatusCode": "403"}),
+        })],
+    })
+    template.has_resource_properties("AWS::ElasticLoadBalancingV2::ListenerRule", {
+        "Priority": 20,
+        "Conditions": [assertions.Match.object_like({"Field": "http-header"})],
+    })
+    ingress = load_balancer_ingress(template)
+    assert [(rule["SourcePrefixListId"], rule["FromPort"]) for rule in ingress] == [("pl-3b927c52", 443)]
+    template.resource_count_is("Custom::AWS", 0)
+
+
+def test_celery_pools_create_one_service_each(app_config):
+    app_config["cdklab"]["celery"]["pools"] = [
+        {"name": "default", "queues": ["celery"], "concurrency": 4, "prefetch_multiplier": 4,
+         "scaling": {"min_capacity": 1, "max_capacity": 4}},
+        {"name": "cpu", "queues": ["reports"], "cpu_limit": 2048, "memory_limit": 4096, "prefetch_multiplier": 1,
+         "scaling": {"min_capacity": 1, "max_capacity": 8, "cpu_target_percent": 60}},
+        {"name": "io", "queues": ["webhooks", "email"], "pool": "gevent", "concurrency": 100},
+    ]
+    template = lab_template(app_config)
+
+    template.resource_count_is("AWS::ECS::Service", 5)
+    task_definitions = {
+        definition["Properties"]["Family"]: definition["Properties"]
+        for definition in template.find_resources("AWS::ECS::TaskDefinition").values()
+    }
+    assert {"celery-default", "celery-cpu", "celery-io"} <= set(task_definitions)
+    assert "celery" not in task_definitions
+
+    cpu = task_definitions["celery-cpu"]
+    assert (cpu["Cpu"], cpu["Memory"]) == ("2048", "4096")
+    assert cpu["ContainerDefinitions"][0]["Command"] == [
+        "celery", "-A", "app.worker", "worker",
+        "--queues", "reports", "--pool", "prefork", "--hostname", "cpu@%h",
+        "--concurrency", "2", "--prefetch-multiplier", "1",
+    ]
+    io_command = task_definitions["celery-io"]["ContainerDefinitions"][0]["Command"]
+    assert io_command[io_command.index("--pool") + 1] == "gevent"
+
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 2)
+    assert not any("DesiredCount" in service["Properties"] for service in template.find_resources("AWS::ECS::Service").values())
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+        "MinCapacity": 1,
+        "MaxCapacity": 8,
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "TargetTrackingScalingPolicyConfiguration": assertions.Match.object_like({"TargetValue": 60}),
+    })
+
 
-# example tests. To run these tests, uncomment this file along with the example
-def test_sqs_queue_created():
+def test_monitoring_covers_every_celery_pool(app_config):
+    app_config["cdklab"]["celery"]["pools"] = [
+        {"name": "default", "queues": ["celery"]},
+        {"name": "cpu", "queues": ["reports"]},
+    ]
     app = core.App()
-    stack = LabDeployStack(app, "labstack")
-    template = assertions.Template.from_stack(stack)
+    stacks = build_stacks(app, app_config)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+    assert {"celery-default", "celery-cpu"} <= set(stacks["lab"].celery_pools)
+    dashboard = assertions.Template.from_stack(stacks["monitoring"]).find_resources("AWS::CloudWatch::Dashboard")
+    body = json.dumps(list(dashboard.values())[0]["Properties"]["DashboardBody"])
+    assert "celery-default" in body and "celery-cpu" in body
@@ -0,0 +1,117 @@
+import aws_cdk.assertions as assertions
+import aws_cdk.aws_kinesis as kinesis
+import pytest
+
+from cdklab.app_config import DEFAULTS, StreamCapacity, merge_defaults
+from cdklab.lambda_deploy import PARTITION_KEY_STRATEGIES, LambdaDeploy
+
+
+def ingest_config(settings: dict = None) -> dict:
+    """The ingest section and its typed capacity, as build_stacks passes them."""
+    analytics = merge_defaults(DEFAULTS["analytics"], {"ingest": settings or {}})
+    return {
+        "ingest": analytics["ingest"],
+        "memory_size": analytics["ingest"]["memory_size"],
+        "capacity": StreamCapacity.from_config(analytics),
+    }
+
+
+def test_lambda_deploy_snapshot(component_stack, snapshot):
+    stack, vpc = component_stack
+    stream = kinesis.CfnStream(stack, "stream", name="cdklab-events", shard_count=1)
+    LambdaDeploy(stack, "events", vpc=vpc, stream=stream, **ingest_config())
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "ingest.handler",
+        "Environment": {"Variables": {"KDS_NAME": "cdklab-events"}},
+    })
+    snapshot("lambda_deploy", template)
+
+
+def test_lambda_deploy_active_tracing(component_stack):
+    stack, vpc = component_stack
+    stream = kinesis.CfnStream(stack, "stream", name="cdklab-events", shard_count=1)
+    LambdaDeploy(stack, "events", vpc=vpc, stream=stream, tracing=True, **ingest_config())
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "TracingConfig": {"Mode": "Active"},
+    })
+    template.has_resource_properties("AWS::ApiGateway::Stage", {
+        "TracingEnabled": True,
+    })
+
+
+def test_lambda_deploy_queue_ingest(component_stack):
+    stack, vpc = component_stack
+    stream = kinesis.CfnStream(stack, "stream", name="cdklab-events", shard_count=1)
+    LambdaDeploy(stack, "events", vpc=vpc, stream=stream, **ingest_config({
+        "mode": "queue",
+        "batch_size": 200,
+        "max_batching_window_seconds": 10,
+    }))
+    template = assertions.Template.from_stack(stack)
+
+    template.resource_count_is("AWS::SQS::Queue", 2)
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "ingest_consumer.handler",
+    })
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "BatchSize": 200,
+        "MaximumBatchingWindowInSeconds": 10,
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+    })
+    template.has_resource_properties("AWS::ApiGateway::Method", {
+        "HttpMethod": "POST",
+        "Integration": assertions.Match.object_like({
+            "Type": "AWS",
+            "IntegrationResponses": assertions.Match.array_with([
+                assertions.Match.object_like({"StatusCode": "202"}),
+            ]),
+        }),
+    })
+
+
+def test_lambda_deploy_rejects_unknown_ingest_mode(component_stack):
+    stack, vpc = component_stack
+    stream = kinesis.CfnStream(stack, "stream", name="cdklab-events", shard_count=1)
+
+    with pytest.raises(ValueError, match="unsupported ingest mode"):
+        LambdaDeploy(stack, "events", vpc=vpc, stream=stream, **ingest_config({"mode": "firehose"}))
+
+
+def test_lambda_deploy_partition_key_strategy(component_stack):
+    stack, vpc = component_stack
+    stream = kinesis.CfnStream(stack, "stream", name="cdklab-events", shard_count=4)
+    LambdaDeploy(stack, "events", vpc=vpc, stream=stream, **ingest_config({
+        "partition_key": {"strategy": "balanced", "fields": ["app_id", "user_id"], "spread": 2},
+    }))
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": assertions.Match.object_like({
+            "PARTITION_KEY_STRATEGY": "balanced",
+            "PARTITION_KEY_FIELDS": "app_id,user_id",
+            "PARTITION_KEY_SPREAD": "2",
+            "SHARD_COUNT": "4",
+        })},
+    })
+
+
+@pytest.mark.parametrize("partition_key, message", [
+    ({"strategy": "random"}, "unsupported partition key strategy"),
+    ({"strategy": "composite"}, "needs a list of fields"),
+])
+def test_lambda_deploy_rejects_partition_key_config(component_stack, partition_key, message):
+    stack, vpc = component_stack
+    stream = kinesis.CfnStream(stack, "stream", name="cdklab-events", shard_count=1)
+
+    with pytest.raises(ValueError, match=message):
+        LambdaDeploy(stack, "events", vpc=vpc, stream=stream, **ingest_config({"partition_key": partition_key}))
+
+
+def test_partition_key_strategies_match_the_runtime():
+    import partition_keys
+
+    assert sorted(PARTITION_KEY_STRATEGIES) == sorted(partition_keys.STRATEGIES)
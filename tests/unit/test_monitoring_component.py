@@ -0,0 +1,76 @@
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from cdklab.app_stacks import build_stacks
+
+
+def monitoring_template(app_config):
+    app = core.App()
+    stacks = build_stacks(app, app_config)
+    return assertions.Template.from_stack(stacks["monitoring"])
+
+
+def test_monitoring_stack_snapshot(app_config, snapshot):
+    snapshot("monitoring_stack", monitoring_template(app_config))
+
+
+def test_alarms_use_configured_thresholds(app_config):
+    template = monitoring_template(app_config)
+
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 1)
+    # alb p99 + 2x5xx, 3 services x cpu/memory, 3 redis, 2 aurora, 2 kinesis, 2 lambda
+    template.resource_count_is("AWS::CloudWatch::Alarm", 18)
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "MetricName": "TargetResponseTime",
+        "ExtendedStatistic": "p99",
+        "Threshold": 1.5,
+    })
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "MetricName": "EngineCPUUtilization",
+        "Dimensions": [{"Name": "CacheClusterId", "Value": "labstack-redis-001"}],
+        "Threshold": 80,
+    })
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "MetricName": "GetRecords.IteratorAgeMilliseconds",
+        "Dimensions": [{"Name": "StreamName", "Value": "cdklab-events"}],
+        "Threshold": 60000,
+    })
+
+
+def test_metrics_without_thresholds_are_graphed_only(app_config):
+    app_config["monitoring"]["thresholds"] = {"lambda_throttles": 1}
+    template = monitoring_template(app_config)
+
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 1)
+    template.resource_count_is("AWS::CloudWatch::Alarm", 1)
+
+
+def test_monitoring_is_optional(app_config):
+    del app_config["monitoring"]
+    stacks = build_stacks(core.App(), app_config)
+
+    assert "monitoring" not in stacks
+
+
+def test_queue_ingest_backlog_alarm(app_config):
+    app_config["analytics"]["ingest"]["mode"] = "queue"
+    template = monitoring_template(app_config)
+
+    template.has_resource_properties("AWS::CloudWatch::Alarm", {
+        "MetricName": "ApproximateAgeOfOldestMessage",
+        "Threshold": 300,
+    })
+
+
+def test_redis_alarms_cover_every_node(app_config):
+    app_config["cdklab"]["redis_replicas"] = 1
+    template = monitoring_template(app_config)
+
+    # after a failover the replica is the primary
+    for node in ("labstack-redis-001", "labstack-redis-002"):
+        template.has_resource_properties("AWS::CloudWatch::Alarm", {
+            "MetricName": "EngineCPUUtilization",
+            "Dimensions": [{"Name": "CacheClusterId", "Value": node}],
+            "Threshold": 80,
+        })
+    template.resource_count_is("AWS::CloudWatch::Alarm", 21)
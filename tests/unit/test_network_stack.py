@@ -0,0 +1,57 @@
+import json
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+
+from cdklab.network_stack import NetworkStack
+
+
+def network_template(app_config):
+    app = core.App()
+    return assertions.Template.from_stack(NetworkStack(app, "NetworkStack", app_config))
+
+
+def test_network_stack_snapshot(app_config, snapshot):
+    snapshot("network_stack", network_template(app_config))
+
+
+def test_nat_gateway_per_az_by_default(app_config):
+    template = network_template(app_config)
+
+    template.resource_count_is("AWS::EC2::NatGateway", 2)
+    template.resource_count_is("AWS::EC2::VPCEndpoint", 0)
+
+
+def test_single_nat_gateway(app_config):
+    app_config["network"]["nat_mode"] = "single"
+    template = network_template(app_config)
+
+    template.resource_count_is("AWS::EC2::NatGateway", 1)
+
+
+def test_vpc_endpoints_from_config(app_config):
+    app_config["network"]["gateway_endpoints"] = ["s3"]
+    app_config["network"]["interface_endpoints"] = ["ecr_api", "ecr_dkr", "secrets_manager", "logs", "kinesis", "xray"]
+    template = network_template(app_config)
+
+    endpoints = template.find_resources("AWS::EC2::VPCEndpoint")
+    endpoint_types = sorted(endpoint["Properties"]["VpcEndpointType"] for endpoint in endpoints.values())
+    assert endpoint_types == ["Gateway"] + ["Interface"] * 6
+    assert "kinesis-streams" in json.dumps(endpoints)
+    template.has_resource_properties("AWS::EC2::VPCEndpoint", {
+        "VpcEndpointType": "Interface",
+        "PrivateDnsEnabled": True,
+    })
+
+
+@pytest.mark.parametrize("key, value, message", [
+    ("nat_mode", "none", "unsupported nat_mode"),
+    ("gateway_endpoints", ["sqs"], "unsupported gateway endpoint"),
+    ("interface_endpoints", ["ecr"], "unsupported interface endpoint"),
+])
+def test_network_stack_rejects_bad_config(app_config, key, value, message):
+    app_config["network"][key] = value
+
+    with pytest.raises(ValueError, match=message):
+        network_template(app_config)
@@ -0,0 +1,149 @@
+import json
+
+import pytest
+
+import partition_keys
+
+
+def sample_events():
+    # one long session dominating the sample, as seen with hot shards
+    events = [{"app_id": "lab", "user_id": "u1", "session_id": "long", "event_id": f"l{i}"} for i in range(400)]
+    events += [
+        {"app_id": ("lab", "shop")[i % 2], "user_id": f"u{i % 40}", "session_id": f"s{i}", "event_id": f"e{i}"}
+        for i in range(400)
+    ]
+    return events
+
+
+def test_field_strategies_prefer_the_configured_fields():
+    event = {"app_id": "lab", "user_id": "u1", "session_id": "s1"}
+
+    assert partition_keys.partition_key(event, "session") == ("s1", None)
+    assert partition_keys.partition_key(event, "user") == ("u1", None)
+    assert partition_keys.partition_key(event, "app") == ("lab", None)
+    assert partition_keys.partition_key({"session_id": "s1"}, "user") == ("s1", None)
+
+
+def test_missing_fields_fall_back_to_a_random_key():
+    first, _ = partition_keys.partition_key({}, "session")
+    second, _ = partition_keys.partition_key({}, "session")
+
+    assert first != second
+
+
+def test_composite_hashes_the_fields():
+    key, explicit_hash_key = partition_keys.partition_key({"app_id": "lab", "user_id": "u1"}, "composite", ["app_id", "user_id"])
+
+    assert len(key) == 32
+    assert explicit_hash_key is None
+    assert partition_keys.partition_key({"app_id": "lab", "user_id": "u1"}, "composite", ["app_id", "user_id"])[0] == key
+
+
+def test_balanced_hash_keys_sit_inside_a_shard_range():
+    for shard_count in (1, 4, 7):
+        _, explicit_hash_key = partition_keys.partition_key({"session_id": "s1"}, "balanced", shard_count=shard_count)
+        hash_key = int(explicit_hash_key)
+        range_size = partition_keys.HASH_KEY_SPACE // shard_count
+
+        assert 0 <= hash_key < partition_keys.HASH_KEY_SPACE
+        assert hash_key % range_size == range_size // 2
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError, match="unsupported partition key strategy"):
+        partition_keys.partition_key({"session_id": "s1"}, "random")
+
+
+def test_record_entry_adds_explicit_hash_key():
+    settings = {"strategy": "balanced", "fields": None, "shard_count": 4, "spread": 1}
+
+    entry = partition_keys.record_entry({"session_id": "s1"}, "data", settings)
+
+    assert set(entry) == {"Data", "PartitionKey", "ExplicitHashKey"}
+    assert "ExplicitHashKey" not in partition_keys.record_entry({"session_id": "s1"}, "data", settings | {"strategy": "session"})
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("PARTITION_KEY_STRATEGY", "composite")
+    monkeypatch.setenv("PARTITION_KEY_FIELDS", "app_id,user_id")
+    monkeypatch.setenv("SHARD_COUNT", "4")
+
+    assert partition_keys.settings_from_env() == {
+        "strategy": "composite", "fields": ["app_id", "user_id"], "shard_count": 4, "spread": 1,
+    }
+
+
+def test_shard_index_covers_equal_ranges():
+    assert partition_keys.shard_index(0, 4) == 0
+    assert partition_keys.shard_index(partition_keys.HASH_KEY_SPACE // 4, 4) == 1
+    assert partition_keys.shard_index(partition_keys.HASH_KEY_SPACE - 1, 4) == 3
+
+
+def list_shards_response():
+    # a two shard stream whose first shard was merged, the open shards are unequal
+    quarter = partition_keys.HASH_KEY_SPACE // 4
+    return {"Shards": [
+        {"ShardId": "shardId-000", "HashKeyRange": {"StartingHashKey": "0", "EndingHashKey": str(quarter - 1)},
+         "SequenceNumberRange": {"StartingSequenceNumber": "1", "EndingSequenceNumber": "2"}},
+        {"ShardId": "shardId-002", "HashKeyRange": {"StartingHashKey": str(quarter), "EndingHashKey": str(partition_keys.HASH_KEY_SPACE - 1)},
+         "SequenceNumberRange": {"StartingSequenceNumber": "3"}},
+        {"ShardId": "shardId-001", "HashKeyRange": {"StartingHashKey": "0", "EndingHashKey": str(quarter - 1)},
+         "SequenceNumberRange": {"StartingSequenceNumber": "3"}},
+    ]}
+
+
+def test_shard_index_uses_the_real_shard_ranges():
+    ranges = partition_keys.shard_ranges(list_shards_response())
+
+    assert len(ranges) == 2
+    assert partition_keys.shard_index(partition_keys.HASH_KEY_SPACE // 2, 2) == 1
+    assert partition_keys.shard_index(partition_keys.HASH_KEY_SPACE // 8, 2, ranges) == 0
+    assert partition_keys.shard_index(partition_keys.HASH_KEY_SPACE // 2, 2, ranges) == 1
+
+
+def test_unequal_shard_ranges_show_up_as_imbalance():
+    events = [{"session_id": f"s{i}"} for i in range(2000)]
+    ranges = partition_keys.shard_ranges(list_shards_response())
+
+    equal = partition_keys.imbalance_report(partition_keys.simulate(events, "session", shard_count=2))
+    real = partition_keys.imbalance_report(partition_keys.simulate(events, "session", ranges=ranges))
+
+    assert equal["imbalance"] < 1.1
+    assert real["imbalance"] > 1.4
+
+
+def test_hot_session_shows_up_as_imbalance():
+    events = sample_events()
+
+    session = partition_keys.imbalance_report(partition_keys.simulate(events, "session", shard_count=4))
+    spread = partition_keys.imbalance_report(partition_keys.simulate(events, "balanced", shard_count=4, spread=4))
+
+    assert session["hot_keys"][0] == ("long", 400)
+    assert session["imbalance"] > 2
+    assert spread["imbalance"] < session["imbalance"]
+    assert sum(shard["records"] for shard in session["shards"]) == len(events)
+
+
+def test_analyzer_cli(tmp_path, capsys):
+    sample = tmp_path / "sample.jsonl"
+    sample.write_text("\n".join(json.dumps(event) for event in sample_events()))
+
+    partition_keys.main([str(sample), "--shards", "4", "--strategy", "session", "--strategy", "user"])
+
+    output = capsys.readouterr().out
+    assert output.startswith("session: imbalance")
+    assert "user: imbalance" in output
+    assert "hot key long: 400" in output
+
+
+def test_analyzer_cli_reads_the_shards_file(tmp_path, capsys):
+    sample = tmp_path / "sample.jsonl"
+    sample.write_text("\n".join(json.dumps(event) for event in sample_events()))
+    shards = tmp_path / "shards.json"
+    shards.write_text(json.dumps(list_shards_response()))
+
+    partition_keys.main([str(sample), "--shards-file", str(shards), "--strategy", "composite"])
+
+    output = capsys.readouterr().out
+    assert "shard 1:" in output
+    assert "shard 2:" not in output
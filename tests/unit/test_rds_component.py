@@ -0,0 +1,23 @@
+import aws_cdk.assertions as assertions
+import aws_cdk.aws_iam as iam
+
+from cdklab.app_config import AuroraCapacity
+from cdklab.rds_component import RDSComponent
+
+
+def test_rds_component_snapshot(app_config, component_stack, snapshot):
+    stack, vpc = component_stack
+    RDSComponent(
+        stack,
+        "database",
+        config=app_config["cdklab"]["database"],
+        capacity=AuroraCapacity.from_config(app_config["cdklab"]["database"]),
+        vpc=vpc,
+        ecs_task_role=iam.Role(stack, "role", assumed_by=iam.ServicePrincipal("ecs-tasks.amazonaws.com")),
+    )
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::RDS::DBCluster", {
+        "ServerlessV2ScalingConfiguration": {"MinCapacity": 0.5, "MaxCapacity": 4},
+    })
+    snapshot("rds_component", template)
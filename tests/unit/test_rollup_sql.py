@@ -0,0 +1,53 @@
+import pytest
+
+from cdklab.event_stack import EVENT_COLUMNS
+from cdklab.rollup_sql import dimension_column, rollup_columns, rollup_insert_sql, struct_fields
+
+COLUMNS = dict(EVENT_COLUMNS)
+DIMENSIONS = ["app_id", "event_type", "device.os"]
+
+
+def test_struct_fields():
+    assert struct_fields("struct<hostname:string,os:string,client_ip:string>") == {
+        "hostname": "string", "os": "string", "client_ip": "string",
+    }
+    assert struct_fields("struct<tags:map<string,string>,id:int>") == {"tags": "map<string,string>", "id": "int"}
+    assert struct_fields("string") == {}
+
+
+def test_dimension_resolves_struct_fields():
+    assert dimension_column(COLUMNS, "app_id") == ('"app_id"', "app_id", "string")
+    assert dimension_column(COLUMNS, "device.os") == ('"device"."os"', "device_os", "string")
+
+
+@pytest.mark.parametrize("dimension", ["platform", "device.model", "device"])
+def test_dimension_rejects_unknown_or_nested_columns(dimension):
+    with pytest.raises(ValueError, match="unsupported rollup dimension"):
+        dimension_column(COLUMNS, dimension)
+
+
+def test_rollup_columns():
+    assert rollup_columns(COLUMNS, DIMENSIONS) == [
+        ("app_id", "string"),
+        ("event_type", "string"),
+        ("device_os", "string"),
+        ("event_count", "bigint"),
+    ]
+
+
+def test_rollup_sql_prunes_partitions():
+    sql = rollup_insert_sql("cdklab", "app_events", "app_events_hourly", COLUMNS, DIMENSIONS)
+
+    assert sql == (
+        'INSERT INTO "cdklab"."app_events_hourly"\n'
+        'SELECT\n'
+        '    "app_id" AS "app_id",\n'
+        '    "event_type" AS "event_type",\n'
+        '    "device"."os" AS "device_os",\n'
+        '    count(*) AS "event_count",\n'
+        '    \'{dt}\' AS "dt"\n'
+        'FROM "cdklab"."app_events"\n'
+        "WHERE dt = '{dt}'\n"
+        'GROUP BY "app_id", "event_type", "device"."os"'
+    )
+
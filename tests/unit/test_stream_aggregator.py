@@ -0,0 +1,204 @@
+import base64
+import io
+import json
+
+import pytest
+
+import stream_aggregator
+
+
+class StubPipeline:
+    """Local stand-in for the redis pipeline recording the commands sent.
+
+    Without the scripts loaded EVALSHA replies NOSCRIPT like redis does, the
+    counters script replies 0 for a flush marker it has seen.
+    """
+
+    def __init__(self, script_loaded=False):
+        self.commands = []
+        self.pending = []
+        self.executions = 0
+        self.script_loaded = script_loaded
+        self.markers = set()
+
+    def execute_command(self, *args):
+        self.commands.append(args)
+        self.pending.append(args)
+        return self
+
+    def reply(self, command):
+        if command[:2] == ("SCRIPT", "LOAD"):
+            self.script_loaded = True
+            return stream_aggregator.SESSION_SCRIPT_SHA
+        if command[0] == "EVALSHA" and not self.script_loaded:
+            return stream_aggregator.RedisError("NOSCRIPT No matching script. Please use EVAL.")
+        if command[:2] == ("EVALSHA", stream_aggregator.COUNTS_SCRIPT_SHA):
+            if command[3] in self.markers:
+                return 0
+            self.markers.add(command[3])
+        return 1
+
+    def execute(self, raise_on_error=True):
+        self.executions += 1
+        replies = [self.reply(command) for command in self.pending]
+        self.pending = []
+        return replies
+
+
+@pytest.fixture(autouse=True)
+def fresh_container(monkeypatch):
+    monkeypatch.setattr(stream_aggregator, "_scripts_loaded", False)
+
+
+def kinesis_record(event, sequence="1"):
+    data = base64.b64encode(json.dumps(event).encode()).decode()
+    return {"eventID": f"shardId-000000000000:{sequence}", "kinesis": {"data": data, "sequenceNumber": sequence}}
+
+
+def counters(commands):
+    """(window or total key, event type, count) of every counters script call."""
+    added = []
+    for command in commands:
+        if command[:2] == ("EVALSHA", stream_aggregator.COUNTS_SCRIPT_SHA):
+            keys = command[3:3 + command[2]]
+            args = command[3 + command[2]:]
+            for index in range(1, len(keys), 2):
+                added.append((keys[index], args[index], args[index + 1]))
+                added.append((keys[index + 1], args[index], args[index + 1]))
+    return added
+
+
+def synthetic_batch():
+    return [
+        kinesis_record({"app_id": "lab", "event_type": "click", "session_id": "s1", "create_ts": "2024-01-01 10:00:00.000000"}, "1"),
+        kinesis_record({"app_id": "lab", "event_type": "click", "session_id": "s1", "create_ts": "2024-01-01 10:00:30.500000"}, "2"),
+        kinesis_record({"app_id": "lab", "event_type": "view", "session_id": "s2", "create_ts": "2024-01-01 10:00:10.000000"}, "3"),
+        kinesis_record({"app_id": "shop", "event_type": "click"}, "4"),
+    ]
+
+
+def test_aggregate_counts_and_sessions():
+    state = stream_aggregator.aggregate(synthetic_batch())
+
+    assert state["counts"] == {"lab|click": 2, "lab|view": 1, "shop|click": 1}
+    assert state["last_record"] == "shardId-000000000000:4"
+    first, last = state["sessions"]["s1"][1:]
+    assert state["sessions"]["s1"][0] == "lab"
+    assert last - first == 30.5
+
+
+def test_aggregate_carries_window_state():
+    state = stream_aggregator.aggregate(synthetic_batch()[:1])
+    state = json.loads(json.dumps(state))  # state round trips through lambda as json
+    state = stream_aggregator.aggregate(synthetic_batch()[1:2], state)
+
+    assert state["counts"] == {"lab|click": 2}
+    assert state["sessions"]["s1"][2] - state["sessions"]["s1"][1] == 30.5
+
+
+def test_aggregate_skips_malformed_records():
+    records = [{"kinesis": {"data": "bm90IGpzb24=", "sequenceNumber": "7"}}] + synthetic_batch()[:1]
+
+    assert stream_aggregator.aggregate(records)["counts"] == {"lab|click": 1}
+
+
+def test_flush_pipelines_all_commands_in_one_round_trip():
+    pipeline = StubPipeline()
+    stream_aggregator.flush(stream_aggregator.aggregate(synthetic_batch()), pipeline, "2024-01-01T10:00:00Z", 3600)
+
+    assert pipeline.executions == 1
+    counts = [command for command in pipeline.commands if command[:2] == ("EVALSHA", stream_aggregator.COUNTS_SCRIPT_SHA)]
+    assert len(counts) == 1
+    assert counts[0][3:5] == ("flushed:shardId-000000000000:4", "events:lab:2024-01-01T10:00:00Z")
+    assert ("events:lab:2024-01-01T10:00:00Z", "click", 2) in counters(pipeline.commands)
+    assert ("events:shop:total", "click", 1) in counters(pipeline.commands)
+    sessions = [command for command in pipeline.commands if command[:2] == ("EVALSHA", stream_aggregator.SESSION_SCRIPT_SHA)]
+    assert [command[3:5] for command in sessions] == [("session:s1", "session_durations:lab"), ("session:s2", "session_durations:lab")]
+    assert {command[-1] for command in sessions} == {stream_aggregator.SESSION_RANK_SIZE}
+
+
+def test_retried_flush_adds_the_counters_once():
+    pipeline = StubPipeline()
+    state = stream_aggregator.aggregate(synthetic_batch())
+
+    first = stream_aggregator.flush(state, pipeline, "2024-01-01T10:00:00Z", 3600)
+    retried = stream_aggregator.flush(state, pipeline, "2024-01-01T10:00:00Z", 3600)
+
+    # the counters script is the first call after the script loads
+    assert first[2] == 1
+    assert retried[0] == 0
+
+
+def test_script_is_loaded_once_per_container():
+    pipeline = StubPipeline()
+    state = stream_aggregator.aggregate(synthetic_batch())
+    stream_aggregator.flush(state, pipeline, "2024-01-01T10:00:00Z", 3600)
+    stream_aggregator.flush(state, pipeline, "2024-01-01T10:01:00Z", 3600)
+
+    assert pipeline.executions == 2
+    assert [command[0] for command in pipeline.commands].count("SCRIPT") == 2
+    assert pipeline.commands[:2] == [
+        ("SCRIPT", "LOAD", stream_aggregator.SESSION_SCRIPT),
+        ("SCRIPT", "LOAD", stream_aggregator.COUNTS_SCRIPT),
+    ]
+    assert not any(command[0] == "EVAL" for command in pipeline.commands)
+
+
+def test_lost_scripts_are_reloaded(monkeypatch):
+    # the container loaded the scripts before redis failed over
+    monkeypatch.setattr(stream_aggregator, "_scripts_loaded", True)
+    pipeline = StubPipeline(script_loaded=False)
+
+    replies = stream_aggregator.flush(stream_aggregator.aggregate(synthetic_batch()), pipeline, "2024-01-01T10:00:00Z", 3600)
+
+    assert pipeline.executions == 2
+    assert all(reply == 1 for reply in replies)
+    resent = pipeline.commands[len(pipeline.commands) - 5:]
+    assert [command[0] for command in resent] == ["SCRIPT", "SCRIPT", "EVALSHA", "EVALSHA", "EVALSHA"]
+    assert pipeline.markers == {"flushed:shardId-000000000000:4"}
+
+
+def test_handler_returns_state_until_final_window_invoke(monkeypatch):
+    pipeline = StubPipeline()
+    monkeypatch.setattr(stream_aggregator, "redis_pipeline", lambda: pipeline)
+    window = {"start": "2024-01-01T10:00:00Z", "end": "2024-01-01T10:01:00Z"}
+
+    response = stream_aggregator.handler({"Records": synthetic_batch(), "window": window, "state": {}}, None)
+    assert response["state"]["counts"]["lab|click"] == 2
+    assert pipeline.executions == 0
+
+    final = stream_aggregator.handler({"Records": [], "window": window, "state": response["state"], "isFinalInvokeForWindow": True}, None)
+    assert final == {}
+    assert pipeline.executions == 1
+
+
+def test_handler_flushes_large_window_state_early(monkeypatch):
+    pipeline = StubPipeline()
+    monkeypatch.setattr(stream_aggregator, "redis_pipeline", lambda: pipeline)
+    monkeypatch.setenv("MAX_STATE_BYTES", "200")
+    window = {"start": "2024-01-01T10:00:00Z", "end": "2024-01-01T10:01:00Z"}
+    records = [
+        kinesis_record({"app_id": "lab", "event_type": "view", "session_id": f"s{index}", "create_ts": "2024-01-01 10:00:00.000000"})
+        for index in range(20)
+    ]
+
+    response = stream_aggregator.handler({"Records": records, "window": window, "state": {}}, None)
+
+    assert response == {"state": {}}
+    assert pipeline.executions == 1
+    assert ("events:lab:2024-01-01T10:00:00Z", "view", 20) in counters(pipeline.commands)
+    assert len([command for command in pipeline.commands if command[:2] == ("EVALSHA", stream_aggregator.SESSION_SCRIPT_SHA)]) == 20
+
+
+def test_resp_encoding_and_replies():
+    pipeline = stream_aggregator.RedisPipeline("localhost", 6379)
+    pipeline.execute_command("HINCRBY", "events:lab:total", "click", 2)
+
+    assert pipeline.encode() == b"*4\r\n$7\r\nHINCRBY\r\n$16\r\nevents:lab:total\r\n$5\r\nclick\r\n$1\r\n2\r\n"
+
+    reader = io.BytesIO(b":3\r\n+OK\r\n$5\r\nhello\r\n*2\r\n:1\r\n$-1\r\n-ERR wrong type\r\n")
+    assert stream_aggregator.read_reply(reader) == 3
+    assert stream_aggregator.read_reply(reader) == "OK"
+    assert stream_aggregator.read_reply(reader) == "hello"
+    assert stream_aggregator.read_reply(reader) == [1, None]
+    assert isinstance(stream_aggregator.read_reply(reader), stream_aggregator.RedisError)
@@ -0,0 +1,29 @@
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+
+from cdklab.app_stacks import build_stacks
+
+
+def test_stream_processing_stack(app_config, snapshot):
+    stacks = build_stacks(core.App(), app_config)
+    template = assertions.Template.from_stack(stacks["stream_processing"])
+
+    template.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "BatchSize": 500,
+        "ParallelizationFactor": 2,
+        "TumblingWindowInSeconds": 60,
+        "BisectBatchOnFunctionError": True,
+        "StartingPosition": "LATEST",
+    })
+    template.has_resource_properties("AWS::EC2::SecurityGroupIngress", {
+        "FromPort": 6379,
+        "ToPort": 6379,
+    })
+    assert {stacks["lab"], stacks["analytics"]} <= set(stacks["stream_processing"].dependencies)
+    snapshot("stream_processing_stack", template)
+
+
+def test_stream_processing_is_optional(app_config):
+    app_config["analytics"]["stream_processing"]["enabled"] = False
+
+    assert "stream_processing" not in build_stacks(core.App(), app_config)
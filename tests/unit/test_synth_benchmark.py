@@ -0,0 +1,103 @@
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import aws_cdk as core
+from yaml import load, SafeLoader
+
+from cdklab.app_stacks import build_stacks
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+FIXTURE_CONFIG = os.path.join(os.path.dirname(__file__), "fixtures", "config.yaml")
+
+# budgets for a full app synth, override in CI with the environment variables
+SYNTH_TIME_BUDGET_SECONDS = float(os.getenv("SYNTH_TIME_BUDGET_SECONDS", "60"))
+SYNTH_MEMORY_BUDGET_MB = float(os.getenv("SYNTH_MEMORY_BUDGET_MB", "1024"))
+
+
+def process_status(pid: str) -> dict:
+    with open(f"/proc/{pid}/status", 'r') as status_file:
+        return dict(line.split(":", 1) for line in status_file if ":" in line)
+
+
+def descendants_peak_rss_mb(root_pid: int) -> float:
+    """Summed peak resident memory of every process below root_pid.
+
+    jsii runs a node wrapper which starts the node kernel doing the actual synth work.
+    """
+    statuses = {}
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            statuses[int(pid)] = process_status(pid)
+        except OSError:
+            continue
+
+    children = {}
+    for pid, status in statuses.items():
+        children.setdefault(int(status.get("PPid", "0").strip()), []).append(pid)
+
+    peak_kb = 0
+    pending = list(children.get(root_pid, []))
+    while pending:
+        pid = pending.pop()
+        pending += children.get(pid, [])
+        if "VmHWM" in statuses[pid]:
+            peak_kb += int(statuses[pid]["VmHWM"].split()[0])
+    return peak_kb / 1024
+
+
+def synth_app(config: dict, outdir: str) -> float:
+    """Wall time of app.synth() alone, building the stacks is not timed."""
+    app = core.App(outdir=outdir)
+    build_stacks(app, config)
+    start = time.perf_counter()
+    app.synth()
+    return time.perf_counter() - start
+
+
+def measure_synth(config_path: str, outdir: str) -> dict:
+    with open(config_path, 'r') as config_file:
+        config = load(config_file, Loader=SafeLoader)
+
+    # the first synth pays for the jsii kernel start and module loading
+    synth_app(config, os.path.join(outdir, "warmup"))
+    wall_time = synth_app(config, os.path.join(outdir, "synth"))
+
+    # this process only ran the synth, so the lifetime peaks are the synth's
+    return {
+        "wall_time_seconds": wall_time,
+        "python_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "jsii_peak_rss_mb": descendants_peak_rss_mb(os.getpid()) if os.path.isdir("/proc") else 0.0,
+    }
+
+
+def test_synth_within_budget(tmp_path, record_property):
+    # a fresh process keeps the memory peaks of the other tests out of the measurement
+    result = subprocess.run(
+        [sys.executable, "-m", "tests.unit.test_synth_benchmark", FIXTURE_CONFIG, str(tmp_path)],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    measurement = json.loads(result.stdout.splitlines()[-1])
+    wall_time = measurement["wall_time_seconds"]
+    peak_mb = measurement["python_peak_rss_mb"] + measurement["jsii_peak_rss_mb"]
+
+    record_property("synth_wall_time_seconds", round(wall_time, 3))
+    record_property("synth_peak_python_rss_mb", round(measurement["python_peak_rss_mb"], 1))
+    record_property("synth_peak_jsii_rss_mb", round(measurement["jsii_peak_rss_mb"], 1))
+
+    assert wall_time < SYNTH_TIME_BUDGET_SECONDS, (
+        f"synth took {wall_time:.2f}s, budget is {SYNTH_TIME_BUDGET_SECONDS}s"
+    )
+    assert peak_mb < SYNTH_MEMORY_BUDGET_MB, (
+        f"synth peak memory was {peak_mb:.1f}MB, budget is {SYNTH_MEMORY_BUDGET_MB}MB"
+    )
+
+
+if __name__ == "__main__":
+    print(json.dumps(measure_synth(sys.argv[1], sys.argv[2])))